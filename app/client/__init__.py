@@ -0,0 +1,3 @@
+from .protocol import ReplyError, PushMessage, encode_command, parse_reply
+from .connection import ClientConnection
+from .pool import ConnectionPool, Redis
@@ -0,0 +1,75 @@
+"""
+Throughput benchmark, e.g. `python -m app.client.benchmark --port 6379 -c 50`.
+
+Each of the `--clients` coroutines runs its share of `--requests` commands one
+after the other. By default they all share one auto-pipelined connection, with
+`--no-pipeline` each one gets a connection of its own from the pool.
+"""
+
+import argparse
+import asyncio
+import time
+
+from .pool import Redis
+
+TESTS = {
+    "ping": lambda i, value: ("PING",),
+    "set": lambda i, value: ("SET", f"key:{i % 10000}", value),
+    "get": lambda i, value: ("GET", f"key:{i % 10000}"),
+    "sadd": lambda i, value: ("SADD", "set", i % 10000),
+}
+
+
+async def run_test(client: Redis, test: str, args) -> float:
+    make = TESTS[test]
+    value = b"x" * args.data_size
+    per_client = args.requests // args.clients
+
+    async def worker(start: int) -> None:
+        if args.no_pipeline:
+            async with client.connection() as conn:
+                for i in range(start, start + per_client):
+                    await conn.execute(*make(i, value))
+        else:
+            for i in range(start, start + per_client):
+                await client.execute(*make(i, value))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n * per_client) for n in range(args.clients)))
+    return per_client * args.clients / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Redis benchmark")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host")
+    parser.add_argument("--port", default=6379, type=int, help="Server port")
+    parser.add_argument(
+        "-c", "--clients", default=50, type=int, help="Concurrent clients"
+    )
+    parser.add_argument(
+        "-n", "--requests", default=100000, type=int, help="Requests per test"
+    )
+    parser.add_argument(
+        "-d", "--data-size", default=3, type=int, help="SET value size in bytes"
+    )
+    parser.add_argument(
+        "-t",
+        "--tests",
+        default="ping,set,get",
+        help=f"Comma separated tests among {', '.join(TESTS)}",
+    )
+    parser.add_argument(
+        "--no-pipeline",
+        action="store_true",
+        help="One connection per client instead of one shared pipelined connection",
+    )
+    args = parser.parse_args()
+
+    async with Redis(args.host, args.port, max_connections=args.clients) as client:
+        for test in args.tests.lower().split(","):
+            rate = await run_test(client, test, args)
+            print(f"{test.upper()}: {rate:.2f} requests per second")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
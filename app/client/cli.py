@@ -0,0 +1,72 @@
+"""
+Key analysis from the command line, e.g.:
+
+    python -m app.client.cli --port 6379 --hotkeys
+    python -m app.client.cli --port 6379 --bigkeys -n 2
+
+`--hotkeys` lists the most accessed keys since the last `HOTKEYS RESET`,
+`--bigkeys` the largest keys of every type of a database. Both are answered by
+the server, which scans in small batches while still serving other clients.
+"""
+
+import argparse
+import asyncio
+
+from .pool import Redis
+
+
+def as_dict(reply) -> dict:
+    """A map reply, which RESP2 sends as a flat list of keys and values."""
+    if isinstance(reply, dict):
+        return reply
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def text(value) -> str:
+    return value.decode(errors="backslashreplace") if isinstance(value, bytes) else value
+
+
+async def hotkeys(client: Redis, count: int) -> None:
+    rows = await client.execute("HOTKEYS", "COUNT", count)
+    if not rows:
+        print("No key accesses recorded yet")
+    for key, db, accesses, share in rows:
+        print(f"db{db} {text(key)!r}: {accesses} accesses ({text(share)}%)")
+
+
+async def bigkeys(client: Redis, db: int, count: int) -> None:
+    async with client.connection() as conn:
+        await conn.execute("SELECT", db)
+        types = as_dict(await conn.execute("BIGKEYS", "COUNT", count))
+    if not types:
+        print(f"db{db} is empty")
+    for name, stats in types.items():
+        stats = {text(field): value for field, value in as_dict(stats).items()}
+        print(
+            f"{text(name)}: {stats['keys']} keys, {stats['elements']} elements, "
+            f"~{stats['memory']} bytes"
+        )
+        for key, memory, elements in stats["biggest"]:
+            print(f"  {text(key)!r}: ~{memory} bytes, {elements} elements")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Redis key analysis")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host")
+    parser.add_argument("--port", default=6379, type=int, help="Server port")
+    parser.add_argument("-n", dest="db", default=0, type=int, help="Database number")
+    parser.add_argument("--count", default=10, type=int, help="Keys to list")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--hotkeys", action="store_true", help="Most accessed keys")
+    mode.add_argument("--bigkeys", action="store_true", help="Largest keys per type")
+    args = parser.parse_args()
+
+    async with Redis(args.host, args.port) as client:
+        if args.hotkeys:
+            await hotkeys(client, args.count)
+        else:
+            await bigkeys(client, args.db, args.count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""
+Cluster administration, e.g. with three nodes started with --cluster-enabled yes:
+
+    python -m app.client.cluster create 127.0.0.1:7000 127.0.0.1:7001 127.0.0.1:7002
+    python -m app.client.cluster reshard 127.0.0.1:7000 127.0.0.1:7001 --slots 0-99
+    python -m app.client.cluster check 127.0.0.1:7000
+
+`reshard` moves slots live: keys go over in batches of MIGRATE, and clients
+are redirected with ASK for keys already moved until the slot changes owner.
+"""
+
+import argparse
+import asyncio
+
+from .pool import Redis
+
+SLOTS = 16384
+MIGRATE_BATCH = 100  # keys moved by one MIGRATE
+MIGRATE_TIMEOUT = 10000  # milliseconds
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+async def node_id(client: Redis) -> str:
+    return (await client.execute("CLUSTER", "MYID")).decode()
+
+
+async def create(addresses: list[str]) -> None:
+    """Introduce the nodes to each other and split the slots evenly between them."""
+    clients = [Redis(*parse_address(address)) for address in addresses]
+    host, port = parse_address(addresses[0])
+    for n, client in enumerate(clients):
+        start = SLOTS * n // len(clients)
+        end = SLOTS * (n + 1) // len(clients) - 1
+        await client.execute("CLUSTER", "ADDSLOTSRANGE", start, end)
+        if n:
+            await client.execute("CLUSTER", "MEET", host, port)
+        print(f"{addresses[n]}: slots {start}-{end}")
+    for client in clients:
+        await client.close()
+
+
+async def reshard(source_address: str, target_address: str, slots: range) -> None:
+    source = Redis(*parse_address(source_address))
+    target = Redis(*parse_address(target_address))
+    target_host, target_port = parse_address(target_address)
+    source_id, target_id = await node_id(source), await node_id(target)
+    for slot in slots:
+        await target.execute("CLUSTER", "SETSLOT", slot, "IMPORTING", source_id)
+        await source.execute("CLUSTER", "SETSLOT", slot, "MIGRATING", target_id)
+        moved = 0
+        while keys := await source.execute(
+            "CLUSTER", "GETKEYSINSLOT", slot, MIGRATE_BATCH
+        ):
+            await source.execute(
+                "MIGRATE",
+                target_host,
+                target_port,
+                "",
+                0,
+                MIGRATE_TIMEOUT,
+                "REPLACE",
+                "KEYS",
+                *keys,
+            )
+            moved += len(keys)
+        # The target first, so that it never redirects back to the source
+        await target.execute("CLUSTER", "SETSLOT", slot, "NODE", target_id)
+        await source.execute("CLUSTER", "SETSLOT", slot, "NODE", target_id)
+        print(f"slot {slot}: {moved} keys moved")
+    await source.close()
+    await target.close()
+
+
+async def check(address: str) -> None:
+    async with Redis(*parse_address(address)) as client:
+        print((await client.execute("CLUSTER", "INFO")).decode())
+        print((await client.execute("CLUSTER", "NODES")).decode())
+
+
+def parse_slots(value: str) -> range:
+    start, _, end = value.partition("-")
+    return range(int(start), int(end or start) + 1)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Redis cluster administration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create", help="Build a cluster")
+    create_parser.add_argument("nodes", nargs="+", help="host:port of every node")
+    reshard_parser = commands.add_parser("reshard", help="Move slots between nodes")
+    reshard_parser.add_argument("source", help="host:port owning the slots")
+    reshard_parser.add_argument("target", help="host:port to move them to")
+    reshard_parser.add_argument(
+        "--slots", required=True, type=parse_slots, help="A slot or a start-end range"
+    )
+    check_parser = commands.add_parser("check", help="Show the cluster state")
+    check_parser.add_argument("node", help="host:port of any node")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        await create(args.nodes)
+    elif args.command == "reshard":
+        await reshard(args.source, args.target, args.slots)
+    else:
+        await check(args.node)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+import asyncio
+from collections import deque
+from typing import Callable
+
+from .protocol import PushMessage, ReplyError, encode_command, parse_reply
+
+READ_SIZE = 65536
+# Callers wait for the socket to drain once this much output is queued in it
+HIGH_WATER = 1024 * 1024
+
+
+class ClientConnection:
+    """
+    One socket to a server, shared by any number of coroutines.
+
+    Commands are not written as they are issued: they are appended to an output
+    buffer flushed when the loop gets to the next round of callbacks, so all
+    the commands issued by coroutines running in the same iteration go out in
+    one write (auto-pipelining). The server answers in order, so a FIFO of
+    futures is enough to hand each reply to the coroutine that asked for it.
+
+    Push messages (RESP3 `>`, e.g. tracking invalidations) and replies nobody
+    waits for go to `push_handler`. Blocking commands and subscriptions stall
+    every other caller of the socket, they need a connection of their own, see
+    `ConnectionPool.connection`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int | str = 6379,
+        push_handler: Callable | None = None,
+    ):
+        self.host = host
+        self.port = int(port)
+        self.push_handler = push_handler
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        # Futures of the commands sent, in the order their replies will come
+        self.pending: deque[asyncio.Future] = deque()
+        self.output = bytearray()
+        self.buffer = bytearray()  # bytes read that do not form a reply yet
+        self._flush_handle: asyncio.Handle | None = None
+        self._read_task: asyncio.Task | None = None
+        self._last: asyncio.Future | None = None  # set by `detach`
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self._read_task = asyncio.create_task(self.read_replies())
+
+    def send(self, *args) -> asyncio.Future:
+        """Queue a command and return the future of its reply, without waiting."""
+        if not self.connected or self._last is not None:
+            raise ConnectionError(f"Not connected to {self.host}:{self.port}")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.output += encode_command(args)
+        self.pending.append(future)
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self.flush)
+        return future
+
+    def flush(self) -> None:
+        self._flush_handle = None
+        if self.output and self.connected:
+            # A fresh buffer, the transport may keep a view of the one written
+            data, self.output = self.output, bytearray()
+            self.writer.write(data)
+
+    async def execute(self, *args):
+        """Send a command and return its reply, raising ReplyError for an error."""
+        future = self.send(*args)
+        if self.writer.transport.get_write_buffer_size() > HIGH_WATER:
+            await self.writer.drain()
+        reply = await future
+        if isinstance(reply, ReplyError):
+            raise reply
+        return reply
+
+    async def detach(self, *args) -> tuple[object, bytes]:
+        """
+        Send a last command and give the socket up to the caller.
+
+        For commands followed by data that is not RESP, like PSYNC and the RDB
+        after it: replies stop being read after this one, and the bytes already
+        read past it are returned with it. The caller reads `reader` from then on.
+        """
+        future = self.send(*args)
+        self._last = future
+        reply = await future
+        await self._read_task
+        leftover, self.buffer = bytes(self.buffer), bytearray()
+        if isinstance(reply, ReplyError):
+            raise reply
+        return reply, leftover
+
+    async def read_replies(self) -> None:
+        try:
+            while True:
+                data = await self.reader.read(READ_SIZE)
+                if not data:
+                    break
+                self.buffer += data
+                if not self.dispatch():
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.fail_pending(ConnectionError("Connection closed by the server"))
+            if self._last is None:
+                # Nothing reads replies anymore, later commands would wait forever
+                self.writer.close()
+
+    def dispatch(self) -> bool:
+        """Resolve the futures of the whole replies read, False once detached."""
+        buffer, pos = self.buffer, 0
+        try:
+            while (parsed := parse_reply(buffer, pos)) is not None:
+                reply, pos = parsed
+                if isinstance(reply, PushMessage) or not self.pending:
+                    if self.push_handler is not None:
+                        self.push_handler(reply)
+                    continue
+                future = self.pending.popleft()
+                # A caller cancelled while waiting still had its reply coming
+                if not future.done():
+                    future.set_result(reply)
+                if future is self._last:
+                    return False
+            return True
+        finally:
+            del buffer[:pos]
+
+    def fail_pending(self, error: Exception) -> None:
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        if self._read_task is not None:
+            self._read_task.cancel()
@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from .connection import ClientConnection
+
+
+class ConnectionPool:
+    """
+    At most `max_connections` connections to one server.
+
+    `acquire`/`release`, or `async with pool.connection()`, hand a connection
+    out exclusively, for whatever needs the socket to itself: MULTI/EXEC,
+    blocking commands, SUBSCRIBE. `shared` returns the one connection every
+    other command is pipelined on, it takes one of the slots for good.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int | str = 6379, max_connections=10
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.idle: list[ClientConnection] = []
+        self.in_use: set[ClientConnection] = set()
+        self.slots = asyncio.Semaphore(max_connections)
+        self._shared: ClientConnection | None = None
+        self._shared_lock = asyncio.Lock()
+
+    async def acquire(self) -> ClientConnection:
+        await self.slots.acquire()
+        try:
+            while self.idle:
+                conn = self.idle.pop()
+                if conn.connected:
+                    break
+            else:
+                conn = ClientConnection(self.host, self.port)
+                await conn.connect()
+        except BaseException:
+            self.slots.release()
+            raise
+        self.in_use.add(conn)
+        return conn
+
+    def release(self, conn: ClientConnection) -> None:
+        self.in_use.discard(conn)
+        # One with replies still due would hand them to the next user
+        if conn.connected and not conn.pending:
+            self.idle.append(conn)
+        else:
+            asyncio.create_task(conn.close())
+        self.slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    async def shared(self) -> ClientConnection:
+        conn = self._shared
+        if conn is not None and conn.connected:
+            return conn
+        async with self._shared_lock:
+            if self._shared is None or not self._shared.connected:
+                if self._shared is not None:
+                    self.release(self._shared)
+                self._shared = await self.acquire()
+            return self._shared
+
+    async def close(self) -> None:
+        conns = [*self.idle, *self.in_use]
+        self.idle, self.in_use, self._shared = [], set(), None
+        for conn in conns:
+            await conn.close()
+
+
+class Redis:
+    """
+    Client for the server, or any RESP server.
+
+    Commands issued concurrently are auto-pipelined on the pool's shared
+    connection: `await asyncio.gather(*(client.execute("GET", key) for key in
+    keys))` costs one write and as many reads as the replies need.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int | str = 6379,
+        max_connections: int = 10,
+        pool: ConnectionPool | None = None,
+    ):
+        self.pool = pool or ConnectionPool(host, port, max_connections)
+
+    async def execute(self, *args):
+        conn = await self.pool.shared()
+        return await conn.execute(*args)
+
+    def connection(self):
+        """An exclusive connection, `async with client.connection() as conn:`."""
+        return self.pool.connection()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def __aenter__(self) -> "Redis":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
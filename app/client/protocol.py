@@ -0,0 +1,92 @@
+class ReplyError(Exception):
+    """An error reply (`-ERR ...`) from the server, raised to the caller."""
+
+
+class PushMessage(list):
+    """A RESP3 push (`>`), out-of-band data not answering any command."""
+
+
+def encode_command(args: tuple | list) -> bytes:
+    """A command as a RESP array of bulk strings, the only form servers accept."""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif not isinstance(arg, (bytes, bytearray, memoryview)):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+def parse_reply(buffer: bytes | bytearray, pos: int = 0) -> tuple[object, int] | None:
+    """
+    Parse one RESP2/RESP3 reply from `buffer` at `pos`.
+
+    Returns the reply and the position right after it, or None if the buffer
+    does not hold the whole reply yet. Bulk strings are bytes, simple strings
+    str, error replies ReplyError instances, returned rather than raised so
+    that a pipelined reader keeps its place in the stream.
+    """
+    end = buffer.find(b"\r\n", pos)
+    if end == -1:
+        return None
+    kind = buffer[pos]
+    line = bytes(buffer[pos + 1 : end])
+    pos = end + 2
+
+    if kind in (43, 45):  # "+" "-"
+        text = line.decode("utf-8", "replace")
+        return (text if kind == 43 else ReplyError(text)), pos
+    if kind in (58, 40):  # ":" "(" integer, big number
+        return int(line), pos
+    if kind in (36, 33, 61):  # "$" "!" "=" bulk string, bulk error, verbatim
+        length = int(line)
+        if length == -1:
+            return None, pos
+        stop = pos + length
+        if stop + 2 > len(buffer):
+            return None
+        data = bytes(buffer[pos:stop])
+        if kind == 33:
+            return ReplyError(data.decode("utf-8", "replace")), stop + 2
+        if kind == 61:
+            data = data[4:]  # "txt:" or "mkd:"
+        return data, stop + 2
+    if kind in (42, 126, 62):  # "*" "~" ">" array, set, push
+        count = int(line)
+        if count == -1:
+            return None, pos
+        items = PushMessage() if kind == 62 else []
+        for _ in range(count):
+            parsed = parse_reply(buffer, pos)
+            if parsed is None:
+                return None
+            item, pos = parsed
+            items.append(item)
+        return items, pos
+    if kind in (37, 124):  # "%" "|" map, attributes
+        result = {}
+        for _ in range(int(line)):
+            key = parse_reply(buffer, pos)
+            if key is None:
+                return None
+            value = parse_reply(buffer, key[1])
+            if value is None:
+                return None
+            result[_hashable(key[0])] = value[0]
+            pos = value[1]
+        if kind == 124:
+            # Attributes only annotate the reply that follows them
+            return parse_reply(buffer, pos)
+        return result, pos
+    if kind == 95:  # "_"
+        return None, pos
+    if kind == 35:  # "#"
+        return line == b"t", pos
+    if kind == 44:  # ","
+        return float(line), pos
+    raise ValueError(f"Protocol error: unknown reply type {chr(kind)!r}")
+
+
+def _hashable(key):
+    return tuple(key) if isinstance(key, list) else key
@@ -1,5 +1,5 @@
 import asyncio
-from .utilities import ServerConfiguration
+from .utilities import ServerConfiguration, setup_logging, stop_logging
 import argparse
 from .server import Server
 
@@ -27,11 +27,69 @@ async def main():
         nargs=2,
         help="Replica server",
     )
+    parser.add_argument(
+        "--maxclients",
+        default=10000,
+        type=int,
+        help="Maximum number of connected clients",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=0,
+        type=int,
+        help="Close clients idle for this many seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--tcp-keepalive",
+        default=300,
+        type=int,
+        help="TCP keepalive interval in seconds (0 disables)",
+    )
+    parser.add_argument(
+        "--repl-diskless-sync-delay",
+        default=0,
+        type=int,
+        help="Seconds to wait for more replicas before starting a full sync",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        default=0,
+        type=int,
+        help="Serve Prometheus metrics over HTTP on this port (0 disables)",
+    )
+    parser.add_argument(
+        "--cluster-enabled",
+        default="no",
+        choices=["yes", "no"],
+        help="Run as a cluster node, keys are sharded over 16384 hash slots",
+    )
+    parser.add_argument(
+        "--loglevel",
+        default="notice",
+        choices=["debug", "verbose", "notice", "warning"],
+        help="Log verbosity, debug traces every request",
+    )
+    parser.add_argument(
+        "--logfile",
+        default="main.log",
+        help="File to log to, an empty name logs to stderr",
+    )
     args = parser.parse_args()  # parse commandline arguments
 
     config = ServerConfiguration(
-        dir=args.dir, dbfilename=args.dbfilename, port=args.port
+        dir=args.dir,
+        dbfilename=args.dbfilename,
+        port=args.port,
+        maxclients=args.maxclients,
+        timeout=args.timeout,
+        tcp_keepalive=args.tcp_keepalive,
+        repl_diskless_sync_delay=args.repl_diskless_sync_delay,
+        metrics_port=args.metrics_port,
+        cluster_enabled=args.cluster_enabled == "yes",
+        loglevel=args.loglevel,
+        logfile=args.logfile,
     )
+    setup_logging(config.loglevel, config.logfile)
     if args.replicaof:
         config.replication.role = "slave"
         host = args.replicaof[0]
@@ -42,7 +100,10 @@ async def main():
 
     # Start the server
     server = Server(config)
-    await server.start_server()
+    try:
+        await server.start_server()
+    finally:
+        stop_logging()
 
 
 if __name__ == "__main__":
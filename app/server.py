@@ -1,26 +1,35 @@
 import asyncio
 import logging
 import os
-import traceback
+import socket
+import time
+from .client import ClientConnection
 from .utilities import (
     CommandHandler,
+    command_name,
+    Connection,
+    format_addr,
     DatabaseParser,
+    MetricsServer,
+    NO_REPLY,
+    parse_command,
+    parse_rdb,
+    ProtocolError,
+    RDB_OFFLOAD_BYTES,
     RedisProtocolParser,
     Store,
     ServerConfiguration,
+    NOTICE,
+    VERBOSE,
 )
 
-logging.basicConfig(
-    filename="main.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+REPL_RETRY_DELAY = 1  # seconds before reconnecting to a lost master
 
 
 class Server:
     def __init__(self, config):
         self.config: ServerConfiguration = config
-        self.store: Store = Store()
+        self.databases: list[Store] = [Store(config) for _ in range(config.databases)]
         self.db: DatabaseParser = DatabaseParser()
         self.parser: RedisProtocolParser = RedisProtocolParser()
         self.cmd: CommandHandler
@@ -28,28 +37,39 @@ class Server:
         self.server_writer: asyncio.StreamWriter = None
         self.server_reader: asyncio.StreamReader = None
         self.replica_offset: asyncio.Condition = asyncio.Condition()
+        self.cron_task: asyncio.Task = None
+        self.replication_task: asyncio.Task = None
+        self.metrics: MetricsServer | None = None
+        # Replication stream bytes received together with the RDB
+        self.master_buffer: bytearray = bytearray()
 
     async def start_server(self):
+        # Clients are accepted right away, so commands must be ready before
+        self.cmd = CommandHandler(self.databases, self.db, self.config)
         server = await asyncio.start_server(
             self.handle_client, self.config.host, self.config.port
         )
         server.sockets[0].setblocking(False)
-        logging.info(f"Serving on: {server.sockets[0].getsockname()}")
+        logging.log(NOTICE, "Serving on: %s", server.sockets[0].getsockname())
+        if self.config.metrics_port:
+            self.metrics = MetricsServer(self.cmd, self.config)
+            await self.metrics.start()
 
         # set path to the .rdb file in the config
         path = os.path.join(self.config.dir, self.config.dbfilename)
         self.config.db_path = path
-        self.db.update_store(self.store, path=path)
-
-        self.cmd = CommandHandler(self.store, self.db, self.config)
+        # Clients get -LOADING for data commands until this returns
+        await self.cmd.loading.load(path)
+        self.cron_task = asyncio.create_task(self.clients_cron())
+        if self.cmd.cluster is not None:
+            self.cmd.cluster.start()
 
         if self.config.replication.role == "slave":
-            await self.handle_replication()
-            await self.listen_master()
+            self.replication_task = asyncio.create_task(self.replicate())
 
         # Serve clients indefinitely
         async with server:
-            print("Start serving forever")
+            logging.log(NOTICE, "Ready to accept connections")
             await server.serve_forever()
 
     # Define coroutine to handle client connections
@@ -58,60 +78,114 @@ class Server:
     ):
 
         checkclient = writer.get_extra_info("peername")
-        logging.info(f"Peer : {checkclient}")
-        pong = b"+PONG\r\n"
+        logging.info("Accepted %s", checkclient)
+        self.cmd.stats.connections_received += 1
+        if len(self.cmd.clients) >= self.config.maxclients:
+            self.cmd.stats.rejected_connections += 1
+            writer.write(b"-ERR max number of clients reached\r\n")
+            writer.close()
+            return
+        self.set_keepalive(writer)
+        conn = Connection(
+            reader=reader,
+            writer=writer,
+            output_limits=self.config.client_output_buffer_limit,
+            addr=format_addr(checkclient),
+            laddr=format_addr(writer.get_extra_info("sockname")),
+        )
+        self.cmd.clients[conn.id] = conn
         while True:
             try:
                 self.server_reader, self.server_writer = reader, writer
                 # Read data from the client
                 # data = await reader.read(1024)
                 data = await self.read_data(reader)
-                logging.debug(f"Recived data: {data}")
-                print(f"Recived data: {data} From {checkclient}")
 
                 if not data:
                     break
+                conn.last_interaction = time.monotonic()
+                conn.net_in += len(data)
 
-                decoded_data = self.parser.decoder(data)
-                logging.debug(f"bytes data is {decoded_data}")
-                if decoded_data:
-                    response = await self.handle_command(decoded_data, reader, writer)
-                    print(f"Response: {response}")
-                    client = writer.get_extra_info("peername")
-                    client = (client[0], str(client[1]))
+                # Every complete command in the buffer, arguments stay bytes
+                buffer = conn.query_buffer
+                buffer += data
+                commands, pos, error = [], 0, None
+                try:
+                    while parsed := parse_command(buffer, pos, conn.partial):
+                        command, pos = parsed
+                        if command:
+                            commands.append(command)
+                except ProtocolError as exc:
+                    # The commands before it still run, like in Redis
+                    error = exc
+                del buffer[:pos]
+                if commands:
+                    response = await self.handle_command(
+                        commands, reader, writer, conn
+                    )
                     if isinstance(response, tuple):
                         for item in response:
-                            await self.write_to_client(item, writer)
-                    else:
-                        await self.write_to_client(response, writer)
+                            await self.write_to_client(item, writer, conn)
+                    elif response:
+                        await self.write_to_client(response, writer, conn)
+                if error is not None:
+                    logging.log(VERBOSE, "Client id=%s: %s", conn.id, error)
+                    reply = f"-ERR {error}\r\n".encode()
+                    await self.write_to_client(reply, writer, conn)
+                    break
+                if conn.close_after_reply:
+                    break
+                if len(buffer) > self.config.client_query_buffer_limit:
+                    logging.warning(
+                        "Closing client id=%s that reached max query buffer length "
+                        "(%d bytes)",
+                        conn.id,
+                        len(buffer),
+                    )
+                    break
             # Close the connection
-            except Exception as e:
-                print("Error in handle_client")
-                print(e)
-                logging.error(traceback.print_tb(e.__traceback__))
+            except Exception:
+                logging.exception("Error in handle_client")
                 break
+        if conn.is_replica:
+            self.cmd.forget_replica(conn)
+        self.cmd.unwatch_all(conn)
+        self.cmd.pubsub.unsubscribe_all(conn)
+        self.cmd.tracking.disable(conn)
+        self.cmd.clients.pop(conn.id, None)
+        self.cmd.stats.net_input_bytes += conn.net_in
+        self.cmd.stats.net_output_bytes += conn.net_out
         writer.close()
 
     async def read_data(self, reader: asyncio.StreamReader) -> None:
-        data = await reader.read(1024)
+        data = await reader.read(65536)
         return data
 
-    async def handle_command(self, data, reader, writer) -> list | tuple:
-        logging.debug(f"data is {data}")
-        print(f"data is {data}")
+    async def handle_command(self, data, reader, writer, conn=None) -> list | tuple:
+        logging.debug("Client id=%s sent %r", conn and conn.id, data)
         if data:
             try:
                 if isinstance(data[0], list) and len(data) > 1:
                     res = []
                     for cmd in data:
+                        # Killed by one of the commands, the rest are dropped
+                        if conn is not None and conn.close_after_reply:
+                            break
                         response = await self.cmd.call_cmd(
                             cmd,
                             reader=reader,
                             writer=writer,
+                            conn=conn,
                         )
-                        byte_data = self.parser.encoder(response)
-                        res.append(byte_data)
-                    print("RES: ", res)
+                        if response is NO_REPLY:
+                            continue
+                        # Tuples hold frames encoded by the command, pub/sub
+                        # replies, bytes are values like any other
+                        if isinstance(response, tuple):
+                            res.extend(response)
+                            continue
+                        res.append(await self.encode(response, conn))
+                    logging.debug("Replies to client id=%s: %r", conn and conn.id, res)
                     return tuple(res)
                 else:
                     if isinstance(data[0], list):
@@ -119,142 +193,275 @@ class Server:
 
                     response = await self.cmd.call_cmd(
                         data,
-                        reader=self.server_reader,
-                        writer=self.server_writer,
+                        reader=reader,
+                        writer=writer,
+                        conn=conn,
                     )
-                    if isinstance(response, tuple) or isinstance(response, bytes):
+                    if response is NO_REPLY:
+                        return None
+                    if isinstance(response, tuple):
                         return response
-                    encoded_data = self.parser.encoder(response)
+                    encoded_data = await self.encode(response, conn)
+                    logging.debug(
+                        "Reply to client id=%s: %r", conn and conn.id, encoded_data
+                    )
                     return encoded_data
-            except Exception as e:
-                print("Error in handle_command")
-                print(e)
-                print(traceback.print_tb(e.__traceback__))
-                logging.error(traceback.print_tb(e.__traceback__))
+            except Exception:
+                logging.exception("Error in handle_command")
         return None
 
-    async def write_to_client(self, data, writer: asyncio.StreamWriter) -> None:
+    async def encode(self, response, conn: Connection | None) -> bytes:
+        protocol = self.protocol(conn)
+        if isinstance(response, list) and self.cmd.offload.is_heavy(len(response)):
+            # Replies are fresh lists nobody mutates, and the encoder keeps state
+            # on its instance, so the pool gets a parser of its own
+            encoder = RedisProtocolParser().encoder
+            return await self.cmd.offload.run(encoder, response, protocol)
+        return self.parser.encoder(response, protocol)
 
-        print(f"Writing Data: {data}")
+    @staticmethod
+    def protocol(conn: Connection | None) -> int:
+        # Read after the command ran, so the reply to HELLO already uses the new version
+        return conn.protocol if conn is not None else 2
+
+    async def write_to_client(
+        self, data, writer: asyncio.StreamWriter, conn: Connection = None
+    ) -> None:
         try:
-            if self.config.replication.role == "slave":
-                master = (
-                    self.config.replication.master_host,
-                    int(self.config.replication.master_port),
-                )
-                client = writer.get_extra_info("peername")
-                if client[0] == master[0] and client[1] == master[1]:
-                    await self.should_respond(data, writer)
-                    print(f"Offset : {self.config.replication.master_repl_offset}")
+            if conn is not None:
+                if not conn.send(data):
                     return
-            if b"None" in data:
-                print("Not Responding...")
-                # return
-                data = b"+OK\r\n"
-                await asyncio.sleep(1)
-            writer.write(data)
+            else:
+                writer.write(data)
             await writer.drain()
-            # r = await self.read_data()
-            # print(f"Reading After Write: {r}")
             return
-        except Exception as e:
-            print("Error in write_to_client")
-            print(e)
-            print(traceback.print_tb(e.__traceback__))
-            logging.error(traceback.print_tb(e.__traceback__))
+        except Exception:
+            logging.exception("Error in write_to_client")
+
+    def set_keepalive(self, writer: asyncio.StreamWriter) -> None:
+        """Enable TCP keepalive probes so dead peers are eventually detected."""
+        interval = self.config.tcp_keepalive
+        sock = writer.get_extra_info("socket")
+        if not interval or sock is None:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+                sock.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(interval // 3, 1)
+                )
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        except OSError as e:
+            logging.error("Could not set TCP keepalive: %s", e)
+
+    async def clients_cron(self) -> None:
+        """
+        Once a second, close clients idle for longer than `timeout` and clients
+        stuck over their soft output buffer limit. Replicas and subscribers are
+        never closed for being idle. Also samples the ops/sec rate.
+        """
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            self.cmd.stats.track_ops(now)
+            timeout = self.config.timeout
+            for conn in list(self.cmd.clients.values()):
+                if conn.writer.is_closing():
+                    continue
+                if conn.output_buffer_size() and conn.output_buffer_exceeded():
+                    logging.warning(
+                        "Client id=%d closed for output buffer limits", conn.id
+                    )
+                    conn.writer.transport.abort()
+                elif (
+                    timeout
+                    and conn.client_class == "normal"
+                    and now - conn.last_interaction > timeout
+                ):
+                    logging.info("Closing idle client id=%d", conn.id)
+                    conn.writer.close()
+
+    async def replicate(self) -> None:
+        """
+        Sync with the master and apply its stream. Whenever the link is lost or
+        the handshake fails, it is tried again `REPL_RETRY_DELAY` seconds later
+        with a new full sync, like a Redis replica reconnecting to its master.
+        """
+        while True:
+            if await self.handle_replication():
+                heartbeat = asyncio.create_task(self.replica_heartbeat())
+                await self.listen_master()
+                heartbeat.cancel()
+            logging.log(NOTICE, "Reconnecting to the master in %ss", REPL_RETRY_DELAY)
+            await asyncio.sleep(REPL_RETRY_DELAY)
 
     async def listen_master(self) -> None:
-        print("Listening Master")
+        """
+        Apply the master's command stream.
 
+        Commands are parsed straight from the received bytes, every command in a
+        read is applied before the next read, and the offset grows by exactly
+        the number of bytes each command took. Only REPLCONF GETACK is answered,
+        once per batch.
+        """
+        logging.log(NOTICE, "Applying the replication stream from the master")
+        reader, writer = self.reader, self.writer
+        conn = Connection(
+            reader=reader,
+            writer=writer,
+            is_master=True,
+            output_limits=self.config.client_output_buffer_limit,
+            addr=format_addr(writer.get_extra_info("peername")),
+            laddr=format_addr(writer.get_extra_info("sockname")),
+        )
+        # Listed by CLIENT LIST and killed by CLIENT KILL TYPE master like in
+        # Redis, the link is then made again by `replicate`
+        self.cmd.clients[conn.id] = conn
+        replication = self.config.replication
+        buffer, self.master_buffer = self.master_buffer, bytearray()
         try:
-            await self.handle_client(self.reader, self.writer)
+            data = b""
+            while True:
+                buffer += data
+                conn.net_in += len(data)
+                conn.last_interaction = time.monotonic()
+                pos = 0
+                replies = []
+                while True:
+                    parsed = parse_command(buffer, pos, conn.partial)
+                    if parsed is None:
+                        break
+                    command, next_pos = parsed
+                    if command:
+                        response = await self.cmd.call_cmd(
+                            command, reader=reader, writer=writer, conn=conn
+                        )
+                        if (
+                            command_name(command[0]) == "REPLCONF"
+                            and command_name(command[1]) == "GETACK"
+                        ):
+                            replies.append(self.parser.encoder(response))
+                    replication.master_repl_offset += next_pos - pos
+                    pos = next_pos
+                del buffer[:pos]
+                if replies:
+                    writer.write(b"".join(replies))
+                data = await reader.read(65536)
+                if not data:
+                    logging.warning("Connection with the master lost")
+                    break
         except ConnectionResetError:
-            print("Connection err")
-            return
+            logging.warning("Connection with the master lost")
         except asyncio.CancelledError:
             self.writer.close()
             await self.writer.wait_closed()
-        except Exception as e:
-            print(e)
-            print(traceback.print_tb(e.__traceback__))
+            raise
+        except Exception:
+            logging.exception("Error applying the replication stream")
+        finally:
+            self.cmd.clients.pop(conn.id, None)
+        writer.close()
+
+    async def read_rdb(self) -> bytes:
+        """
+        Read the RDB sent after +FULLRESYNC.
+
+        It comes either as `$<length>\r\n` and that many bytes, or, from a
+        diskless master, as `$EOF:<40 byte mark>\r\n` and the file followed by
+        the mark. Reading starts from `master_buffer`, the bytes that came with
+        the PSYNC reply, and bytes read past the RDB belong to the command
+        stream and are left there for `listen_master`.
+        """
+        buffer, self.master_buffer = self.master_buffer, bytearray()
+        while (end := buffer.find(b"\r\n")) == -1:
+            buffer += await self.read_master()
+        header = bytes(buffer[:end])
+        del buffer[: end + 2]
+        if not header.startswith(b"$EOF:"):
+            length = int(header[1:])
+            while len(buffer) < length:
+                buffer += await self.read_master()
+            self.master_buffer = buffer[length:]
+            return bytes(buffer[:length])
 
-    async def handle_replication(self) -> None:
+        mark = header[5:]
+        start = 0
+        while (end := buffer.find(mark, start)) == -1:
+            # The mark may straddle two reads, so search from before this one
+            start = max(len(buffer) - len(mark), 0)
+            buffer += await self.read_master()
+        self.master_buffer = buffer[end + len(mark) :]
+        return bytes(buffer[:end])
+
+    async def read_master(self) -> bytes:
+        data = await self.reader.read(65536)
+        if not data:
+            raise ConnectionError("Master closed the connection during sync")
+        return data
+
+    async def load_rdb(self, rdb: bytes) -> None:
+        """Replace the dataset with the RDB sent by the master in a full resync."""
+        if len(rdb) >= RDB_OFFLOAD_BYTES:
+            parsed = await self.cmd.offload.run_process(parse_rdb, None, rdb)
+        else:
+            parsed = self.db.database_parser(rdb_data=rdb) or {}
+        for store in self.databases:
+            self.cmd.lazyfree.free_keyspace(*store.flush())
+        self.db.load(self.databases, parsed)
+
+    async def replica_heartbeat(self) -> None:
+        """Report the processed offset to the master every second, like Redis replicas."""
+        while True:
+            await asyncio.sleep(1)
+            if self.writer is None or self.writer.is_closing():
+                return
+            offset = self.config.replication.master_repl_offset
+            self.writer.write(self.parser.encoder(["REPLCONF", "ACK", str(offset)]))
+
+    async def handle_replication(self) -> bool:
+        """The handshake and full sync with the master, False if it failed."""
         master_host = self.config.replication.master_host
         master_port = self.config.replication.master_port
         current_port = self.config.port
 
-        logging.info(f"Handshake with master: {master_host}:{master_port}")
+        logging.log(NOTICE, "Connecting to MASTER %s:%s", master_host, master_port)
+        master = ClientConnection(master_host, master_port)
         try:
-            print(f"Connecting to {master_host}:{master_port}")
-            self.reader, self.writer = await asyncio.open_connection(
-                master_host, int(master_port)
-            )
+            await master.connect()
 
             # STEP - 1
-            cmd = ["PING"]
-            self.writer.write(self.parser.encoder(cmd))
-            await self.writer.drain()
-            response = await self.reader.read(1024)
-            logging.info(f"Handshake STEP - 1 Response : {response.decode('utf-8')}")
-            print(f"Handshake STEP - 1 Response : {response.decode('utf-8')}")
+            response = await master.execute("PING")
+            logging.info("Handshake STEP - 1 Response : %s", response)
 
             # STEP - 2
-            cmd = ["REPLCONF", "listening-port", str(current_port)]
-            self.writer.write(self.parser.encoder(cmd))
-            await self.writer.drain()
-            response = await self.reader.read(1024)
-            logging.info(f"Handshake STEP - 2 Response : {response.decode('utf-8')}")
-
-            cmd = ["REPLCONF", "capa", "psync2"]
-            self.writer.write(self.parser.encoder(cmd))
-            await self.writer.drain()
-            response = await self.reader.read(1024)
-            logging.info(f"Handshake STEP - 2.5 Response : {response.decode('utf-8')}")
-
-            # STEP - 3
-            cmd = ["PSYNC", "?", "-1"]
-            self.writer.write(self.parser.encoder(cmd))
-            await self.writer.drain()
-            response = await self.reader.read(1024)
-            logging.info(f"Handshake STEP - 3 Response : {response}")
-            print(f"Handshake STEP - 3 Response : {response}")
-
-            resp_data = response[:]
-            master_info = resp_data.split(b"\r\n", 1).pop(0)
-            master_info = self.parser.decoder(master_info + b"\r\n")
-            print("RESPONSE: ", master_info)
-            index = resp_data.find(b"*")
-            ack_cmd = self.parser.decoder(resp_data[index:])
-            print("ACK CMD: ", ack_cmd)
-            if ack_cmd:
-                result = await self.handle_command(ack_cmd, self.reader, self.writer)
-                print("ACK RESULT : ", result)
-                self.writer.write(result)
-                await self.writer.drain()
-        except Exception as e:
-            print(f"Handshake failed Error: {e}")
-            print(f"Handshake failed: {traceback.print_tb(e.__traceback__)}")
-            logging.error(f"Handshake failed: {traceback.print_tb(e.__traceback__)}")
-        finally:
-            logging.info("Handshake Completed...")
+            response = await master.execute("REPLCONF", "listening-port", current_port)
+            logging.info("Handshake STEP - 2 Response : %s", response)
 
-    async def should_respond(self, data, writer: asyncio.StreamWriter) -> None:
-        try:
-            if isinstance(data, tuple):
-                for cmd in data:
-                    if isinstance(cmd, str):
-                        cmd = self.parser.encoder(cmd)
-                    if b"ACK" in cmd:
-                        self.writer.write(cmd)
-                        await self.writer.drain()
-            else:
-                if isinstance(data, str):
-                    data = self.parser.encoder(data)
-                if b"ACK" in data:
-                    self.writer.write(data)
-                    await self.writer.drain()
-        except Exception as e:
-            print("Error in should_respond")
-            print(e)
-            print(traceback.print_tb(e.__traceback__))
-            logging.error(traceback.print_tb(e.__traceback__))
+            response = await master.execute("REPLCONF", "capa", "psync2")
+            logging.info("Handshake STEP - 2.5 Response : %s", response)
+
+            # STEP - 3, the RDB that follows is not RESP, so the socket is taken
+            # over from the client with the bytes read past the reply
+            response, leftover = await master.detach("PSYNC", "?", "-1")
+            logging.info("Handshake STEP - 3 Response : %s", response)
+            _, replid, offset = response.split()
+            self.reader, self.writer = master.reader, master.writer
+            self.master_buffer = bytearray(leftover)
+
+            # STEP - 4, the RDB file, no trailing CRLF
+            rdb = await self.read_rdb()
+            await self.load_rdb(rdb)
+            self.config.replication.master_replid = replid
+            self.config.replication.master_repl_offset = int(offset)
+        except OSError as e:
+            # Retried every REPL_RETRY_DELAY while the master is down
+            logging.warning("Could not sync with the master: %s", e)
+            await master.close()
+            return False
+        except Exception:
+            logging.exception("Handshake failed")
+            await master.close()
+            return False
+        logging.log(NOTICE, "Handshake Completed...")
+        return True
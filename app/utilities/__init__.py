@@ -1,5 +1,26 @@
-from .parser_protocol import RedisProtocolParser
+from .parser_protocol import (
+    RedisProtocolParser,
+    SimpleString,
+    RespMap,
+    RespSet,
+    RespPush,
+    parse_command,
+    command_name,
+    PartialCommand,
+    ProtocolError,
+)
 from .store import Store
+from .logger import NOTICE, VERBOSE, setup_logging, stop_logging
 from .config import ServerConfiguration, Replica
-from .rdb_parser import DatabaseParser
-from .cmd import CommandHandler
+from .connection import Connection, format_addr
+from .pubsub import PubSub
+from .tracking import TrackingTable
+from .rdb_parser import DatabaseParser, parse_rdb, load_dump, RDB_OFFLOAD_BYTES
+from .loading import DatasetLoader
+from .offload import Offloader
+from .profiler import Profiler, MemoryProfiler
+from .metrics import MetricsServer, ServerStats
+from .cluster import Cluster, key_slot
+from .diskless_sync import DisklessSync
+from .lazyfree import LazyFree
+from .cmd import CommandHandler, NO_REPLY
@@ -0,0 +1,232 @@
+"""
+Bit operations on string values.
+
+Bits are numbered from the most significant bit of the first byte, like Redis.
+Anything that covers a range of the value works on whole buffers at C speed:
+counting goes through `int.bit_count` over big chunks, BITOP turns each value
+into one big integer, and searches use a compiled regex over the buffer.
+"""
+
+import re
+
+MAX_BIT_OFFSET = 2**32 - 1  # values are capped at 512 MB
+# Bytes counted at a time by BITCOUNT, bounds the temporary big integer
+COUNT_CHUNK = 1024 * 1024
+# Bytes BITPOS compares at a time to skip runs of zeros or ones
+SCAN_CHUNK = 64 * 1024
+
+_INVERT = bytes(255 - byte for byte in range(256))
+_SKIP = {0: (bytes(SCAN_CHUNK), re.compile(rb"[^\x00]"))}
+_SKIP[1] = (_SKIP[0][0].translate(_INVERT), re.compile(rb"[^\xff]"))
+
+
+def parse_offset(value: bytes) -> int | None:
+    """A bit offset argument, None if it is not a valid one."""
+    try:
+        offset = int(value)
+    except ValueError:
+        return None
+    return offset if 0 <= offset <= MAX_BIT_OFFSET else None
+
+
+def setbit(value: bytearray, offset: int, bit: int) -> int:
+    """Set the bit at `offset`, growing `value` with zeros, return the old bit."""
+    byte, shift = offset >> 3, 7 - (offset & 7)
+    if byte >= len(value):
+        value.extend(bytes(byte + 1 - len(value)))
+    old = value[byte] >> shift & 1
+    if bit:
+        value[byte] |= 1 << shift
+    else:
+        value[byte] &= ~(1 << shift) & 0xFF
+    return old
+
+
+def getbit(value: bytes | bytearray, offset: int) -> int:
+    byte = offset >> 3
+    if byte >= len(value):
+        return 0
+    return value[byte] >> (7 - (offset & 7)) & 1
+
+
+def resolve_range(start: int, end: int, length: int) -> tuple[int, int] | None:
+    """Inclusive `start`/`end` with negative ones counted from the end."""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    end = min(end, length - 1)
+    if start > end:
+        return None
+    return start, end
+
+
+def count_bytes(value: bytes | bytearray, start: int, end: int) -> int:
+    """Set bits in the bytes `start` to `end`, both included."""
+    view, total = memoryview(value), 0
+    for chunk in range(start, end + 1, COUNT_CHUNK):
+        stop = min(chunk + COUNT_CHUNK, end + 1)
+        total += int.from_bytes(view[chunk:stop], "big").bit_count()
+    return total
+
+
+def bitcount(
+    value: bytes | bytearray, start: int = 0, end: int = -1, bit_unit: bool = False
+) -> int:
+    """BITCOUNT over a range of bytes, or of bits with `bit_unit`."""
+    length = len(value) * 8 if bit_unit else len(value)
+    bounds = resolve_range(start, end, length)
+    if bounds is None:
+        return 0
+    start, end = bounds
+    if not bit_unit:
+        return count_bytes(value, start, end)
+    first, last = start >> 3, end >> 3
+    total = count_bytes(value, first, last)
+    # Bits of the edge bytes outside the range
+    total -= (value[first] >> (8 - (start & 7))).bit_count()
+    total -= (value[last] & (0xFF >> ((end & 7) + 1))).bit_count()
+    return total
+
+
+def bitpos(
+    value: bytes | bytearray,
+    bit: int,
+    start: int = 0,
+    end: int | None = None,
+    bit_unit: bool = False,
+) -> int:
+    """
+    Position of the first bit set to `bit` in the range, -1 if there is none.
+
+    Looking for a 0 without an explicit `end` finds the first bit past the
+    value, since a string is seen as padded with zeros, as in Redis.
+    """
+    length = len(value) * 8 if bit_unit else len(value)
+    if not value:
+        return -1 if bit else 0
+    end_given = end is not None
+    bounds = resolve_range(start, end if end_given else length - 1, length)
+    if bounds is None:
+        return -1
+    start, end = bounds
+    if not bit_unit:
+        start, end = start * 8, end * 8 + 7
+    first, last = start >> 3, end >> 3
+    pos = first
+    while pos <= last:
+        pos = find_other(value, 1 - bit, pos, last + 1)
+        if pos < 0:
+            break
+        byte = value[pos] if bit else _INVERT[value[pos]]
+        # Bits of the edge bytes outside the range don't count
+        if pos == first:
+            byte &= 0xFF >> (start & 7)
+        if pos == last:
+            byte &= 0xFF << (7 - (end & 7)) & 0xFF
+        if byte:
+            return pos * 8 + 8 - byte.bit_length()
+        pos += 1
+    if not bit and not end_given:
+        return len(value) * 8
+    return -1
+
+
+def find_other(value: bytes | bytearray, bit: int, start: int, end: int) -> int:
+    """The first byte in `start` - `end` that is not all `bit`s, -1 if none is."""
+    filler, pattern = _SKIP[bit]
+    view = memoryview(value)
+    for chunk in range(start, end, SCAN_CHUNK):
+        stop = min(chunk + SCAN_CHUNK, end)
+        # A memcmp skips a whole chunk, the regex only runs on the one that differs
+        if view[chunk:stop] != filler[: stop - chunk]:
+            return pattern.search(value, chunk, stop).start()
+    return -1
+
+
+def bitop(operation: str, values: list[bytes | bytearray]) -> bytes:
+    """
+    BITOP AND / OR / XOR / NOT of `values`, shorter ones padded with zeros.
+
+    Each value becomes one big integer, so the operation runs over the whole
+    buffers in C instead of byte by byte.
+    """
+    length = max(len(value) for value in values)
+    if operation == "NOT":
+        return bytes(values[0]).translate(_INVERT)
+    # Shifting pads the shorter values with zeros at the end
+    numbers = [
+        int.from_bytes(value, "big") << 8 * (length - len(value)) for value in values
+    ]
+    result = numbers[0]
+    for number in numbers[1:]:
+        if operation == "AND":
+            result &= number
+        elif operation == "OR":
+            result |= number
+        else:
+            result ^= number
+    return result.to_bytes(length, "big")
+
+
+def parse_type(value: bytes) -> tuple[bool, int] | None:
+    """BITFIELD `i<bits>` / `u<bits>` types as (signed, bits), None if invalid."""
+    signed = value[:1].lower() == b"i"
+    if not signed and value[:1].lower() != b"u":
+        return None
+    try:
+        bits = int(value[1:])
+    except ValueError:
+        return None
+    if not 1 <= bits <= (64 if signed else 63):
+        return None
+    return signed, bits
+
+
+def parse_field_offset(value: bytes, bits: int) -> int | None:
+    """A BITFIELD offset, `#N` meaning the Nth field of that width."""
+    if value.startswith(b"#"):
+        offset = parse_offset(value[1:])
+        if offset is not None:
+            offset *= bits
+    else:
+        offset = parse_offset(value)
+    if offset is None or offset + bits - 1 > MAX_BIT_OFFSET:
+        return None
+    return offset
+
+
+def get_field(value: bytes | bytearray, offset: int, signed: bool, bits: int) -> int:
+    first, last = offset >> 3, (offset + bits - 1) >> 3
+    chunk = bytes(value[first : last + 1]).ljust(last + 1 - first, b"\x00")
+    number = int.from_bytes(chunk, "big")
+    number = number >> ((last + 1) * 8 - offset - bits) & ((1 << bits) - 1)
+    if signed and number >> (bits - 1):
+        number -= 1 << bits
+    return number
+
+
+def set_field(value: bytearray, offset: int, bits: int, number: int) -> None:
+    first, last = offset >> 3, (offset + bits - 1) >> 3
+    if last >= len(value):
+        value.extend(bytes(last + 1 - len(value)))
+    shift = (last + 1) * 8 - offset - bits
+    mask = ((1 << bits) - 1) << shift
+    current = int.from_bytes(value[first : last + 1], "big")
+    current = current & ~mask | (number << shift) & mask
+    value[first : last + 1] = current.to_bytes(last + 1 - first, "big")
+
+
+def overflow(number: int, signed: bool, bits: int, mode: str) -> int | None:
+    """`number` fitted in the field by the OVERFLOW `mode`, None when it FAILs."""
+    if signed:
+        low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    else:
+        low, high = 0, (1 << bits) - 1
+    if low <= number <= high:
+        return number
+    if mode == "SAT":
+        return high if number > high else low
+    if mode == "FAIL":
+        return None
+    return (number - low) % (1 << bits) + low  # WRAP
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+
+from app.client import Redis
+
+from .logger import NOTICE
+from .parser_protocol import RespMap
+
+SLOTS = 16384
+# Seconds between two rounds of CLUSTER NODES sent to every known node
+CLUSTER_POLL_INTERVAL = 1.0
+
+
+def _crc16_table() -> list[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    """CRC16-CCITT (XMODEM), the checksum Redis Cluster hashes keys with."""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def key_slot(key: bytes) -> int:
+    """
+    Hash slot of `key`. Only the part between the first `{` and the next `}`
+    is hashed when it is not empty, so `{user1}.name` and `{user1}.email`
+    share a slot and can be used by one multi-key command.
+    """
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            key = key[start + 1 : end]
+    return crc16(key) & (SLOTS - 1)
+
+
+def slot_number(value: bytes | str) -> int:
+    try:
+        slot = int(value)
+    except ValueError:
+        slot = -1
+    if not 0 <= slot < SLOTS:
+        raise ValueError("Invalid or out of range slot")
+    return slot
+
+
+@dataclass(eq=False)
+class ClusterNode:
+    id: str
+    host: str
+    port: int
+    config_epoch: int = 0
+    flags: set[str] = field(default_factory=lambda: {"master"})
+    pong_received: float = 0.0  # time of the last CLUSTER NODES it answered
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class Cluster:
+    """
+    Cluster mode state of one node: the node table and the owner of every slot.
+
+    There is no cluster bus: every CLUSTER_POLL_INTERVAL seconds each node asks
+    the others for CLUSTER NODES over the client protocol. A node is trusted
+    for the slots it claims itself, and on conflicting claims the higher config
+    epoch wins, so a slot handed over with SETSLOT NODE spreads to every node.
+    Nodes only mentioned by a peer are added to the table and asked next round.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.myself = ClusterNode(
+            os.urandom(20).hex(),
+            config.host,
+            int(config.port),
+            flags={"myself", "master"},
+        )
+        self.nodes: dict[str, ClusterNode] = {self.myself.id: self.myself}
+        self.slots: list[ClusterNode | None] = [None] * SLOTS
+        # slot -> node it is moved to / from, while a migration is running
+        self.migrating: dict[int, ClusterNode] = {}
+        self.importing: dict[int, ClusterNode] = {}
+        self.current_epoch = 0
+        self.meet_queue: set[tuple[str, int]] = set()
+        self.links: dict[tuple[str, int], Redis] = {}
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.poll())
+
+    # Routing
+
+    def route(self, keys: list, store, asking: bool = False) -> dict | None:
+        """
+        None if this node serves `keys`, otherwise the redirect or error to send:
+        MOVED to the owner of the slot, ASK to the node a migrating slot goes to
+        for keys already moved, TRYAGAIN while a multi-key command has its keys
+        split between both, CROSSSLOT for keys in different slots.
+        """
+        slot = None
+        for key in keys:
+            key_slot_ = key_slot(key)
+            if slot is None:
+                slot = key_slot_
+            elif key_slot_ != slot:
+                return {
+                    "error": "CROSSSLOT Keys in request don't hash to the same slot"
+                }
+        if slot is None:
+            return None
+        owner = self.slots[slot]
+        if owner is None:
+            return {"error": "CLUSTERDOWN Hash slot not served"}
+        if owner is not self.myself:
+            if asking and slot in self.importing:
+                if len(keys) > 1 and not all(store.exists(key) for key in keys):
+                    return self.try_again()
+                return None
+            return {"error": f"MOVED {slot} {owner.address}"}
+        if slot in self.migrating:
+            missing = sum(not store.exists(key) for key in keys)
+            if missing == len(keys):
+                return {"error": f"ASK {slot} {self.migrating[slot].address}"}
+            if missing:
+                return self.try_again()
+        return None
+
+    @staticmethod
+    def try_again() -> dict:
+        return {"error": "TRYAGAIN Multiple keys request during rehashing of slot"}
+
+    # Slot assignment
+
+    def add_slots(self, slots: list[int]) -> str | dict:
+        for slot in slots:
+            if self.slots[slot] is not None:
+                return {"error": f"Slot {slot} is already busy"}
+        for slot in slots:
+            self.slots[slot] = self.myself
+        return "OK"
+
+    def del_slots(self, slots: list[int]) -> str | dict:
+        for slot in slots:
+            if self.slots[slot] is None:
+                return {"error": f"Slot {slot} is already unassigned"}
+        for slot in slots:
+            self.slots[slot] = None
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+        return "OK"
+
+    def set_slot(
+        self, slot: int, action: str, node_id: str | None, store
+    ) -> str | dict:
+        """CLUSTER SETSLOT <slot> IMPORTING|MIGRATING|NODE <node id> | STABLE."""
+        if action == "STABLE":
+            self.migrating.pop(slot, None)
+            self.importing.pop(slot, None)
+            return "OK"
+        node = self.nodes.get(node_id)
+        if node is None:
+            return {"error": f"I don't know about node {node_id}"}
+        if action == "MIGRATING":
+            if self.slots[slot] is not self.myself:
+                return {"error": f"I'm not the owner of hash slot {slot}"}
+            self.migrating[slot] = node
+        elif action == "IMPORTING":
+            if self.slots[slot] is self.myself:
+                return {"error": f"I'm already the owner of hash slot {slot}"}
+            self.importing[slot] = node
+        elif action == "NODE":
+            if (
+                self.slots[slot] is self.myself
+                and node is not self.myself
+                and store.count_keys_in_slot(slot)
+            ):
+                return {
+                    "error": f"Can't assign hashslot {slot} to a different node while I still hold keys for this hash slot."
+                }
+            self.migrating.pop(slot, None)
+            if node is self.myself and self.importing.pop(slot, None) is not None:
+                # The new owner needs an epoch no node has, for its claim to win
+                self.bump_epoch()
+            self.slots[slot] = node
+        else:
+            return {"error": "Invalid CLUSTER SETSLOT action or number of arguments."}
+        return "OK"
+
+    def bump_epoch(self) -> None:
+        self.current_epoch = max(node.config_epoch for node in self.nodes.values()) + 1
+        self.myself.config_epoch = self.current_epoch
+
+    def slot_ranges(self, node: ClusterNode) -> list[tuple[int, int]]:
+        ranges, start = [], None
+        for slot, owner in enumerate(self.slots + [None]):
+            if owner is node and start is None:
+                start = slot
+            elif owner is not node and start is not None:
+                ranges.append((start, slot - 1))
+                start = None
+        return ranges
+
+    # CLUSTER subcommand replies
+
+    def nodes_info(self) -> bytes:
+        lines = []
+        now_ms = int(time.time() * 1000)
+        for node in self.nodes.values():
+            ranges = [
+                str(start) if start == end else f"{start}-{end}"
+                for start, end in self.slot_ranges(node)
+            ]
+            if node is self.myself:
+                ranges += [f"[{s}->-{n.id}]" for s, n in self.migrating.items()]
+                ranges += [f"[{s}-<-{n.id}]" for s, n in self.importing.items()]
+            pong = now_ms if node is self.myself else int(node.pong_received * 1000)
+            fields = [
+                node.id,
+                f"{node.address}@{node.port + 10000}",
+                ",".join(sorted(node.flags)),
+                "-",
+                "0",
+                str(pong),
+                str(node.config_epoch),
+                "connected",
+                *ranges,
+            ]
+            lines.append(" ".join(fields) + "\n")
+        return "".join(lines).encode()
+
+    def slots_info(self) -> list:
+        result = []
+        for node in self.nodes.values():
+            for start, end in self.slot_ranges(node):
+                result.append([start, end, [node.host, node.port, node.id]])
+        return sorted(result)
+
+    def shards_info(self) -> list:
+        shards = []
+        for node in self.nodes.values():
+            slots = []
+            for start, end in self.slot_ranges(node):
+                slots += [start, end]
+            health = "fail" if "fail?" in node.flags else "online"
+            description = RespMap(
+                {
+                    "id": node.id,
+                    "port": node.port,
+                    "ip": node.host,
+                    "endpoint": node.host,
+                    "role": "master",
+                    "replication-offset": self.config.replication.master_repl_offset,
+                    "health": health,
+                }
+            )
+            shards.append(RespMap({"slots": slots, "nodes": [description]}))
+        return shards
+
+    def info(self) -> bytes:
+        assigned = sum(owner is not None for owner in self.slots)
+        failed = sum(
+            owner is not None and "fail?" in owner.flags for owner in self.slots
+        )
+        state = "ok" if assigned == SLOTS and not failed else "fail"
+        masters = {owner for owner in self.slots if owner is not None}
+        return (
+            f"cluster_enabled:1\r\n"
+            f"cluster_state:{state}\r\n"
+            f"cluster_slots_assigned:{assigned}\r\n"
+            f"cluster_slots_ok:{assigned - failed}\r\n"
+            f"cluster_slots_pfail:{failed}\r\n"
+            f"cluster_known_nodes:{len(self.nodes)}\r\n"
+            f"cluster_size:{len(masters)}\r\n"
+            f"cluster_current_epoch:{self.current_epoch}\r\n"
+            f"cluster_my_epoch:{self.myself.config_epoch}\r\n"
+        ).encode()
+
+    # Node discovery
+
+    def meet(self, host: str, port: int) -> str:
+        if host == "localhost":
+            host = "127.0.0.1"
+        self.meet_queue.add((host, port))
+        return "OK"
+
+    def forget(self, node_id: str) -> str | dict:
+        node = self.nodes.get(node_id)
+        if node is None:
+            return {"error": f"Unknown node {node_id}"}
+        if node is self.myself:
+            return {"error": "I tried hard but I can't forget myself..."}
+        del self.nodes[node_id]
+        for slot, owner in enumerate(self.slots):
+            if owner is node:
+                self.slots[slot] = None
+        return "OK"
+
+    def link(self, host: str, port: int) -> Redis:
+        client = self.links.get((host, port))
+        if client is None:
+            client = self.links[(host, port)] = Redis(host, port, max_connections=2)
+        return client
+
+    async def poll(self) -> None:
+        while True:
+            await asyncio.sleep(CLUSTER_POLL_INTERVAL)
+            addresses = self.meet_queue | {
+                (node.host, node.port)
+                for node in self.nodes.values()
+                if node is not self.myself
+            }
+            addresses.discard((self.myself.host, self.myself.port))
+            self.meet_queue = set()
+            await asyncio.gather(
+                *(self.ping(host, port) for host, port in addresses),
+                return_exceptions=True,
+            )
+
+    async def ping(self, host: str, port: int) -> None:
+        timeout = self.config.cluster_node_timeout / 1000
+        try:
+            client = self.link(host, port)
+            reply = await asyncio.wait_for(client.execute("CLUSTER", "NODES"), timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            for node in self.nodes.values():
+                if (node.host, node.port) == (host, port):
+                    if time.time() - node.pong_received > timeout:
+                        node.flags.add("fail?")
+            logging.debug("Cluster node %s:%s unreachable: %s", host, port, error)
+            return
+        if not self.merge(reply.decode(), host, port):
+            # A node we met that doesn't know us yet, introduce ourselves
+            await client.execute("CLUSTER", "MEET", self.myself.host, self.myself.port)
+
+    def merge(self, nodes: str, host: str, port: int) -> bool:
+        """
+        Merge the CLUSTER NODES reply of the node at `host:port` into the table.
+
+        Returns whether that node knows about this one.
+        """
+        known = False
+        for line in nodes.splitlines():
+            node_id, address, flags, _, _, _, epoch, _, *slots = line.split(" ")
+            if node_id == self.myself.id:
+                known = True
+                continue
+            node_host, node_port = address.split("@")[0].rsplit(":", 1)
+            node = self.nodes.get(node_id)
+            if node is None:
+                node = ClusterNode(node_id, node_host or host, int(node_port))
+                self.nodes[node_id] = node
+                logging.log(
+                    NOTICE, "Cluster node %s at %s added", node_id, node.address
+                )
+            if "myself" not in flags.split(","):
+                continue
+            node.host, node.port = host, port
+            node.config_epoch = int(epoch)
+            node.pong_received = time.time()
+            node.flags.discard("fail?")
+            self.current_epoch = max(self.current_epoch, node.config_epoch)
+            self.claim(node, slots)
+        return known
+
+    def claim(self, node: ClusterNode, ranges: list[str]) -> None:
+        """Apply the slots `node` says it owns, the higher config epoch wins."""
+        claimed = set()
+        for item in ranges:
+            if item.startswith("["):
+                continue  # a migration in progress on that node
+            start, _, end = item.partition("-")
+            claimed.update(range(int(start), int(end or start) + 1))
+        for slot, owner in enumerate(self.slots):
+            if owner is node and slot not in claimed:
+                self.slots[slot] = None
+        for slot in claimed:
+            owner = self.slots[slot]
+            if owner is node:
+                continue
+            if owner is None or (node.config_epoch, node.id) > (
+                owner.config_epoch,
+                owner.id,
+            ):
+                self.slots[slot] = node
@@ -1,29 +1,198 @@
-import asyncio, traceback, logging
+import asyncio, logging, random, time
 from app.utilities import (
     DatabaseParser,
     Store,
     ServerConfiguration,
     RedisProtocolParser,
     Replica,
+    Connection,
+    SimpleString,
+    PubSub,
+    RespMap,
+    RespSet,
+    TrackingTable,
+    DisklessSync,
+    LazyFree,
+    Offloader,
+    DatasetLoader,
+    Profiler,
+    MemoryProfiler,
+    ServerStats,
+    Cluster,
+    RDB_OFFLOAD_BYTES,
+    command_name,
+    key_slot,
+    load_dump,
 )
+from app.client import Redis, ReplyError
+from app.utilities import bitmaps, hyperloglog, keystats
+from app.utilities.cluster import slot_number
+from app.utilities.logger import NOTICE
+from app.utilities.rdb_writer import dump_value
+from app.utilities.sets import RedisSet, combine
+from app.utilities.store import match_keys
+from app.utilities.stream import INVALID_ID, check_id
+
+
+# Returned by commands that must not send anything back, like REPLCONF ACK
+NO_REPLY = object()
 
 
 class CommandHandler:
+    # Commands that run immediately even while a transaction is being queued
+    TRANSACTION_CMDS = {"MULTI", "EXEC", "DISCARD", "WATCH", "UNWATCH"}
+    XCLAIM_OPTIONS = {b"IDLE", b"TIME", b"RETRYCOUNT", b"FORCE", b"JUSTID", b"LASTID"}
+    # Read only commands whose keys are recorded for CLIENT TRACKING
+    READ_CMDS = {
+        "GET",
+        "GETRANGE",
+        "STRLEN",
+        "TYPE",
+        "XRANGE",
+        "XLEN",
+        "SISMEMBER",
+        "SMEMBERS",
+        "SCARD",
+        "SSCAN",
+        "SINTER",
+        "SUNION",
+        "SDIFF",
+        "SINTERCARD",
+        "PFCOUNT",
+        "GETBIT",
+        "BITCOUNT",
+        "BITPOS",
+        "BITFIELD_RO",
+    }
+    # Commands whose first argument is their only key, and those whose
+    # arguments are all keys, for cluster routing
+    SINGLE_KEY_CMDS = {
+        "SET",
+        "GET",
+        "APPEND",
+        "SETRANGE",
+        "GETRANGE",
+        "STRLEN",
+        "GETDEL",
+        "GETEX",
+        "TYPE",
+        "XADD",
+        "XRANGE",
+        "XTRIM",
+        "XDEL",
+        "XLEN",
+        "XACK",
+        "XPENDING",
+        "XCLAIM",
+        "XAUTOCLAIM",
+        "SADD",
+        "SREM",
+        "SISMEMBER",
+        "SMEMBERS",
+        "SCARD",
+        "SSCAN",
+        "DUMP",
+        "RESTORE",
+        "RESTORE-ASKING",
+        "PFADD",
+        "SETBIT",
+        "GETBIT",
+        "BITCOUNT",
+        "BITPOS",
+        "BITFIELD",
+        "BITFIELD_RO",
+    }
+    MULTI_KEY_CMDS = {
+        "DEL",
+        "UNLINK",
+        "WATCH",
+        "SINTER",
+        "SUNION",
+        "SDIFF",
+        "PFCOUNT",
+        "PFMERGE",
+    }
+    # Commands that look at a key without counting as an access to it
+    NOTOUCH_CMDS = {"OBJECT", "MEMORY"}
+    # Writes that do not depend on the selected database
+    ANY_DB_CMDS = {"FLUSHALL", "SWAPDB"}
+    # Writes propagated as the commands replaying their effect, see `replicated`
+    EFFECT_CMDS = {"XREADGROUP", "XCLAIM", "XAUTOCLAIM"}
+    # The only commands a connection with active subscriptions may send
+    SUBSCRIBED_CMDS = {
+        "SUBSCRIBE",
+        "UNSUBSCRIBE",
+        "PSUBSCRIBE",
+        "PUNSUBSCRIBE",
+        "PING",
+        "QUIT",
+    }
+    # Commands still served while the dataset is being loaded at startup
+    LOADING_CMDS = {
+        "PING",
+        "ECHO",
+        "INFO",
+        "HELLO",
+        "CLIENT",
+        "CONFIG",
+        "SELECT",
+        "SUBSCRIBE",
+        "UNSUBSCRIBE",
+        "PSUBSCRIBE",
+        "PUNSUBSCRIBE",
+        "PUBLISH",
+        "PUBSUB",
+        "CLUSTER",
+        "QUIT",
+    }
+
     def __init__(
         self,
-        store: Store,
+        databases: list[Store],
         db: DatabaseParser,
         config: ServerConfiguration,
     ):
-        self.store: Store = store
+        self.databases: list[Store] = databases
         self.db: DatabaseParser = db
         self.config: ServerConfiguration = config
-        self.replica_offset: asyncio.Condition = asyncio.Condition()
-        self.updated_replicas: int = 0
+        # WAIT callers: (target offset, replicas needed, future)
+        self.ack_waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.getack_scheduled: bool = False
+        self.pubsub: PubSub = PubSub()
+        self.clients: dict[int, Connection] = {}
+        self.tracking: TrackingTable = TrackingTable(config, self.clients)
+        self.lazyfree: LazyFree = LazyFree()
+        self.offload: Offloader = Offloader(config)
+        self.loading: DatasetLoader = DatasetLoader(databases, db)
+        self.profiler: Profiler = Profiler()
+        self.memprofiler: MemoryProfiler = MemoryProfiler()
+        self.stats: ServerStats = ServerStats()
+        self.hotkeys: keystats.HeavyHitters = keystats.HeavyHitters()
+        # CLIENT PAUSE: loop time it ends at (0 when not paused) and its mode
+        self.pause_end: float = 0.0
+        self.pause_all: bool = False
+        self.pause_timer: asyncio.TimerHandle | None = None
+        self.unpaused: asyncio.Event = asyncio.Event()
+        self.unpaused.set()
+        self.cluster: Cluster | None = None
+        if config.cluster_enabled:
+            self.cluster = Cluster(config)
+        # MIGRATE targets, "host:port" -> client
+        self.migrate_links: dict[str, Redis] = {}
+        for store in databases:
+            store.tracking = self.tracking
+            store.lazyfree = self.lazyfree
+        self.full_sync: DisklessSync = DisklessSync(databases, config, self.offload)
         self.cmds = {
             "PING": self._ping,
             "SET": self._set_data,
             "GET": self._get_data,
+            "APPEND": self._append,
+            "SETRANGE": self._setrange,
+            "GETRANGE": self._getrange,
+            "STRLEN": self._strlen,
+            "GETDEL": self._getdel,
+            "GETEX": self._getex,
             "ECHO": self._echo,
             "CONFIG": self._config,
             "KEYS": self._keys,
@@ -31,222 +200,1790 @@ class CommandHandler:
             "XADD": self._xadd,
             "XRANGE": self._xrange,
             "XREAD": self._xread,
+            "XTRIM": self._xtrim,
+            "XDEL": self._xdel,
+            "XLEN": self._xlen,
+            "XGROUP": self._xgroup,
+            "XREADGROUP": self._xreadgroup,
+            "XACK": self._xack,
+            "XPENDING": self._xpending,
+            "XCLAIM": self._xclaim,
+            "XAUTOCLAIM": self._xautoclaim,
             "INFO": self._info,
             "REPLCONF": self._replconf,
             "PSYNC": self._psync,
             "WAIT": self._wait,
+            "SADD": self._sadd,
+            "SREM": self._srem,
+            "SISMEMBER": self._sismember,
+            "SMEMBERS": self._smembers,
+            "SCARD": self._scard,
+            "SINTER": self._sinter,
+            "SUNION": self._sunion,
+            "SDIFF": self._sdiff,
+            "SINTERCARD": self._sintercard,
+            "SSCAN": self._sscan,
+            "PFADD": self._pfadd,
+            "PFCOUNT": self._pfcount,
+            "PFMERGE": self._pfmerge,
+            "SETBIT": self._setbit,
+            "GETBIT": self._getbit,
+            "BITCOUNT": self._bitcount,
+            "BITPOS": self._bitpos,
+            "BITOP": self._bitop,
+            "BITFIELD": self._bitfield,
+            "BITFIELD_RO": self._bitfield_ro,
+            "MULTI": self._multi,
+            "EXEC": self._exec,
+            "DISCARD": self._discard,
+            "WATCH": self._watch,
+            "UNWATCH": self._unwatch,
+            "SUBSCRIBE": self._subscribe,
+            "UNSUBSCRIBE": self._unsubscribe,
+            "PSUBSCRIBE": self._psubscribe,
+            "PUNSUBSCRIBE": self._punsubscribe,
+            "PUBLISH": self._publish,
+            "PUBSUB": self._pubsub,
+            "HELLO": self._hello,
+            "CLIENT": self._client,
+            "DEL": self._del,
+            "UNLINK": self._unlink,
+            "SELECT": self._select,
+            "SWAPDB": self._swapdb,
+            "DBSIZE": self._dbsize,
+            "FLUSHDB": self._flushdb,
+            "FLUSHALL": self._flushall,
+            "DEBUG": self._debug,
+            "CLUSTER": self._cluster,
+            "ASKING": self._asking,
+            "DUMP": self._dump,
+            "RESTORE": self._restore,
+            "RESTORE-ASKING": self._restore,
+            "MIGRATE": self._migrate,
+            "OBJECT": self._object,
+            "MEMORY": self._memory,
+            "HOTKEYS": self._hotkeys,
+            "BIGKEYS": self._bigkeys,
         }
 
     async def _ping(self, args, **kwargs):
-        if self.config.replication.role == "slave":
-            writer = kwargs["writer"]
-            client = writer.get_extra_info("peername")
-            if client[0] == self.config.replication.master_host and client[1] == int(
-                self.config.replication.master_port
-            ):
-                self.config.replication.master_repl_offset += 14
-                return "PONG"
+        conn: Connection = kwargs.get("conn")
+        if conn is not None and conn.subscriptions:
+            return [b"pong", args[0] if args else b""]
         return "PONG"
 
     async def _echo(self, args, **kwargs):
-        return " ".join(args)
+        return b" ".join(args)
 
-    async def _set_data(self, args, **kwargs):
+    async def _set_data(self, args, conn: Connection = None, **kwargs):
         key = args[0]
         value = args[1]
         args = args[2:]
-        self.store.set(key, value, args)
-        print(f"Setting key : {key} with value : {value}")
-        return "OK"
+        store = self.keyspace(conn)
+        index = self.check_index(b"GET", args)
+        if index is not None:
+            # SET ... GET replies with the old value, whether the SET ran or not
+            args = args[:index] + args[index + 1 :]
+            old = store.get_string(key)
+            if isinstance(old, dict):
+                return old
+            store.set(key, value, args)
+            return old
+        stored = store.set(key, value, args)
+        return "OK" if stored else None
 
-    async def _get_data(self, args, **kwargs):
+    async def _get_data(self, args, conn: Connection = None, **kwargs):
         key = args[0]
-        value = self.store.get(key)
+        value = self.keyspace(conn).get(key)
         return value
 
+    async def _append(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).append(args[0], args[1])
+
+    async def _setrange(self, args, conn: Connection = None, **kwargs):
+        key, offset, data = args
+        try:
+            offset = int(offset)
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        if offset < 0:
+            return {"error": "offset is out of range"}
+        return self.keyspace(conn).setrange(key, offset, data)
+
+    async def _getrange(self, args, conn: Connection = None, **kwargs):
+        try:
+            start, end = int(args[1]), int(args[2])
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        return self.keyspace(conn).getrange(args[0], start, end)
+
+    async def _strlen(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).strlen(args[0])
+
+    async def _getdel(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).getdel(args[0])
+
+    async def _getex(self, args, conn: Connection = None, **kwargs):
+        key, *options = args
+        expire_time, persist = None, False
+        if len(options) == 1 and command_name(options[0]) == "PERSIST":
+            persist = True
+        elif options:
+            if len(options) != 2:
+                return {"error": "syntax error"}
+            option = command_name(options[0])
+            try:
+                amount = int(options[1])
+            except ValueError:
+                return {"error": "value is not an integer or out of range"}
+            if amount <= 0:
+                return {"error": "invalid expire time in 'getex' command"}
+            if option == "EX":
+                expire_time = time.time() + amount
+            elif option == "PX":
+                expire_time = time.time() + amount / 1000
+            elif option == "EXAT":
+                expire_time = amount
+            elif option == "PXAT":
+                expire_time = amount / 1000
+            else:
+                return {"error": "syntax error"}
+        return self.keyspace(conn).getex(key, expire_time, persist)
+
     async def _config(self, args, **kwargs):
-        return self.config.handle_config(args)
+        try:
+            return self.config.handle_config([arg.decode() for arg in args])
+        except ValueError as e:
+            return {"error": str(e)}
 
-    async def _keys(self, args, **kwargs):
-        if args[0] == "*":
-            key_value_pair = self.db.key_value_pair
-        else:
-            key_value_pair = self.db.database_parser(path=self.config.db_path)
-        if key_value_pair:
-            return list(key_value_pair.keys())
-        else:
-            return None
+    async def _keys(self, args, conn: Connection = None, **kwargs):
+        store = self.keyspace(conn)
+        if not self.heavy(store.dbsize(), kwargs.get("in_exec")):
+            return store.keys(args[0])
+        # Key names are copied at C speed, the matching runs in the pool
+        return await self.offload.run(
+            match_keys,
+            list(store.store),
+            list(store.stream),
+            dict(store.expires),
+            args[0],
+        )
 
-    async def type_(self, args, **kwargs):
-        return self.store.type_check(args[0])
+    async def _del(self, args, conn: Connection = None, **kwargs):
+        store = self.keyspace(conn)
+        return sum(store.remove(key) is not None for key in args)
 
-    async def _xadd(self, args, **kwargs):
-        key = args.pop(0)
-        id = args.pop(0)
-        response = self.store.xadd(key, id, args)
+    async def _unlink(self, args, conn: Connection = None, **kwargs):
+        """Like DEL, but the memory of big values is released in the background."""
+        store = self.keyspace(conn)
+        removed = 0
+        for key in args:
+            value = store.remove(key)
+            if value is not None:
+                self.lazyfree.free(value)
+                removed += 1
+        return removed
+
+    def heavy(self, size: int, in_exec: bool = False) -> bool:
+        """
+        Whether work over `size` elements goes to the Offloader. Never inside
+        EXEC: awaiting the pool would let other clients run mid-transaction.
+        """
+        return not in_exec and self.offload.is_heavy(size)
+
+    def keyspace(self, conn: Connection | None) -> Store:
+        """The database selected by `conn`, db 0 when there is no connection."""
+        return self.databases[conn.db if conn is not None else 0]
+
+    def db_index(self, value: str) -> int | dict:
+        try:
+            index = int(value)
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        if not 0 <= index < len(self.databases):
+            return {"error": "DB index is out of range"}
+        return index
+
+    async def _select(self, args, conn: Connection = None, **kwargs):
+        if self.cluster is not None and args[0] != b"0":
+            return {"error": "SELECT is not allowed in cluster mode"}
+        index = self.db_index(args[0])
+        if isinstance(index, dict):
+            return index
+        conn.db = index
+        return "OK"
+
+    async def _swapdb(self, args, **kwargs):
+        """
+        Swap two databases by exchanging their slots in `self.databases`, O(1)
+        whatever their size. Clients keep their db index, so they see the data of
+        the other database from their next command on.
+        """
+        first, second = self.db_index(args[0]), self.db_index(args[1])
+        if isinstance(first, dict):
+            return {"error": "invalid first DB index"}
+        if isinstance(second, dict):
+            return {"error": "invalid second DB index"}
+        databases = self.databases
+        a, b = databases[first], databases[second]
+        databases[first], databases[second] = b, a
+        # Blocked clients wait on a db index, not on the data that was there
+        a.stream_waiters, b.stream_waiters = b.stream_waiters, a.stream_waiters
+        for store in (a, b):
+            store.touch_watched()
+            for key in list(store.stream_waiters):
+                store.signal_stream(key)
+        return "OK"
+
+    async def _dbsize(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).dbsize()
+
+    async def _flushdb(self, args, conn: Connection = None, **kwargs):
+        keys, streams = self.keyspace(conn).flush()
+        self.tracking.invalidate_all()
+        if args and args[0].upper() == b"ASYNC":
+            self.lazyfree.free_keyspace(keys, streams)
+        return "OK"
+
+    async def _flushall(self, args, **kwargs):
+        lazy = bool(args) and args[0].upper() == b"ASYNC"
+        for store in self.databases:
+            keys, streams = store.flush()
+            if lazy:
+                self.lazyfree.free_keyspace(keys, streams)
+        self.tracking.invalidate_all()
+        return "OK"
+
+    async def type_(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).type_check(args[0])
+
+    async def _xadd(
+        self, args, command: list = None, conn: Connection = None, **kwargs
+    ):
+        key = args[0]
+        i, nomkstream, trim = 1, False, None
+        while args[i].upper() in (b"NOMKSTREAM", b"MAXLEN", b"MINID"):
+            if args[i].upper() == b"NOMKSTREAM":
+                nomkstream = True
+                i += 1
+            else:
+                trim, i = self.parse_trim(args, i)
+                if isinstance(trim, dict):
+                    return trim
+        id = args[i].decode()
+        ms, separator, seq = id.partition("-")
+        if id != "*" and (not separator or check_id(id if seq != "*" else ms) is None):
+            return INVALID_ID
+        store = self.keyspace(conn)
+        response = store.xadd(key, id, args[i + 1 :], trim, nomkstream)
+        if command is not None and isinstance(response, str):
+            # Replicas get the generated ID and an exact trim, so they end up
+            # with the same entries as the master
+            options = ["NOMKSTREAM"] if nomkstream else []
+            if trim is not None:
+                options += self.exact_trim(store, key, trim)
+            command[:] = [command[0], key, *options, response, *args[i + 1 :]]
         return response
 
-    async def _xrange(self, args, **kwargs):
-        key = args.pop(0)
-        response = self.store.xrange(key, args)
+    async def _xtrim(
+        self, args, command: list = None, conn: Connection = None, **kwargs
+    ):
+        key = args[0]
+        trim, i = self.parse_trim(args, 1)
+        if isinstance(trim, dict):
+            return trim
+        store = self.keyspace(conn)
+        response = store.xtrim(key, *trim)
+        if command is not None:
+            command[:] = [command[0], key, *self.exact_trim(store, key, trim)]
+        return response
+
+    async def _xdel(self, args, conn: Connection = None, **kwargs):
+        if not self.valid_ids(args[1:]):
+            return INVALID_ID
+        return self.keyspace(conn).xdel(args[0], args[1:])
+
+    async def _xlen(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).xlen(args[0])
+
+    async def _xgroup(self, args, conn: Connection = None, **kwargs):
+        subcommand = command_name(args[0])
+        store = self.keyspace(conn)
+        if subcommand in ("CREATE", "SETID") and not self.valid_ids(args[3:4], b"$"):
+            return INVALID_ID
+        if subcommand == "CREATE":
+            mkstream = self.check_index(b"MKSTREAM", args[4:]) is not None
+            return store.xgroup_create(args[1], args[2], args[3].decode(), mkstream)
+        elif subcommand == "SETID":
+            return store.xgroup_setid(args[1], args[2], args[3].decode())
+        elif subcommand == "DESTROY":
+            return store.xgroup_destroy(args[1], args[2])
+        elif subcommand == "CREATECONSUMER":
+            return store.xgroup_createconsumer(args[1], args[2], args[3])
+        elif subcommand == "DELCONSUMER":
+            return store.xgroup_delconsumer(args[1], args[2], args[3])
+        return {"error": f"unknown subcommand '{args[0].decode(errors='replace')}'"}
+
+    async def _xreadgroup(
+        self, args, command: list = None, conn: Connection = None, **kwargs
+    ):
+        group, consumer = args[1], args[2]
+        count, block, noack = None, None, False
+        i = 3
+        while args[i].upper() != b"STREAMS":
+            option = args[i].upper()
+            if option == b"COUNT":
+                count = int(args[i + 1])
+                i += 2
+            elif option == b"BLOCK":
+                block = int(args[i + 1])
+                i += 2
+            elif option == b"NOACK":
+                noack = True
+                i += 1
+            else:
+                return {"error": "syntax error"}
+        streams = args[i + 1 :]
+        if len(streams) % 2:
+            return {
+                "error": "Unbalanced 'xreadgroup' list of streams: for each stream key an ID or '>' must be specified."
+            }
+        keys = streams[: len(streams) // 2]
+        if not self.valid_ids(streams[len(streams) // 2 :], b">"):
+            return INVALID_ID
+        ids = [id.decode() for id in streams[len(streams) // 2 :]]
+        if kwargs.get("in_exec") or any(id != ">" for id in ids):
+            block = None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + block / 1000 if block else None
+        effects = []
+        while True:
+            # Looked up on every pass, a SWAPDB may have replaced the database
+            store = self.keyspace(conn)
+            response = store.xreadgroup(
+                group, consumer, keys, ids, count, noack, effects
+            )
+            if command is not None:
+                command[:] = effects
+            if response is not None or block is None:
+                return response
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    return None
+            if not await store.wait_for_streams(keys, timeout):
+                return None
+
+    async def _xack(self, args, conn: Connection = None, **kwargs):
+        if not self.valid_ids(args[2:]):
+            return INVALID_ID
+        return self.keyspace(conn).xack(args[0], args[1], args[2:])
+
+    async def _xpending(self, args, conn: Connection = None, **kwargs):
+        key, group, *options = args
+        if not options:
+            return self.keyspace(conn).xpending(key, group)
+        min_idle = 0
+        if options[0].upper() == b"IDLE":
+            if not options[1].isdigit():
+                return {"error": "value is not an integer or out of range"}
+            min_idle = int(options[1])
+            options = options[2:]
+        start, end, count, *consumer = options
+        if not count.lstrip(b"-").isdigit():
+            return {"error": "value is not an integer or out of range"}
+        if not self.valid_ids([start, end]):
+            return INVALID_ID
+        consumer = consumer[0] if consumer else None
+        return self.keyspace(conn).xpending(
+            key, group, start, end, int(count), consumer, min_idle
+        )
+
+    async def _xclaim(
+        self, args, command: list = None, conn: Connection = None, **kwargs
+    ):
+        key, group, consumer, min_idle, *rest = args
+        ids = []
+        while rest and rest[0].upper() not in self.XCLAIM_OPTIONS:
+            ids.append(rest.pop(0))
+        if not min_idle.isdigit():
+            return {"error": "Invalid min-idle-time argument for XCLAIM"}
+        if not self.valid_ids(ids):
+            return INVALID_ID
+        options = {}
+        while rest:
+            option = rest.pop(0).upper()
+            if option in (b"FORCE", b"JUSTID"):
+                options[option.lower().decode()] = True
+            elif option == b"IDLE":
+                options["idle"] = int(rest.pop(0))
+            elif option == b"TIME":
+                options["idle"] = max(int(time.time() * 1000) - int(rest.pop(0)), 0)
+            elif option == b"RETRYCOUNT":
+                options["retrycount"] = int(rest.pop(0))
+            elif option == b"LASTID":
+                options["lastid"] = rest.pop(0).decode()
+        effects = []
+        response = self.keyspace(conn).xclaim(
+            key, group, consumer, int(min_idle), ids, **options, effects=effects
+        )
+        if command is not None:
+            command[:] = effects
         return response
 
-    async def _xread(self, args, **kwargs):
-        print("XREAD")
+    async def _xautoclaim(
+        self, args, command: list = None, conn: Connection = None, **kwargs
+    ):
+        key, group, consumer, min_idle, start, *options = args
+        if not min_idle.isdigit():
+            return {"error": "Invalid min-idle-time argument for XAUTOCLAIM"}
+        if not self.valid_ids([start]):
+            return INVALID_ID
+        count = 100
+        index = self.check_index(b"COUNT", options)
+        if index is not None:
+            count = int(options[index + 1])
+        justid = self.check_index(b"JUSTID", options) is not None
+        effects = []
+        response = self.keyspace(conn).xautoclaim(
+            key, group, consumer, int(min_idle), start, count, justid, effects
+        )
+        if command is not None:
+            command[:] = effects
+        return response
+
+    @staticmethod
+    def valid_ids(ids: list, special: bytes | None = None) -> bool:
+        """Whether every ID is a valid stream ID, or the `special` one ($, >)."""
+        return all(id == special or check_id(id) is not None for id in ids)
+
+    def parse_trim(self, args: list, i: int) -> tuple:
+        """
+        Parse `MAXLEN|MINID [=|~] threshold [LIMIT count]` starting at `args[i]`.
+
+        Returns the `(strategy, approx, threshold, limit)` tuple and the index
+        of the first argument after the option.
+        """
+        strategy = command_name(args[i])
+        i += 1
+        approx = False
+        if args[i] in (b"=", b"~"):
+            approx = args[i] == b"~"
+            i += 1
+        threshold = args[i]
+        i += 1
+        if strategy == "MAXLEN" and not threshold.isdigit():
+            return {"error": "value is not an integer or out of range"}, i
+        if strategy == "MINID" and check_id(threshold) is None:
+            return INVALID_ID, i
+        limit = 0
+        if i < len(args) and args[i].upper() == b"LIMIT":
+            if i + 1 >= len(args) or not args[i + 1].isdigit():
+                return {"error": "value is not an integer or out of range"}, i
+            limit = int(args[i + 1])
+            i += 2
+            if not approx:
+                return {
+                    "error": "syntax error, LIMIT cannot be used without the special ~ option"
+                }, i
+        elif approx:
+            limit = 100 * self.config.stream_node_max_entries
+        return (strategy, approx, threshold, limit), i
+
+    @staticmethod
+    def exact_trim(store: Store, key: str, trim: tuple) -> list:
+        """The trim option as it is propagated: `~` replaced by what was kept."""
+        strategy, approx, threshold, limit = trim
+        stream = store.get_stream(key)
+        if approx and stream is not None:
+            if strategy == "MAXLEN":
+                threshold = str(len(stream))
+            else:
+                threshold = stream.first_id_str or threshold
+        return [strategy, "=", threshold]
+
+    async def _xrange(self, args, conn: Connection = None, **kwargs):
+        key = args.pop(0)
+        store = self.keyspace(conn)
+        stream = store.get_stream(key)
+        if stream is None or not self.heavy(len(stream), kwargs.get("in_exec")):
+            return store.xrange(key, args)
+        bounds = store.parse_range(args)
+        if isinstance(bounds, dict):
+            return bounds
+        start, end, count = bounds
+        if count is not None and not self.offload.is_heavy(count):
+            return stream.range(start, end, count)
+        view = stream.view(start, end)
+        return await self.offload.run(view.range, start, end, count)
+
+    async def _xread(self, args, conn: Connection = None, **kwargs):
         block_ms = None
-        block = self.check_index("BLOCK", args)
+        block = self.check_index(b"BLOCK", args)
         if block != None:
             block_ms = int(args[block + 1])
             args = args[block + 2 :]
-        streams = list(
-            filter(
-                lambda x: (x.isalpha() or x.isalnum() or "_" in x) and not x.isdigit(),
-                args[1:],
-            )
-        )
-        id = args[len(streams) + 1]
-        response = await self.store.xread(streams, id, block_ms)
+            if kwargs.get("in_exec"):
+                block_ms = None  # like Redis, never block inside a transaction
+        index = self.check_index(b"STREAMS", args)
+        if index is None:
+            return {"error": "syntax error"}
+        # Keys then as many IDs, keys may look like IDs so only counting works
+        streams = args[index + 1 :]
+        if not streams or len(streams) % 2:
+            return {
+                "error": "Unbalanced 'xread' list of streams: for each stream key an ID or '$' must be specified."
+            }
+        if not self.valid_ids(streams[len(streams) // 2 :], b"$"):
+            return INVALID_ID
+        id = streams[len(streams) // 2].decode()
+        streams = streams[: len(streams) // 2]
+        response = await self.keyspace(conn).xread(streams, id, block_ms)
         return response
 
+    async def _sadd(self, args, conn: Connection = None, **kwargs):
+        key, *members = args
+        return self.keyspace(conn).sadd(key, members)
+
+    async def _srem(self, args, conn: Connection = None, **kwargs):
+        key, *members = args
+        return self.keyspace(conn).srem(key, members)
+
+    async def _sismember(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).sismember(args[0], args[1])
+
+    async def _smembers(self, args, conn: Connection = None, **kwargs):
+        return self.as_set(self.keyspace(conn).smembers(args[0]))
+
+    async def _scard(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).scard(args[0])
+
+    async def _sinter(self, args, conn: Connection = None, in_exec=False, **kwargs):
+        return self.as_set(await self.set_algebra(conn, "SINTER", args, 0, in_exec))
+
+    async def _sunion(self, args, conn: Connection = None, in_exec=False, **kwargs):
+        return self.as_set(await self.set_algebra(conn, "SUNION", args, 0, in_exec))
+
+    async def _sdiff(self, args, conn: Connection = None, in_exec=False, **kwargs):
+        return self.as_set(await self.set_algebra(conn, "SDIFF", args, 0, in_exec))
+
+    async def set_algebra(
+        self, conn: Connection, op: str, keys: list, limit: int = 0, in_exec=False
+    ):
+        """
+        SINTER / SUNION / SDIFF. With more than `offload_threshold` members in
+        total the operands are copied and combined in the Offloader, writes that
+        run meanwhile change the live sets and not the result.
+        """
+        sets = self.keyspace(conn).get_sets(keys)
+        if isinstance(sets, dict):
+            return sets
+        if not self.heavy(sum(len(s) for s in sets if s is not None), in_exec):
+            return combine(op, sets, limit)
+        copies = [s.copy() if s is not None else None for s in sets]
+        return await self.offload.run(combine, op, copies, limit)
+
+    async def _sintercard(self, args, conn: Connection = None, **kwargs):
+        numkeys = int(args[0])
+        keys = args[1 : numkeys + 1]
+        limit = 0
+        index = self.check_index(b"LIMIT", args[numkeys + 1 :])
+        if index is not None:
+            limit = int(args[numkeys + 1 + index + 1])
+            if limit < 0:
+                return {"error": "LIMIT can't be negative"}
+        response = await self.set_algebra(
+            conn, "SINTER", keys, limit, kwargs.get("in_exec")
+        )
+        if isinstance(response, dict):
+            return response
+        return len(response)
+
+    async def _sscan(self, args, conn: Connection = None, **kwargs):
+        key, cursor, *options = args
+        match, count = None, 10
+        index = self.check_index(b"MATCH", options)
+        if index is not None:
+            match = options[index + 1]
+        index = self.check_index(b"COUNT", options)
+        if index is not None:
+            count = int(options[index + 1])
+        if not cursor.isdigit():
+            return {"error": "invalid cursor"}
+        return self.keyspace(conn).sscan(key, int(cursor), match, count)
+
+    async def _pfadd(self, args, conn: Connection = None, **kwargs):
+        key, *elements = args
+        if self.heavy(len(elements), kwargs.get("in_exec")):
+            # Hashing is the costly part, registers are updated on the loop
+            patterns = await self.offload.run(hyperloglog.patterns, elements)
+        else:
+            patterns = hyperloglog.patterns(elements)
+        return self.keyspace(conn).pfadd(key, patterns)
+
+    async def _pfcount(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).pfcount(args)
+
+    async def _pfmerge(self, args, conn: Connection = None, **kwargs):
+        return self.keyspace(conn).pfmerge(args[0], args[1:])
+
+    async def _setbit(self, args, conn: Connection = None, **kwargs):
+        key, offset, bit = args
+        offset = bitmaps.parse_offset(offset)
+        if offset is None:
+            return {"error": "bit offset is not an integer or out of range"}
+        if bit not in (b"0", b"1"):
+            return {"error": "bit is not an integer or out of range"}
+        return self.keyspace(conn).setbit(key, offset, int(bit))
+
+    async def _getbit(self, args, conn: Connection = None, **kwargs):
+        offset = bitmaps.parse_offset(args[1])
+        if offset is None:
+            return {"error": "bit offset is not an integer or out of range"}
+        return self.keyspace(conn).getbit(args[0], offset)
+
+    async def _bitcount(self, args, conn: Connection = None, **kwargs):
+        key, *options = args
+        if not options:
+            return self.keyspace(conn).bitcount(key)
+        if len(options) not in (2, 3):
+            return {"error": "syntax error"}
+        bit_unit = self.bit_unit(options[2:])
+        if bit_unit is None:
+            return {"error": "syntax error"}
+        try:
+            start, end = int(options[0]), int(options[1])
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        return self.keyspace(conn).bitcount(key, start, end, bit_unit)
+
+    async def _bitpos(self, args, conn: Connection = None, **kwargs):
+        key, bit, *options = args
+        if bit not in (b"0", b"1"):
+            return {"error": "The bit argument must be 1 or 0."}
+        if len(options) > 3:
+            return {"error": "syntax error"}
+        bit_unit = self.bit_unit(options[2:])
+        if bit_unit is None:
+            return {"error": "syntax error"}
+        try:
+            start = int(options[0]) if options else 0
+            end = int(options[1]) if len(options) > 1 else None
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        return self.keyspace(conn).bitpos(key, int(bit), start, end, bit_unit)
+
+    @staticmethod
+    def bit_unit(options: list) -> bool | None:
+        """Whether BITCOUNT / BITPOS ranges are in bits, None for a bad unit."""
+        if not options:
+            return False
+        unit = command_name(options[0])
+        if unit not in ("BYTE", "BIT"):
+            return None
+        return unit == "BIT"
+
+    async def _bitop(self, args, conn: Connection = None, **kwargs):
+        operation, destination, *keys = args
+        operation = command_name(operation)
+        if operation not in ("AND", "OR", "XOR", "NOT") or not keys:
+            return {"error": "syntax error"}
+        if operation == "NOT" and len(keys) != 1:
+            return {"error": "BITOP NOT must be called with a single source key."}
+        return self.keyspace(conn).bitop(operation, destination, keys)
+
+    async def _bitfield(self, args, conn: Connection = None, **kwargs):
+        operations = self.parse_bitfield(args[1:])
+        if isinstance(operations, dict):
+            return operations
+        return self.keyspace(conn).bitfield(args[0], operations)
+
+    async def _bitfield_ro(self, args, conn: Connection = None, **kwargs):
+        operations = self.parse_bitfield(args[1:], readonly=True)
+        if isinstance(operations, dict):
+            return operations
+        return self.keyspace(conn).bitfield(args[0], operations)
+
+    @staticmethod
+    def parse_bitfield(args: list, readonly: bool = False) -> list | dict:
+        """BITFIELD subcommands as the operations `Store.bitfield` runs."""
+        operations, mode, i = [], "WRAP", 0
+        try:
+            while i < len(args):
+                action = command_name(args[i])
+                if action == "OVERFLOW":
+                    mode = command_name(args[i + 1])
+                    if mode not in ("WRAP", "SAT", "FAIL"):
+                        return {"error": "Invalid OVERFLOW type specified"}
+                    i += 2
+                    continue
+                if action not in ("GET", "SET", "INCRBY"):
+                    return {"error": "syntax error"}
+                if readonly and action != "GET":
+                    return {"error": "BITFIELD_RO only supports the GET subcommand"}
+                field = bitmaps.parse_type(args[i + 1])
+                if field is None:
+                    return {
+                        "error": "Invalid bitfield type. Use something like i16 u8. "
+                        "Note that u64 is not supported but i64 is."
+                    }
+                signed, bits = field
+                offset = bitmaps.parse_field_offset(args[i + 2], bits)
+                if offset is None:
+                    return {"error": "bit offset is not an integer or out of range"}
+                argument = None
+                if action != "GET":
+                    argument = int(args[i + 3])
+                    i += 1
+                operations.append((action, signed, bits, offset, argument, mode))
+                i += 3
+        except IndexError:
+            return {"error": "syntax error"}
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        return operations
+
+    async def _multi(self, args, conn: Connection = None, **kwargs):
+        if conn.in_multi:
+            return {"error": "MULTI calls can not be nested"}
+        conn.in_multi = True
+        return "OK"
+
+    async def _discard(self, args, conn: Connection = None, **kwargs):
+        if not conn.in_multi:
+            return {"error": "DISCARD without MULTI"}
+        conn.reset_multi()
+        self.unwatch_all(conn)
+        return "OK"
+
+    async def _watch(self, args, conn: Connection = None, **kwargs):
+        if conn.in_multi:
+            return {"error": "WATCH inside MULTI is not allowed"}
+        store = self.keyspace(conn)
+        for key in args:
+            if (store, key) not in conn.watched:
+                conn.watched[(store, key)] = store.watch(key)
+        return "OK"
+
+    async def _unwatch(self, args, conn: Connection = None, **kwargs):
+        self.unwatch_all(conn)
+        return "OK"
+
+    async def _exec(self, args, conn: Connection = None, command=None, **kwargs):
+        if not conn.in_multi:
+            return {"error": "EXEC without MULTI"}
+        queued, aborted = conn.queued, conn.multi_error
+        dirty = any(
+            store.is_dirty(key, version)
+            for (store, key), version in conn.watched.items()
+        )
+        conn.reset_multi()
+        self.unwatch_all(conn)
+        if aborted:
+            return {
+                "error": "EXECABORT Transaction discarded because of previous errors."
+            }
+        if dirty:
+            return None
+
+        # Queued handlers are awaited back to back without propagating in between,
+        # so no other client can run until the whole transaction is applied.
+        responses = []
+        writes = []  # (db, command), SELECT inside the transaction changes the db
+        for command in queued:
+            keyword, *cmd_args = command
+            try:
+                response = await self.cmds[command_name(keyword)](
+                    cmd_args, conn=conn, in_exec=True, command=command, **kwargs
+                )
+            except Exception as e:
+                response = {"error": str(e)}
+            self.record_access(command_name(keyword), cmd_args, conn)
+            responses.append(response)
+            writes.extend((conn.db, write) for write in self.replicated(command))
+        if writes:
+            await self.propagate_batch([(None, ["MULTI"]), *writes, (None, ["EXEC"])])
+        return responses
+
+    def unwatch_all(self, conn: Connection) -> None:
+        for store, key in conn.watched:
+            store.unwatch(key)
+        conn.watched = {}
+
+    async def _subscribe(self, args, conn: Connection = None, **kwargs):
+        return self.pubsub.subscribe(conn, args)
+
+    async def _unsubscribe(self, args, conn: Connection = None, **kwargs):
+        return self.pubsub.unsubscribe(conn, args)
+
+    async def _psubscribe(self, args, conn: Connection = None, **kwargs):
+        return self.pubsub.psubscribe(conn, args)
+
+    async def _punsubscribe(self, args, conn: Connection = None, **kwargs):
+        return self.pubsub.punsubscribe(conn, args)
+
+    async def _publish(self, args, in_exec=False, **kwargs):
+        return await self.pubsub.publish(args[0], args[1], in_exec)
+
+    async def _pubsub(self, args, **kwargs):
+        subcommand = command_name(args[0])
+        if subcommand == "CHANNELS":
+            return self.pubsub.active_channels(args[1] if len(args) > 1 else None)
+        elif subcommand == "NUMSUB":
+            return self.pubsub.numsub(args[1:])
+        elif subcommand == "NUMPAT":
+            return len(self.pubsub.patterns)
+        return {"error": f"unknown subcommand '{args[0].decode(errors='replace')}'"}
+
+    async def _hello(self, args, conn: Connection = None, **kwargs):
+        if args:
+            try:
+                protocol = int(args[0])
+            except ValueError:
+                return {"error": "Protocol version is not an integer or out of range"}
+            if protocol not in (2, 3):
+                return {"error": "NOPROTO unsupported protocol version"}
+            conn.protocol = protocol
+        return RespMap(
+            {
+                "server": "redis",
+                "version": "7.2.0",
+                "proto": conn.protocol,
+                "id": conn.id,
+                "mode": "standalone" if self.cluster is None else "cluster",
+                "role": self.config.replication.role,
+                "modules": [],
+            }
+        )
+
+    async def _client(self, args, conn: Connection = None, **kwargs):
+        subcommand = command_name(args[0])
+        if subcommand == "ID":
+            return conn.id
+        elif subcommand == "TRACKING":
+            return self.client_tracking(conn, args[1:])
+        elif subcommand == "CACHING":
+            if not (conn.tracking_optin or conn.tracking_optout):
+                return {
+                    "error": "CLIENT CACHING can be called only when the client is in tracking mode with OPTIN or OPTOUT mode enabled"
+                }
+            conn.caching = args[1].upper() == b"YES"
+            return "OK"
+        elif subcommand == "GETREDIR":
+            if not conn.tracking:
+                return -1
+            return conn.tracking_redirect or 0
+        elif subcommand == "SETNAME":
+            # Names show up in CLIENT LIST lines, which are split on spaces
+            if any(byte < 33 or byte > 126 for byte in args[1]):
+                return {
+                    "error": "Client names cannot contain spaces, newlines or special characters."
+                }
+            conn.name = bytes(args[1])
+            return "OK"
+        elif subcommand == "GETNAME":
+            return conn.name or None
+        elif subcommand == "INFO":
+            return (conn.info(time.monotonic()) + "\n").encode()
+        elif subcommand == "LIST":
+            return self.client_list(args[1:])
+        elif subcommand == "KILL":
+            return self.client_kill(conn, args[1:])
+        elif subcommand == "PAUSE":
+            return self.client_pause(args[1:])
+        elif subcommand == "UNPAUSE":
+            self.unpause()
+            return "OK"
+        return {"error": f"unknown subcommand '{args[0].decode(errors='replace')}'"}
+
+    def client_list(self, args: list):
+        """CLIENT LIST [TYPE normal | replica | pubsub] [ID id [id ...]]"""
+        clients = list(self.clients.values())
+        if len(args) >= 2 and args[0].upper() == b"TYPE":
+            kind = command_name(args[1]).lower()
+            kind = "replica" if kind == "slave" else kind
+            if kind not in ("normal", "replica", "pubsub", "master"):
+                return {"error": f"Unknown client type '{args[1].decode()}'"}
+            clients = [conn for conn in clients if conn.client_class == kind]
+        elif len(args) >= 2 and args[0].upper() == b"ID":
+            try:
+                ids = {int(id) for id in args[1:]}
+            except ValueError:
+                return {"error": "Invalid client ID"}
+            clients = [conn for conn in clients if conn.id in ids]
+        elif args:
+            return {"error": "syntax error"}
+        now = time.monotonic()
+        return "".join(conn.info(now) + "\n" for conn in clients).encode()
+
+    def client_kill(self, conn: Connection, args: list):
+        """
+        CLIENT KILL addr:port, or CLIENT KILL with ID / ADDR / LADDR / USER / TYPE
+        filters and SKIPME yes/no, which replies with the number of clients killed.
+        """
+        if len(args) == 1:
+            addr = args[0].decode(errors="replace")
+            targets = [c for c in self.clients.values() if c.addr == addr]
+            if not targets:
+                return {"error": "No such client"}
+            self.kill_client(targets[0], conn)
+            return "OK"
+        if not args or len(args) % 2:
+            return {"error": "syntax error"}
+        id = addr = laddr = kind = None
+        skipme = True
+        for option, value in zip(args[::2], args[1::2]):
+            option = command_name(option)
+            if option == "ID":
+                try:
+                    id = int(value)
+                except ValueError:
+                    id = 0
+                if id <= 0:
+                    return {"error": "client-id should be greater than 0"}
+            elif option == "ADDR":
+                addr = value.decode(errors="replace")
+            elif option == "LADDR":
+                laddr = value.decode(errors="replace")
+            elif option == "USER":
+                # There are no ACL users, every connection is the default user
+                if value != b"default":
+                    return {"error": f"No such user '{value.decode(errors='replace')}'"}
+            elif option == "TYPE":
+                kind = command_name(value).lower()
+                kind = "replica" if kind == "slave" else kind
+                if kind not in ("normal", "replica", "pubsub", "master"):
+                    return {"error": f"Unknown client type '{value.decode()}'"}
+            elif option == "SKIPME" and value.upper() in (b"YES", b"NO"):
+                skipme = value.upper() == b"YES"
+            else:
+                return {"error": "syntax error"}
+        targets = [
+            c
+            for c in self.clients.values()
+            if (id is None or c.id == id)
+            and (addr is None or c.addr == addr)
+            and (laddr is None or c.laddr == laddr)
+            and (kind is None or c.client_class == kind)
+            and not (skipme and c is conn)
+            and not c.close_after_reply
+            and not c.writer.is_closing()
+        ]
+        for target in targets:
+            self.kill_client(target, conn)
+        return len(targets)
+
+    def kill_client(self, target: Connection, conn: Connection | None) -> None:
+        logging.info("Killing client id=%d addr=%s", target.id, target.addr)
+        if target.is_replica:
+            self.forget_replica(target)
+        if target is conn:
+            # The reply to CLIENT KILL still goes out first
+            target.close_after_reply = True
+        else:
+            target.writer.transport.abort()
+
+    def forget_replica(self, conn: Connection) -> None:
+        """Stop replicating to the replica on `conn`, once it is killed or gone."""
+        replica = self.config.replication.find_slave(conn)
+        if replica is not None:
+            self.config.replication.remove_slave(replica)
+
+    def client_pause(self, args: list):
+        """
+        CLIENT PAUSE timeout [WRITE | ALL]
+
+        Commands are held in `call_cmd` until the pause ends, all of them or only
+        writes (reads go on). Replication links are never paused, and neither is
+        CLIENT itself so a pause can always be lifted with CLIENT UNPAUSE.
+        """
+        try:
+            timeout = int(args[0])
+        except (IndexError, ValueError):
+            timeout = -1
+        if timeout < 0:
+            return {"error": "timeout is not an integer or out of range"}
+        mode = command_name(args[1]) if len(args) > 1 else "ALL"
+        if mode not in ("WRITE", "ALL") or len(args) > 2:
+            return {"error": "syntax error"}
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout / 1000
+        if self.pause_end:
+            # A pause under way is only ever extended or made stricter
+            end = max(end, self.pause_end)
+            self.pause_all = self.pause_all or mode == "ALL"
+            self.pause_timer.cancel()
+        else:
+            self.pause_all = mode == "ALL"
+        self.pause_end = end
+        self.unpaused.clear()
+        self.pause_timer = loop.call_at(end, self.unpause)
+        return "OK"
+
+    def unpause(self) -> None:
+        if self.pause_timer is not None:
+            self.pause_timer.cancel()
+            self.pause_timer = None
+        self.pause_end = 0.0
+        self.unpaused.set()
+
+    def pause_applies(self, cmd: str, data: list, conn: Connection) -> bool:
+        if conn.is_replica or conn.is_master or cmd == "CLIENT":
+            return False
+        if self.pause_all:
+            return True
+        if cmd == "EXEC":
+            return any(self.may_write(command) for command in conn.queued)
+        return self.may_write(data)
+
+    def may_write(self, command: list) -> bool:
+        """Whether `command`, before it runs, is one that changes the dataset."""
+        return command_name(command[0]) in self.EFFECT_CMDS or self.is_writable(
+            command
+        )
+
+    def client_tracking(self, conn: Connection, args: list):
+        if args[0].upper() == b"OFF":
+            self.tracking.disable(conn)
+            return "OK"
+        if args[0].upper() != b"ON":
+            return {"error": "syntax error"}
+        prefixes, bcast, optin, optout, redirect = [], False, False, False, None
+        options = args[1:]
+        while options:
+            option = options.pop(0).upper()
+            if option == b"BCAST":
+                bcast = True
+            elif option == b"OPTIN":
+                optin = True
+            elif option == b"OPTOUT":
+                optout = True
+            elif option == b"PREFIX":
+                prefixes.append(options.pop(0))
+            elif option == b"REDIRECT":
+                redirect = int(options.pop(0))
+                if redirect not in self.clients:
+                    return {"error": "The client ID you want redirect to does not exist"}
+            else:
+                return {"error": "syntax error"}
+        if optin and optout:
+            return {"error": "You can't use both OPTIN and OPTOUT"}
+        if prefixes and not bcast:
+            return {"error": "PREFIX option requires BCAST mode to be enabled"}
+        if bcast and (optin or optout):
+            return {"error": "OPTIN and OPTOUT are not compatible with BCAST"}
+        if conn.protocol != 3 and redirect is None:
+            return {
+                "error": "Tracking without REDIRECT requires RESP3, use HELLO 3 first"
+            }
+        self.tracking.disable(conn)
+        conn.tracking_bcast, conn.tracking_optin, conn.tracking_optout = (
+            bcast,
+            optin,
+            optout,
+        )
+        conn.tracking_redirect = redirect
+        self.tracking.enable(conn, prefixes)
+        return "OK"
+
     async def _info(self, args, **kwargs):
-        if args[0].lower() == "replication":
+        section = args[0].decode().lower() if args else "all"
+        if section == "replication":
             rep = self.config.replication.view_info()
             return rep
+        if section == "keyspace":
+            return self.keyspace_info()
+        if section == "clients":
+            return self.clients_info()
+        if section == "memory":
+            return self.memory_info()
+        if section == "persistence":
+            return self.loading.info()
+        if section == "stats":
+            return self.stats_info()
+        if section == "cluster":
+            return self.cluster_info()
+        if section in ("all", "default", "everything"):
+            return (
+                self.config.replication.view_info()
+                + self.clients_info()
+                + self.memory_info()
+                + self.loading.info()
+                + self.stats_info()
+                + self.cluster_info()
+                + self.keyspace_info()
+            )
+
+    def clients_info(self) -> str:
+        """`INFO clients`, buffer peaks are those of the clients connected now."""
+        clients = self.clients.values()
+        max_input = max((len(conn.query_buffer) for conn in clients), default=0)
+        max_output = max((conn.output_buffer_size() for conn in clients), default=0)
+        paused = ("all" if self.pause_all else "write") if self.pause_end else "none"
+        return (
+            f"connected_clients:{len(self.clients)}\r\n"
+            f"maxclients:{self.config.maxclients}\r\n"
+            f"client_recent_max_input_buffer:{max_input}\r\n"
+            f"client_recent_max_output_buffer:{max_output}\r\n"
+            f"pubsub_clients:{sum(1 for conn in clients if conn.subscriptions)}\r\n"
+            f"watching_clients:{sum(1 for conn in clients if conn.watched)}\r\n"
+            f"tracking_clients:{sum(1 for conn in clients if conn.tracking)}\r\n"
+            f"paused_actions:{paused}\r\n"
+        )
+
+    def memory_info(self) -> str:
+        return (
+            f"lazyfree_pending_objects:{len(self.lazyfree.pending)}\r\n"
+            f"lazyfreed_objects:{self.lazyfree.freed_objects}\r\n"
+        )
+
+    def stats_info(self) -> str:
+        stats = self.stats
+        net_in = stats.net_input_bytes + sum(c.net_in for c in self.clients.values())
+        net_out = stats.net_output_bytes + sum(c.net_out for c in self.clients.values())
+        return (
+            f"total_connections_received:{stats.connections_received}\r\n"
+            f"total_commands_processed:{stats.commands_processed}\r\n"
+            f"instantaneous_ops_per_sec:{int(stats.ops_per_sec)}\r\n"
+            f"rejected_connections:{stats.rejected_connections}\r\n"
+            f"total_net_input_bytes:{net_in}\r\n"
+            f"total_net_output_bytes:{net_out}\r\n"
+            f"expired_keys:{sum(store.expired_keys for store in self.databases)}\r\n"
+        )
+
+    def cluster_info(self) -> str:
+        return f"cluster_enabled:{int(self.cluster is not None)}\r\n"
+
+    def keyspace_info(self) -> str:
+        """`INFO keyspace`: key and expire counts of every non empty database."""
+        lines = [
+            f"db{index}:keys={store.dbsize()},expires={len(store.expires)}\r\n"
+            for index, store in enumerate(self.databases)
+            if store.dbsize()
+        ]
+        return "".join(lines)
+
+    async def _debug(self, args, **kwargs):
+        """
+        DEBUG PROFILE START [CPROFILE | SAMPLE [interval ms]] | STOP | DUMP [path]
+        (path is relative to `dir`)
+        DEBUG MEMPROFILE START [frames] | SNAPSHOT | DIFF | STOP
+        """
+        subcommand = command_name(args[0])
+        action = command_name(args[1]) if len(args) > 1 else None
+        options = args[2:]
+        if subcommand == "PROFILE":
+            if action == "START":
+                mode = options[0].decode().lower() if options else "cprofile"
+                interval = int(options[1]) / 1000 if len(options) > 1 else 0.01
+                return self.profiler.start(mode, interval)
+            elif action == "STOP":
+                return self.profiler.stop()
+            elif action == "DUMP":
+                path = options[0].decode() if options else None
+                return self.profiler.dump(path, self.config.dir)
+        elif subcommand == "MEMPROFILE":
+            if action == "START":
+                return self.memprofiler.start(int(options[0]) if options else 1)
+            elif action == "SNAPSHOT":
+                return self.memprofiler.snapshot()
+            elif action == "DIFF":
+                return self.memprofiler.diff()
+            elif action == "STOP":
+                return self.memprofiler.stop()
+        return {"error": f"unknown subcommand '{args[0].decode(errors='replace')}'"}
+
+    def cluster_redirect(self, cmd: str, args: list, conn: Connection) -> dict | None:
+        """The redirect for a command on keys this node doesn't serve, if any."""
+        # The replication stream applies whatever the master accepted
+        if self.config.replication.role != "master" or cmd not in self.cmds:
+            return None
+        keys = self.command_keys(cmd, args)
+        if not keys:
+            return None
+        asking = conn.asking or cmd == "RESTORE-ASKING"
+        return self.cluster.route(keys, self.keyspace(conn), asking)
+
+    async def _cluster(self, args, **kwargs):
+        """
+        CLUSTER INFO | MYID | NODES | SLOTS | SHARDS
+        CLUSTER KEYSLOT key | COUNTKEYSINSLOT slot | GETKEYSINSLOT slot count
+        CLUSTER MEET ip port | FORGET node-id
+        CLUSTER ADDSLOTS slot... | ADDSLOTSRANGE start end... | DELSLOTS slot...
+        CLUSTER DELSLOTSRANGE start end...
+        CLUSTER SETSLOT slot IMPORTING|MIGRATING|NODE node-id | STABLE
+        """
+        cluster = self.cluster
+        if cluster is None:
+            return {"error": "This instance has cluster support disabled"}
+        subcommand = command_name(args[0])
+        options = args[1:]
+        store = self.databases[0]
+        try:
+            if subcommand == "INFO":
+                return cluster.info()
+            elif subcommand == "MYID":
+                return cluster.myself.id
+            elif subcommand == "NODES":
+                return cluster.nodes_info()
+            elif subcommand == "SLOTS":
+                return cluster.slots_info()
+            elif subcommand == "SHARDS":
+                return cluster.shards_info()
+            elif subcommand == "KEYSLOT":
+                return key_slot(options[0])
+            elif subcommand == "COUNTKEYSINSLOT":
+                return store.count_keys_in_slot(slot_number(options[0]))
+            elif subcommand == "GETKEYSINSLOT":
+                return store.keys_in_slot(slot_number(options[0]), int(options[1]))
+            elif subcommand == "MEET":
+                return cluster.meet(options[0].decode(), int(options[1]))
+            elif subcommand == "FORGET":
+                return cluster.forget(options[0].decode())
+            elif subcommand in ("ADDSLOTS", "DELSLOTS"):
+                slots = [slot_number(option) for option in options]
+            elif subcommand in ("ADDSLOTSRANGE", "DELSLOTSRANGE"):
+                if not options or len(options) % 2:
+                    return {"error": "wrong number of arguments"}
+                slots = []
+                for start, end in zip(options[::2], options[1::2]):
+                    slots.extend(range(slot_number(start), slot_number(end) + 1))
+            elif subcommand == "SETSLOT":
+                node_id = options[2].decode() if len(options) > 2 else None
+                action = command_name(options[1])
+                return cluster.set_slot(slot_number(options[0]), action, node_id, store)
+            else:
+                return {
+                    "error": f"unknown subcommand '{args[0].decode(errors='replace')}'"
+                }
+        except ValueError as e:
+            return {"error": str(e)}
+        except IndexError:
+            return {"error": "wrong number of arguments"}
+        if subcommand.startswith("ADD"):
+            return cluster.add_slots(slots)
+        return cluster.del_slots(slots)
+
+    async def _asking(self, args, conn: Connection = None, **kwargs):
+        if self.cluster is None:
+            return {"error": "This instance has cluster support disabled"}
+        conn.asking = True
+        return "OK"
+
+    async def _dump(self, args, conn: Connection = None, **kwargs):
+        store = self.keyspace(conn)
+        value = store.get(args[0])
+        if value is None:
+            if args[0] in store.stream:
+                return {"error": "DUMP of streams is not supported"}
+            return None
+        return await self.dump_payload(value, kwargs.get("in_exec"))
+
+    async def dump_payload(self, value, in_exec: bool = False) -> bytes:
+        if isinstance(value, RedisSet) and self.heavy(len(value), in_exec):
+            return await self.offload.run(dump_value, value.copy())
+        return dump_value(value)
+
+    async def _restore(self, args, conn: Connection = None, **kwargs):
+        """RESTORE key ttl payload [REPLACE] [ABSTTL], RESTORE-ASKING alike."""
+        key, ttl, payload = args[0], int(args[1]), args[2]
+        options = {command_name(option) for option in args[3:]}
+        store = self.keyspace(conn)
+        if len(payload) >= RDB_OFFLOAD_BYTES and not kwargs.get("in_exec"):
+            value = await self.offload.run(load_dump, payload)
+        else:
+            value = load_dump(payload)
+        if value is None:
+            return {"error": "DUMP payload version or checksum are wrong"}
+        if store.exists(key) and "REPLACE" not in options:
+            return {"error": "BUSYKEY Target key name already exists."}
+        if ttl < 0:
+            return {"error": "Invalid TTL value, must be >= 0"}
+        expire_time = None
+        if ttl:
+            expire_time = ttl / 1000
+            if "ABSTTL" not in options:
+                expire_time += time.time()
+        old = store.remove(key)
+        if old is not None:
+            self.lazyfree.free(old)
+        store.restore(key, value, expire_time)
+        store.touch(key)
+        return "OK"
+
+    async def _migrate(self, args, conn: Connection = None, **kwargs):
+        """
+        MIGRATE host port key|"" destination-db timeout [COPY] [REPLACE] [KEYS key...]
+
+        The keys are sent as RESTORE-ASKING commands pipelined on one connection,
+        and other clients are served while the target answers. A key written in
+        the meantime is kept here (its WATCH version tells), the next MIGRATE
+        of its slot moves it again.
+        """
+        host, port = args[0].decode(), int(args[1])
+        db, timeout = int(args[3]), int(args[4]) / 1000
+        index = self.check_index(b"KEYS", args[5:])
+        if index is None:
+            flags, keys = args[5:], args[2:3]
+        else:
+            flags, keys = args[5 : index + 5], args[index + 6 :]
+        flags = {command_name(flag) for flag in flags}
+        store = self.keyspace(conn)
+
+        entries = []  # (key, version, command)
+        try:
+            for key in keys:
+                value = store.get(key)
+                if value is None:
+                    if key in store.stream:
+                        return {"error": "MIGRATE of streams is not supported"}
+                    continue
+                version = store.watch(key)
+                expire_time = store.expires.get(key)
+                ttl = 0
+                if expire_time is not None:
+                    ttl = max(int((expire_time - time.time()) * 1000), 1)
+                command = ["RESTORE-ASKING", key, ttl, await self.dump_payload(value)]
+                if "REPLACE" in flags:
+                    command.append("REPLACE")
+                entries.append((key, version, command))
+            if not entries:
+                return "NOKEY"
+
+            client = self.migrate_links.get(f"{host}:{port}")
+            if client is None:
+                client = self.migrate_links[f"{host}:{port}"] = Redis(host, port, 4)
+            try:
+                async with client.connection() as target:
+                    commands = [["SELECT", db]] + [entry[2] for entry in entries]
+                    futures = [target.send(*command) for command in commands]
+                    replies = await asyncio.wait_for(asyncio.gather(*futures), timeout)
+            except (OSError, asyncio.TimeoutError):
+                return {"error": "IOERR error or timeout writing to target instance"}
+
+            moved, error = [], None
+            for (key, version, _), reply in zip(entries, replies[1:]):
+                if isinstance(reply, ReplyError):
+                    error = error or {
+                        "error": f"Target instance replied with error: {reply}"
+                    }
+                elif "COPY" not in flags and not store.is_dirty(key, version):
+                    self.lazyfree.free(store.remove(key))
+                    moved.append(key)
+        finally:
+            for key, _, _ in entries:
+                store.unwatch(key)
+        if moved:
+            await self.propagate_batch([(conn.db if conn else 0, ["DEL", *moved])])
+        return error or "OK"
+
+    async def _object(self, args, conn: Connection = None, **kwargs):
+        subcommand = command_name(args[0])
+        if subcommand != "FREQ":
+            return {
+                "error": f"unknown subcommand '{args[0].decode(errors='replace')}'"
+            }
+        if len(args) != 2:
+            return {"error": "wrong number of arguments for 'object|freq' command"}
+        return self.keyspace(conn).object_freq(args[1])
+
+    async def _memory(self, args, conn: Connection = None, **kwargs):
+        """MEMORY USAGE key [SAMPLES count], the estimate BIGKEYS ranks keys by."""
+        if command_name(args[0]) != "USAGE" or len(args) not in (2, 4):
+            return {"error": "syntax error"}
+        samples = keystats.MEMORY_SAMPLES
+        if len(args) == 4:
+            if command_name(args[2]) != "SAMPLES":
+                return {"error": "syntax error"}
+            try:
+                samples = int(args[3])
+            except ValueError:
+                return {"error": "value is not an integer or out of range"}
+            if samples < 0:
+                return {"error": "value is out of range, must be positive"}
+        store = self.keyspace(conn)
+        key = args[1]
+        value = store.stream.get(key)
+        if value is None:
+            value = store.get(key)
+            if value is None:
+                return None
+        if samples == 0:
+            samples = len(value)  # 0 means every element, as in Redis
+        return keystats.memory_usage(key, value, samples)
+
+    async def _hotkeys(self, args, **kwargs):
+        """
+        HOTKEYS [COUNT count] | HOTKEYS RESET
+
+        The most accessed keys since the last reset, as [key, db, accesses,
+        percentage of all key accesses], hottest first.
+        """
+        if args and command_name(args[0]) == "RESET":
+            self.hotkeys.reset()
+            return "OK"
+        count = 10
+        if args:
+            if len(args) != 2 or command_name(args[0]) != "COUNT":
+                return {"error": "syntax error"}
+            try:
+                count = int(args[1])
+            except ValueError:
+                return {"error": "value is not an integer or out of range"}
+        total = self.hotkeys.total or 1
+        return [
+            [key, db, accesses, b"%.2f" % (accesses * 100 / total)]
+            for db, key, accesses in self.hotkeys.top(count)
+        ]
+
+    async def _bigkeys(self, args, conn: Connection = None, in_exec=False, **kwargs):
+        """
+        BIGKEYS [COUNT count] [SAMPLES count]
+
+        Scans the selected database in small batches and replies, per type, with
+        the number of keys, elements (bytes for strings) and estimated memory,
+        and the `count` biggest keys as [key, memory, elements].
+        """
+        count, samples = 5, keystats.MEMORY_SAMPLES
+        try:
+            for i in range(0, len(args), 2):
+                option = command_name(args[i])
+                if option == "COUNT":
+                    count = int(args[i + 1])
+                elif option == "SAMPLES":
+                    samples = int(args[i + 1])
+                else:
+                    return {"error": "syntax error"}
+        except IndexError:
+            return {"error": "syntax error"}
+        except ValueError:
+            return {"error": "value is not an integer or out of range"}
+        store = self.keyspace(conn)
+        # A transaction must not let other clients in, it scans in one go
+        batch = max(store.dbsize(), 1) if in_exec else keystats.BIGKEYS_BATCH
+        types = await keystats.scan_big_keys(store, count, batch, samples)
+        # Type names as bytes, a str like "string" would go as a simple string
+        return RespMap(
+            (
+                name.encode(),
+                RespMap(
+                    keys=stats["keys"],
+                    elements=stats["elements"],
+                    memory=stats["memory"],
+                    biggest=[
+                        [key, memory, elements]
+                        for memory, key, elements in stats["biggest"]
+                    ],
+                ),
+            )
+            for name, stats in types.items()
+        )
 
     async def _replconf(self, args, **kwargs):
-        if args[0].lower() == "listening-port":
+        subcommand = command_name(args[0])
+        if subcommand == "LISTENING-PORT":
             writer = kwargs["writer"]
             reader = kwargs["reader"]
             client = writer.get_extra_info("peername")
-            print(f"Client {client} connected")
-            await self.create_replica(client, reader, writer)
+            logging.log(NOTICE, "Replica %s:%s asks for synchronization", *client)
+            await self.create_replica(
+                client, reader, writer, kwargs.get("conn"), int(args[1])
+            )
 
-        elif args[0].lower() == "getack":
+        elif subcommand == "GETACK":
+            # The replica's offset counts bytes applied before this GETACK
             offset = self.config.replication.master_repl_offset
-            print("Command Offset : ", offset)
-            if self.config.replication.role == "slave":
-                self.config.replication.master_repl_offset += 37
             return ["REPLCONF", "ACK", str(offset)]
-        elif args[0].lower() == "ack":
-            self.updated_replicas = 0
-            for slave in self.config.replication._slaves_list:
-                print(
-                    f"Sende_Bytes to {slave.host}:{slave.port} : ",
-                    self.config.replication.master_repl_offset,
-                )
-                if int(args[1]) >= (
-                    int(self.config.replication.master_repl_offset) - 37
-                ):
-                    self.updated_replicas += 1
-                print(f"Recived_Bytes from {slave.host}:{slave.port} : ", args[1])
-            async with self.replica_offset:
-                self.replica_offset.notify_all()
-            return "None"
+        elif subcommand == "ACK":
+            slave = self.config.replication.find_slave(kwargs.get("conn"))
+            if slave is not None:
+                slave.ack_offset = max(slave.ack_offset, int(args[1]))
+                slave.ack_time = time.time()
+                self.resolve_ack_waiters()
+            return NO_REPLY
         return "OK"
 
     async def _psync(self, args, **kwargs):
-        response = RedisProtocolParser.simple_string(
-            self.config.replication.psync(), encode=True
-        )
-        empty_rdb = self.config.replication.empty_rdb()
-        ack = b"*3\r\n$8\r\nreplconf\r\n$6\r\ngetack\r\n$1\r\n*\r\n"
-
-        return (response.encode("utf-8"), empty_rdb)
+        # Always a full resync, +FULLRESYNC and the RDB are sent by DisklessSync
+        conn = kwargs.get("conn")
+        replica = self.config.replication.find_slave(conn)
+        if replica is None:
+            writer = kwargs["writer"]
+            replica = await self.create_replica(
+                writer.get_extra_info("peername"), kwargs["reader"], writer, conn
+            )
+        self.full_sync.request(replica)
+        return NO_REPLY
 
     async def _wait(self, args, **kwargs):
+        if self.config.replication.role == "slave":
+            return {"error": "WAIT cannot be used with replica instances."}
         numreplicas = int(args[0])
         timeout = int(args[1]) / 1000
-        total_replicas = len(self.config.replication._slaves_list)
-        if self.config.replication.master_repl_offset == 0:
-            return total_replicas
-        else:
-            try:
-                await asyncio.wait_for(
-                    self.wait_for_replicas(numreplicas, timeout), timeout
-                )
-                if self.updated_replicas >= numreplicas:
-                    return numreplicas
-            except TimeoutError:
-                print("TimeoutError")
-                pass
-            except Exception as e:
-                print(e)
-                print(traceback.print_tb(e.__traceback__))
-                logging.error(traceback.print_tb(e.__traceback__))
-        return self.updated_replicas
+        replication = self.config.replication
+        target = replication.master_repl_offset
+        acked = replication.count_acked(target)
+        if acked >= numreplicas or kwargs.get("in_exec"):
+            return acked
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (target, numreplicas, waiter)
+        self.ack_waiters.append(entry)
+        self.schedule_getack()
+        try:
+            return await asyncio.wait_for(waiter, timeout or None)
+        except asyncio.TimeoutError:
+            return replication.count_acked(target)
+        finally:
+            if entry in self.ack_waiters:
+                self.ack_waiters.remove(entry)
 
     async def call_cmd(self, data, **kwargs):
         keyword, *args = data
-        cmd = keyword.upper()
+        cmd = command_name(keyword)
+        conn: Connection = kwargs.get("conn")
         try:
+            if self.loading.active and cmd not in self.LOADING_CMDS:
+                return {"error": "LOADING Redis is loading the dataset in memory"}
+            if conn is not None and conn.subscriptions:
+                if cmd not in self.SUBSCRIBED_CMDS:
+                    return {
+                        "error": f"Can't execute '{cmd.lower()}': only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING / QUIT are allowed in this context"
+                    }
+            if self.cluster is not None and conn is not None:
+                redirect = self.cluster_redirect(cmd, args, conn)
+                if cmd != "ASKING":
+                    conn.asking = False
+                if redirect is not None:
+                    return redirect
+            if conn is not None and conn.in_multi and cmd not in self.TRANSACTION_CMDS:
+                if cmd not in self.cmds:
+                    conn.multi_error = True
+                    return {"error": f"unknown command '{cmd.lower()}'"}
+                conn.queued.append(data)
+                return SimpleString("QUEUED")
             if cmd in self.cmds:
-                response = await self.cmds[cmd](args, **kwargs)
-                await self.start_propagation(data)
+                if self.pause_end and conn is not None:
+                    while self.pause_end and self.pause_applies(cmd, data, conn):
+                        await self.unpaused.wait()
+                self.stats.commands_processed += 1
+                if conn is not None:
+                    conn.last_command = cmd
+                    conn.commands += 1
+                read_keys = None
+                if conn is not None and conn.tracking and cmd in self.READ_CMDS:
+                    read_keys = self.read_keys(cmd, args)
+                response = await self.cmds[cmd](args, command=data, **kwargs)
+                self.record_access(cmd, args, conn)
+                if conn is not None and conn.tracking:
+                    if read_keys:
+                        self.tracking.record_read(conn, read_keys)
+                    if cmd != "CLIENT":
+                        conn.caching = None
+                await self.start_propagation(data, conn.db if conn else 0)
                 return response
             else:
-                print("Command not found...")
-        except Exception as e:
-            print(e)
-            print(traceback.print_tb(e.__traceback__))
+                logging.debug("Unknown command %r", keyword)
+        except Exception:
+            logging.exception("Error running %s", cmd)
             return None
 
-    async def create_replica(self, client, reader, writer):
+    async def create_replica(
+        self, client, reader, writer, conn=None, listening_port: int = None
+    ) -> Replica:
+        if conn is not None:
+            conn.is_replica = True
         replica = Replica(
             host=client[0],
             port=client[1],
             reader=reader,
             writer=writer,
             buffer_queue=asyncio.Queue(),
+            conn=conn,
+            listening_port=listening_port or client[1],
         )
         self.config.replication.add_slave(replica)
+        return replica
+
+    async def start_propagation(self, command, db: int = 0):
+        # A replica's offset is advanced by the replication stream reader instead
+        if self.config.replication.role != "master" or not command:
+            return
+        writes = [(db, write) for write in self.replicated(command)]
+        if len(writes) > 1:
+            # Replaced by several effects, applied as one transaction
+            writes = [(None, ["MULTI"]), *writes, (None, ["EXEC"])]
+        if writes:
+            await self.propagate_batch(writes)
+
+    def replicated(self, command: list) -> list[list]:
+        """
+        The commands a replica is sent for `command` once it ran.
+
+        Handlers whose effect a replica could not reproduce by running the same
+        command, because it depends on the clock (XREADGROUP, XCLAIM), replace
+        it in place with the list of commands that replay the effect, possibly
+        none. Those are all sent, other commands only if they write.
+        """
+        if command and isinstance(command[0], list):
+            return command
+        return [command] if command and self.is_writable(command) else []
+
+    async def propagate_batch(self, commands: list[tuple[int | None, list]]) -> None:
+        """
+        Propagate several `(db, command)` pairs as one contiguous buffer.
+
+        Each replica gets a single write, so it never sees part of the batch.
+        """
+        if self.config.replication.role != "master":
+            return
+        data = self.replication_stream(commands)
+        self.calculate_bytes(data)
+        for slave in list(self.config.replication._slaves_list):
+            await self.propagate_to_slave(slave, data)
 
-    async def start_propagation(self, command):
-        data = RedisProtocolParser().encoder(command)
-        if self.is_writable(command):
-            self.calculate_bytes(data)
-            if self.config.replication.role == "master":
-                # self.config.replication.master_repl_offset += len(data)
-                for slave in self.config.replication._slaves_list:
-                    print("Start Propagation")
-                    await self.propagate_to_slave(slave, data)
+    def replication_stream(self, commands: list[tuple[int | None, list]]) -> bytes:
+        """
+        Encode `(db, command)` pairs, adding a SELECT whenever a command runs in
+        another database than the previous one. `db` is None for MULTI, EXEC and
+        the commands that are not bound to a database.
+        """
+        replication = self.config.replication
+        encoder = RedisProtocolParser().encoder
+        chunks = []
+        for db, command in commands:
+            if command_name(command[0]) in self.ANY_DB_CMDS:
+                db = None
+            if db is not None and db != replication.selected_db:
+                chunks.append(encoder(["SELECT", str(db)]))
+                replication.selected_db = db
+            chunks.append(encoder(command))
+        return b"".join(chunks)
 
     async def propagate_to_slave(self, replica: Replica, data) -> None:
-        # data = await replica.buffer_queue.get()
-        print(f" DATA : {data}")
         try:
-            replica.writer.write(data)
-            replica.send_bytes += len(data)
-            await replica.writer.drain()
-        except Exception as e:
-            print(e)
-            print(traceback.print_tb(e.__traceback__))
-
-    async def request_replica_offset(self):
-        cmd = ["REPLCONF", "GETACK", "*"]
-        data = RedisProtocolParser().encoder(cmd)
-        for slave in self.config.replication._slaves_list:
-            # print("Sende_Bytes : ", slave.send_bytes)
-            slave.writer.write(data)
-            await slave.writer.drain()
-        self.config.replication.master_repl_offset += len(data)
+            self.feed_replica(replica, data)
+        except Exception:
+            logging.exception("Error feeding replica %s", replica.host)
 
-    async def wait_for_replicas(self, numreplicas: int, timeout: float) -> None:
-        # while True:
-        if self.updated_replicas >= numreplicas:
-            print("All slaves connected")
+    def feed_replica(self, replica: Replica, data: bytes) -> None:
+        if replica.state == "send_bulk":
+            # Held back until the snapshot has been sent, see DisklessSync
+            replica.sync_buffer += data
+            hard_limit = self.config.client_output_buffer_limit["replica"][0]
+            if hard_limit and len(replica.sync_buffer) > hard_limit:
+                logging.warning(
+                    "Replica %s closed for output buffer limits", replica.host
+                )
+                replica.conn.writer.transport.abort()
+                self.config.replication.remove_slave(replica)
+            return
+        if replica.state != "online":
+            # Not synced yet, the snapshot it gets will already include this
             return
-        await self.request_replica_offset()
-        async with self.replica_offset:
-            await self.replica_offset.wait()
-        if self.updated_replicas >= numreplicas:
-            print("All slaves connected")
+        # Not drained: a slow replica only grows its output buffer, up to the
+        # replica class limit, instead of stalling the client that wrote
+        if replica.conn is not None:
+            if not replica.conn.send(data):
+                self.config.replication.remove_slave(replica)
+                return
+        else:
+            replica.writer.write(data)
+        replica.send_bytes += len(data)
+
+    def schedule_getack(self) -> None:
+        """
+        Ask replicas for their offset once the current loop iteration is done,
+        so all WAITs issued meanwhile share a single GETACK round.
+        """
+        if not self.getack_scheduled:
+            self.getack_scheduled = True
+            asyncio.get_running_loop().call_soon(self.send_getack)
+
+    def send_getack(self) -> None:
+        self.getack_scheduled = False
+        slaves = self.config.replication._slaves_list
+        if not slaves:
             return
-        await asyncio.sleep(timeout)
+        data = RedisProtocolParser().encoder(["REPLCONF", "GETACK", "*"])
+        for slave in list(slaves):
+            self.feed_replica(slave, data)
+        self.config.replication.master_repl_offset += len(data)
+
+    def resolve_ack_waiters(self) -> None:
+        """Wake the WAIT callers whose target offset enough replicas have reached."""
+        replication = self.config.replication
+        for target, numreplicas, waiter in list(self.ack_waiters):
+            if waiter.done():
+                continue
+            acked = replication.count_acked(target)
+            if acked >= numreplicas:
+                waiter.set_result(acked)
 
     def calculate_bytes(self, data: bytes) -> int:
-        print(f"Current offset : {self.config.replication.master_repl_offset}")
         self.config.replication.master_repl_offset += len(data)
-        print(f"New offset : {self.config.replication.master_repl_offset}")
+
+    @staticmethod
+    def read_keys(cmd: str, args: list) -> list:
+        """Keys read by a command in READ_CMDS, recorded for CLIENT TRACKING."""
+        if cmd in ("SINTER", "SUNION", "SDIFF", "PFCOUNT"):
+            return list(args)
+        if cmd == "SINTERCARD":
+            return args[1 : int(args[0]) + 1]
+        return args[:1]
+
+    def record_access(self, cmd: str, args: list, conn: Connection | None) -> None:
+        """
+        Count the keys of a command for OBJECT FREQ and HOTKEYS, for one command
+        in `key_stats_sample_ratio` picked at random, each weighing the ratio.
+        """
+        ratio = self.config.key_stats_sample_ratio
+        if not ratio or (ratio > 1 and random.random() * ratio >= 1):
+            return
+        if cmd in self.NOTOUCH_CMDS:
+            return
+        try:
+            keys = self.command_keys(cmd, args)
+        except (ValueError, IndexError):
+            return
+        if not keys:
+            return
+        db = conn.db if conn is not None else 0
+        store = self.databases[db]
+        for key in keys:
+            store.record_access(key, ratio)
+            self.hotkeys.record(db, key, ratio)
+
+    def command_keys(self, cmd: str, args: list) -> list:
+        """Keys a command works on, every one must be in a slot this node serves."""
+        if cmd in self.SINGLE_KEY_CMDS:
+            return args[:1]
+        if cmd in self.MULTI_KEY_CMDS:
+            return list(args)
+        if cmd == "SINTERCARD":
+            return args[1 : int(args[0]) + 1]
+        if cmd == "BITOP":
+            return args[1:]
+        if cmd in ("OBJECT", "MEMORY"):
+            return args[1:2]
+        if cmd == "XGROUP" and len(args) > 1:
+            return args[1:2]
+        if cmd in ("XREAD", "XREADGROUP"):
+            index = self.check_index(b"STREAMS", args)
+            streams = args[index + 1 :] if index is not None else []
+            return streams[: len(streams) // 2]
+        if cmd == "MIGRATE":
+            index = self.check_index(b"KEYS", args[5:])
+            return args[index + 6 :] if index is not None else args[2:3]
+        return []
+
+    @staticmethod
+    def as_set(response):
+        if isinstance(response, list):
+            return RespSet(response)
+        return response
 
     @staticmethod
     def check_index(keyword, array):
@@ -266,19 +2003,40 @@ class CommandHandler:
             "INCRBY",
             "DECRBY",
             "APPEND",
+            "SETRANGE",
+            "GETDEL",
+            "GETEX",
             "SETBIT",
+            "BITOP",
+            "BITFIELD",
             "SETEX",
             "MSET",
             "MSETNX",
             "HSET",
             "HSETNX",
             "HMSET",
+            "SADD",
+            "SREM",
+            "PFADD",
+            "PFMERGE",
+            "XADD",
+            "XTRIM",
+            "XDEL",
+            "XGROUP",
+            "XCLAIM",
+            "XACK",
+            "RESTORE",
+            "RESTORE-ASKING",
+            "UNLINK",
+            "SWAPDB",
+            "FLUSHDB",
+            "FLUSHALL",
         ]
         try:
-            res = cmd[0].upper() in writable_cmd
+            res = command_name(cmd[0]) in writable_cmd
             return res
-        except AttributeError:
+        except TypeError:
             res = []
             for i in cmd:
-                res.append(i[0].upper() in writable_cmd)
+                res.append(command_name(i[0]) in writable_cmd)
             return all(res)
@@ -1,5 +1,54 @@
 import asyncio
-from dataclasses import dataclass, asdict, field
+import time
+from dataclasses import dataclass, field
+
+from .logger import set_level
+
+MEMORY_UNITS = {
+    "k": 1000,
+    "kb": 1024,
+    "m": 1000**2,
+    "mb": 1024**2,
+    "g": 1000**3,
+    "gb": 1024**3,
+}
+
+# Settings fixed at startup, the server is built around their value
+IMMUTABLE_SETTINGS = {"databases", "cluster_enabled"}
+
+
+def parse_memory(value: str | int) -> int:
+    """Parse a memory amount like `64mb` or `1gb` into bytes."""
+    value = str(value).strip().lower()
+    for unit in sorted(MEMORY_UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(value[: -len(unit)]) * MEMORY_UNITS[unit]
+    return int(value)
+
+
+def parse_integer(value: str | int) -> int:
+    """An integer setting, memory units like `64mb` are accepted."""
+    try:
+        return parse_memory(value)
+    except ValueError:
+        raise ValueError("argument couldn't be parsed into an integer") from None
+
+
+def parse_bool(value: str | bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    if value.lower() not in ("yes", "no"):
+        raise ValueError("argument must be 'yes' or 'no'")
+    return value.lower() == "yes"
+
+
+def default_output_buffer_limits() -> dict[str, list[int]]:
+    # class -> [hard limit bytes, soft limit bytes, soft limit seconds], 0 disables
+    return {
+        "normal": [0, 0, 0],
+        "replica": [256 * 1024**2, 64 * 1024**2, 60],
+        "pubsub": [32 * 1024**2, 8 * 1024**2, 60],
+    }
 
 
 @dataclass
@@ -10,6 +59,13 @@ class Replica:
     writer: asyncio.StreamWriter = None
     buffer_queue: asyncio.Queue = field(default_factory=asyncio.Queue)
     send_bytes: int = 0
+    conn: "Connection" = None
+    listening_port: int = None
+    ack_offset: int = 0  # replication offset last acknowledged with REPLCONF ACK
+    ack_time: float = field(default_factory=time.time)
+    # handshake -> wait_bgsave (PSYNC received) -> send_bulk (RDB being sent) -> online
+    state: str = "handshake"
+    sync_buffer: bytearray = field(default_factory=bytearray)
 
 
 @dataclass(kw_only=True)
@@ -19,10 +75,23 @@ class ReplicationConfig:
     master_replid: str = "8371b4fb1155b71f4a04d3e1bc3e18c4a990aeeb"
     master_repl_offset: int = 0
     _slaves_list: list[Replica] = field(default_factory=list)
+    # Database the replication stream last SELECTed, -1 forces a SELECT
+    selected_db: int = -1
     _connected_slaves: int = 0
 
     def view_info(self) -> str:
-        key_value_pairs = asdict(self)
+        key_value_pairs = {
+            "role": self.role,
+            "connected_slaves": self.connected_slaves,
+        }
+        now = time.time()
+        for i, slave in enumerate(self._slaves_list):
+            key_value_pairs[f"slave{i}"] = (
+                f"ip={slave.host},port={slave.listening_port},state={slave.state},"
+                f"offset={slave.ack_offset},lag={int(now - slave.ack_time)}"
+            )
+        key_value_pairs["master_replid"] = self.master_replid
+        key_value_pairs["master_repl_offset"] = self.master_repl_offset
         response = "\r\n".join(
             [f"{key}:{value}" for key, value in key_value_pairs.items()]
         )
@@ -40,6 +109,21 @@ class ReplicationConfig:
         self._slaves_list.append(slave)
         self.connected_slaves = len(self._slaves_list)
 
+    def find_slave(self, conn) -> Replica | None:
+        for slave in self._slaves_list:
+            if slave.conn is conn:
+                return slave
+        return None
+
+    def count_acked(self, offset: int) -> int:
+        """Number of replicas that acknowledged at least `offset`."""
+        return sum(1 for slave in self._slaves_list if slave.ack_offset >= offset)
+
+    def remove_slave(self, slave: Replica) -> None:
+        if slave in self._slaves_list:
+            self._slaves_list.remove(slave)
+        self.connected_slaves = len(self._slaves_list)
+
     def psync(self) -> str:
         cmd = f"FULLRESYNC {self.master_replid} {self.master_repl_offset}"
         return cmd
@@ -59,6 +143,40 @@ class ServerConfiguration:
     dir: str
     dbfilename: str
     db_path: str = None
+    databases: int = 16
+    set_max_intset_entries: int = 512
+    # Sparse HyperLogLogs bigger than this are converted to the dense encoding
+    hll_sparse_max_bytes: int = 3000
+    tracking_table_max_keys: int = 1_000_000
+    # LFU counters (OBJECT FREQ): how slowly they grow, and the minutes it takes
+    # for one to be decremented when the key is not accessed
+    lfu_log_factor: int = 10
+    lfu_decay_time: int = 1
+    # One command in this many has its keys counted for OBJECT FREQ and HOTKEYS,
+    # weighing as many accesses. 1 counts every command, 0 disables both
+    key_stats_sample_ratio: int = 10
+    stream_node_max_entries: int = 100
+    maxclients: int = 10000
+    timeout: int = 0  # seconds a client may stay idle before it is closed, 0 disables
+    tcp_keepalive: int = 300
+    # Seconds to wait for more replicas before starting a full sync, 0 starts it
+    # right away (replicas sending PSYNC in the same loop iteration still share it)
+    repl_diskless_sync_delay: int = 0
+    repl_diskless_sync_max_replicas: int = 0  # start early once this many wait
+    # Reads and replies over this many elements are handed to the Offloader pools
+    offload_threshold: int = 10_000
+    offload_threads: int = 2
+    metrics_port: int = 0  # port of the Prometheus /metrics listener, 0 disables
+    cluster_enabled: bool = False
+    # Milliseconds without an answer to CLUSTER NODES before a node is flagged fail?
+    cluster_node_timeout: int = 15000
+    loglevel: str = "notice"  # debug, verbose, notice or warning
+    logfile: str = "main.log"  # an empty name logs to stderr
+    # Bytes a client may send without completing a command before it is closed
+    client_query_buffer_limit: int = 1024**3
+    client_output_buffer_limit: dict[str, list[int]] = field(
+        default_factory=default_output_buffer_limits
+    )
 
     replication: list[ReplicationConfig] = field(default_factory=ReplicationConfig)
     slave_tasks: list[asyncio.Task] = field(default_factory=list)
@@ -69,15 +187,64 @@ class ServerConfiguration:
             return self.get_config(new_conf[0])
         elif keyword.upper() == "SET":
             self.set_config(new_conf[0], new_conf[1])
-            return True
+            return "OK"
 
     def get_config(self, key: str):
-        value = getattr(self, key)
-        return [key, value]
+        """The setting as a single bulk string whatever its type, like Redis."""
+        value = getattr(self, key.replace("-", "_"))
+        if key.replace("-", "_") == "client_output_buffer_limit":
+            value = " ".join(
+                f"{name} {' '.join(map(str, limits))}" for name, limits in value.items()
+            )
+        elif isinstance(value, bool):
+            value = "yes" if value else "no"
+        # bytes, a str with spaces would be sent as several elements
+        return [key, str(value).encode()]
 
     def set_config(self, key: str, value: str | int):
+        name, key = key, key.replace("-", "_")
+        if key == "client_output_buffer_limit":
+            self.set_output_buffer_limit(value)
+            return
+        if key == "loglevel":
+            set_level(value)  # applied right away, e.g. to trace requests
+            value = value.lower()
+        current = getattr(self, key, None)
+        try:
+            if key in IMMUTABLE_SETTINGS:
+                raise ValueError("can't set immutable config")
+            # bool first, it is a subclass of int
+            if isinstance(current, bool):
+                value = parse_bool(value)
+            elif isinstance(current, int):
+                value = parse_integer(value)
+        except ValueError as e:
+            raise ValueError(
+                f"CONFIG SET failed (possibly related to argument '{name}') - {e}"
+            ) from None
         setattr(self, key, value)
 
+    def set_output_buffer_limit(self, value: str) -> None:
+        """
+        Parse `<class> <hard> <soft> <seconds>` groups, e.g. `pubsub 32mb 8mb 60`.
+
+        The limits dict is updated in place since connections hold a reference to it.
+        """
+        parts = value.split()
+        if not parts or len(parts) % 4:
+            raise ValueError("Wrong number of arguments in buffer limit configuration")
+        for i in range(0, len(parts), 4):
+            name = parts[i].lower()
+            if name == "slave":
+                name = "replica"
+            if name not in self.client_output_buffer_limit:
+                raise ValueError(f"Invalid client class specified: {parts[i]}")
+            self.client_output_buffer_limit[name] = [
+                parse_memory(parts[i + 1]),
+                parse_memory(parts[i + 2]),
+                int(parts[i + 3]),
+            ]
+
 
 if __name__ == "__main__":
     rep = ReplicationConfig()
@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+
+from .parser_protocol import PartialCommand
+
+_next_id = itertools.count(1).__next__
+
+
+def format_addr(address) -> str:
+    """`host:port` of a socket address, `[host]:port` for IPv6."""
+    if not isinstance(address, tuple):
+        return address or ""
+    host, port = address[:2]
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+@dataclass(eq=False)  # compared and hashed by identity, used in subscriber sets
+class Connection:
+    """Per-connection state kept by `Server.handle_client` for the lifetime of a client."""
+
+    reader: asyncio.StreamReader = None
+    writer: asyncio.StreamWriter = None
+    id: int = field(default_factory=_next_id)
+    protocol: int = 2  # RESP version negotiated with HELLO
+    is_replica: bool = False
+    is_master: bool = False  # the link a replica applies the replication stream from
+    db: int = 0  # index of the database chosen with SELECT
+    # Bytes read from the client that do not form a whole command yet, and the
+    # arguments already parsed from them
+    query_buffer: bytearray = field(default_factory=bytearray)
+    partial: PartialCommand = field(default_factory=PartialCommand)
+
+    # Shared ServerConfiguration.client_output_buffer_limit dict
+    output_limits: dict[str, list[int]] = None
+    soft_limit_since: float | None = None
+    last_interaction: float = field(default_factory=time.monotonic)
+
+    # CLIENT LIST accounting, plain counters bumped as data is read and sent
+    addr: str = ""
+    laddr: str = ""
+    name: bytes = b""  # CLIENT SETNAME
+    created: float = field(default_factory=time.monotonic)
+    last_command: str = "NULL"
+    commands: int = 0
+    net_in: int = 0
+    net_out: int = 0
+    close_after_reply: bool = False  # killed itself, closed once the reply is sent
+
+    # MULTI / EXEC state
+    in_multi: bool = False
+    multi_error: bool = False
+    queued: list[list] = field(default_factory=list)
+    # (Store, key) -> version at WATCH, the Store being the database of the key
+    watched: dict[tuple, int] = field(default_factory=dict)
+
+    # Pub/Sub state, a connection with any subscription only accepts pub/sub commands
+    channels: set[bytes] = field(default_factory=set)
+    patterns: set[bytes] = field(default_factory=set)
+
+    # CLIENT TRACKING state
+    tracking: bool = False
+    tracking_bcast: bool = False
+    tracking_optin: bool = False
+    tracking_optout: bool = False
+    tracking_prefixes: set[bytes] = field(default_factory=set)
+    # Keys whose `TrackingTable.keys` entry holds this connection
+    tracking_keys: set[bytes] = field(default_factory=set)
+    tracking_redirect: int | None = None
+    caching: bool | None = None  # CLIENT CACHING yes/no, applies to the next command
+
+    # Cluster mode: ASKING was sent, the next command may use an importing slot
+    asking: bool = False
+
+    @property
+    def subscriptions(self) -> int:
+        return len(self.channels) + len(self.patterns)
+
+    def reset_multi(self) -> None:
+        self.in_multi = False
+        self.multi_error = False
+        self.queued = []
+
+    @property
+    def client_class(self) -> str:
+        if self.is_master:
+            return "master"
+        if self.is_replica:
+            return "replica"
+        if self.subscriptions:
+            return "pubsub"
+        return "normal"
+
+    def output_buffer_size(self) -> int:
+        transport = self.writer.transport
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    @property
+    def flags(self) -> str:
+        flags = "M" if self.is_master else ""
+        if self.is_replica:
+            flags += "S"
+        if self.subscriptions:
+            flags += "P"
+        if self.in_multi:
+            flags += "x"
+        if self.tracking:
+            flags += "t"
+        return flags or "N"
+
+    def info(self, now: float) -> str:
+        """The CLIENT LIST / CLIENT INFO line, buffers are measured when asked."""
+        omem = self.output_buffer_size()
+        multi_mem = sum(len(arg) for command in self.queued for arg in command)
+        tot_mem = sys.getsizeof(self.query_buffer) + omem + multi_mem
+        return (
+            f"id={self.id} addr={self.addr} laddr={self.laddr} "
+            f"name={self.name.decode()} age={int(now - self.created)} "
+            f"idle={int(now - self.last_interaction)} flags={self.flags} "
+            f"db={self.db} sub={len(self.channels)} psub={len(self.patterns)} "
+            f"multi={len(self.queued) if self.in_multi else -1} "
+            f"watch={len(self.watched)} qbuf={len(self.query_buffer)} "
+            f"multi-mem={multi_mem} omem={omem} tot-mem={tot_mem} "
+            f"cmd={self.last_command.lower()} user=default "
+            f"redir={self.tracking_redirect or -1} resp={self.protocol} "
+            f"tot-net-in={self.net_in} tot-net-out={self.net_out} "
+            f"tot-cmds={self.commands}"
+        )
+
+    def output_buffer_exceeded(self) -> bool:
+        # The master link is limited like a normal client, as in Redis
+        kind = "normal" if self.is_master else self.client_class
+        hard, soft, seconds = self.output_limits[kind]
+        if not hard and not soft:
+            return False
+        size = self.output_buffer_size()
+        if hard and size >= hard:
+            return True
+        if soft and size >= soft:
+            now = time.monotonic()
+            if self.soft_limit_since is None:
+                self.soft_limit_since = now
+            elif now - self.soft_limit_since >= seconds:
+                return True
+        else:
+            self.soft_limit_since = None
+        return False
+
+    def send(self, data: bytes) -> bool:
+        """
+        Queue `data` on the transport without waiting for it to drain.
+
+        Drops the connection when that pushes it over its output buffer limit,
+        returns False if the connection is (now) closed.
+        """
+        if self.writer is None or self.writer.is_closing():
+            return False
+        self.writer.write(data)
+        self.net_out += len(data)
+        if self.output_limits is not None and self.output_buffer_exceeded():
+            logging.warning(
+                "Client id=%d closed for overcoming of output buffer limits "
+                "(%s, %d bytes)",
+                self.id,
+                self.client_class,
+                self.output_buffer_size(),
+            )
+            self.writer.transport.abort()
+            return False
+        return True
@@ -0,0 +1,158 @@
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+
+from .stream import format_id
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+@dataclass(slots=True)
+class PendingEntry:
+    id: tuple[int, int]
+    consumer: "Consumer"
+    delivery_time: int
+    delivery_count: int = 1
+
+
+@dataclass
+class Consumer:
+    name: str
+    seen_time: int = field(default_factory=now_ms)
+    # id -> PendingEntry, the entries delivered to this consumer and not acked yet
+    pending: dict[tuple[int, int], PendingEntry] = field(default_factory=dict)
+
+
+class ConsumerGroup:
+    """
+    State of one XGROUP: last delivered ID, consumers and the pending entries list.
+
+    The PEL is a dict keyed by ID (O(1) XACK) plus an ID ordered array used to
+    answer range queries (XPENDING, XAUTOCLAIM) with a binary search. Acked IDs
+    are left in the array and skipped, the array is compacted once more than
+    half of it is stale, so acking stays O(1) amortized.
+    """
+
+    def __init__(self, name: str, last_delivered: tuple[int, int]):
+        self.name = name
+        self.last_delivered = last_delivered
+        self.consumers: dict[str, Consumer] = {}
+        self.pel: dict[tuple[int, int], PendingEntry] = {}
+        self._pel_ids: list[tuple[int, int]] = []
+
+    def consumer(self, name: str, create: bool = True) -> Consumer | None:
+        consumer = self.consumers.get(name)
+        if consumer is None and create:
+            consumer = self.consumers[name] = Consumer(name)
+        return consumer
+
+    def delete_consumer(self, name: str) -> int:
+        """Remove a consumer and its pending entries, returns how many it had."""
+        consumer = self.consumers.pop(name, None)
+        if consumer is None:
+            return 0
+        for id in consumer.pending:
+            self.pel.pop(id, None)
+        self._maybe_compact()
+        return len(consumer.pending)
+
+    def deliver(self, id: tuple[int, int], consumer: Consumer, time_ms: int) -> None:
+        """Add `id` to the PEL, or re-assign it if it is already pending."""
+        entry = self.pel.get(id)
+        if entry is not None:
+            entry.consumer.pending.pop(id, None)
+            entry.consumer = consumer
+            entry.delivery_time = time_ms
+            entry.delivery_count += 1
+        else:
+            entry = self.pel[id] = PendingEntry(id, consumer, time_ms)
+            if not self._pel_ids or self._pel_ids[-1] < id:
+                self._pel_ids.append(id)
+            else:
+                # Only happens after XGROUP SETID moved the group backwards
+                i = bisect_left(self._pel_ids, id)
+                if i == len(self._pel_ids) or self._pel_ids[i] != id:
+                    insort(self._pel_ids, id)
+        consumer.pending[id] = entry
+
+    def ack(self, id: tuple[int, int]) -> bool:
+        entry = self.pel.pop(id, None)
+        if entry is None:
+            return False
+        entry.consumer.pending.pop(id, None)
+        self._maybe_compact()
+        return True
+
+    def claim(self, entry: PendingEntry, consumer: Consumer, time_ms: int) -> None:
+        entry.consumer.pending.pop(entry.id, None)
+        entry.consumer = consumer
+        entry.delivery_time = time_ms
+        consumer.pending[entry.id] = entry
+
+    def claim_command(self, key: bytes, entry: PendingEntry) -> list:
+        """The XCLAIM ... JUSTID that gives a replica the same pending entry."""
+        return [
+            "XCLAIM",
+            key,
+            self.name,
+            entry.consumer.name,
+            "0",
+            format_id(entry.id),
+            "TIME",
+            str(entry.delivery_time),
+            "RETRYCOUNT",
+            str(entry.delivery_count),
+            "FORCE",
+            "JUSTID",
+            "LASTID",
+            format_id(self.last_delivered),
+        ]
+
+    def restore(self, entry: PendingEntry) -> None:
+        """Add a pending entry read from an RDB file, where they come in ID order."""
+        self.pel[entry.id] = entry.consumer.pending[entry.id] = entry
+        self._pel_ids.append(entry.id)
+
+    def copy(self) -> "ConsumerGroup":
+        clone = ConsumerGroup(self.name, self.last_delivered)
+        for name, consumer in self.consumers.items():
+            clone.consumers[name] = Consumer(name, consumer.seen_time)
+        for id, entry in self.pel.items():
+            consumer = clone.consumers[entry.consumer.name]
+            clone.pel[id] = consumer.pending[id] = PendingEntry(
+                id, consumer, entry.delivery_time, entry.delivery_count
+            )
+        clone._pel_ids = [id for id in self._pel_ids if id in self.pel]
+        return clone
+
+    def iter_pending(self, start: tuple[int, int]):
+        """Pending entries with an ID >= `start`, in ID order."""
+        ids = self._pel_ids
+        pel = self.pel
+        for i in range(bisect_left(ids, start), len(ids)):
+            entry = pel.get(ids[i])
+            if entry is not None:
+                yield entry
+
+    def summary(self) -> list:
+        """XPENDING summary: count, smallest and greatest ID, count per consumer."""
+        if not self.pel:
+            return [0, None, None, []]
+        first = next(self.iter_pending((0, 0)))
+        last = None
+        for i in range(len(self._pel_ids) - 1, -1, -1):
+            last = self.pel.get(self._pel_ids[i])
+            if last is not None:
+                break
+        consumers = [
+            [consumer.name, str(len(consumer.pending))]
+            for consumer in self.consumers.values()
+            if consumer.pending
+        ]
+        return [len(self.pel), format_id(first.id), format_id(last.id), consumers]
+
+    def _maybe_compact(self) -> None:
+        if len(self._pel_ids) > 64 and len(self.pel) * 2 < len(self._pel_ids):
+            self._pel_ids = [id for id in self._pel_ids if id in self.pel]
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+
+from .config import Replica, ServerConfiguration
+from .logger import NOTICE
+from .offload import Offloader
+from .rdb_writer import iter_rdb, snapshot
+from .store import Store
+
+
+class DisklessSync:
+    """
+    Full resynchronization of replicas streamed straight from memory.
+
+    Replicas sending PSYNC wait `repl_diskless_sync_delay` seconds so that the
+    ones arriving together share one snapshot: the keyspace is serialized once
+    and every chunk is written to all of their sockets, nothing goes to disk.
+    The RDB is sent in the `$EOF:<mark>` format since its size is not known up
+    front. While it is being sent, commands propagated to those replicas are
+    kept in their `sync_buffer` and written right after the RDB, so each one
+    continues from the offset announced in its +FULLRESYNC.
+    """
+
+    def __init__(
+        self, databases: list[Store], config: ServerConfiguration, offload: Offloader
+    ):
+        self.databases = databases
+        self.config = config
+        self.offload = offload
+        self.waiting: list[Replica] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.task: asyncio.Task | None = None
+
+    def request(self, replica: Replica) -> None:
+        replica.state = "wait_bgsave"
+        self.waiting.append(replica)
+        if self.task is None:
+            # A replica arriving during a transfer waits for the next snapshot
+            self.schedule()
+
+    def schedule(self) -> None:
+        max_replicas = self.config.repl_diskless_sync_max_replicas
+        if max_replicas and len(self.waiting) >= max_replicas:
+            self.start()
+        elif self.timer is None:
+            loop = asyncio.get_running_loop()
+            delay = self.config.repl_diskless_sync_delay
+            self.timer = loop.call_later(delay, self.start)
+
+    def start(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.task is not None:
+            return
+        replicas = [r for r in self.waiting if not r.conn.writer.is_closing()]
+        self.waiting = []
+        if replicas:
+            self.task = asyncio.create_task(self.transfer(replicas))
+
+    async def transfer(self, replicas: list[Replica]) -> None:
+        replication = self.config.replication
+        # Nothing awaits between taking the snapshot and switching the replicas
+        # to buffering, so the snapshot is exactly the dataset at `offset`
+        entries = snapshot(self.databases)
+        offset = replication.master_repl_offset
+        # A replica starts on db 0, make the next propagated write SELECT again
+        replication.selected_db = -1
+        mark = os.urandom(20).hex().encode()
+        header = b"+FULLRESYNC %s %d\r\n$EOF:%s\r\n" % (
+            replication.master_replid.encode(),
+            offset,
+            mark,
+        )
+        for replica in replicas:
+            replica.state = "send_bulk"
+        replicas = [replica for replica in replicas if self.write(replica, header)]
+        logging.log(
+            NOTICE, "Diskless sync of %d replicas at offset %s", len(replicas), offset
+        )
+
+        try:
+            chunks = iter_rdb(entries)
+            while True:
+                # The snapshot is never modified, so chunks are built in the pool
+                chunk = await self.offload.run(next, chunks, None)
+                if chunk is None:
+                    break
+                replicas = [r for r in replicas if self.write(r, chunk)]
+                if not replicas:
+                    return
+                # Sent to all replicas at once, paced by the slowest of them
+                await asyncio.gather(
+                    *(replica.conn.writer.drain() for replica in replicas),
+                    return_exceptions=True,
+                )
+            for replica in replicas:
+                backlog = bytes(replica.sync_buffer)
+                replica.sync_buffer.clear()
+                replica.state = "online"
+                self.write(replica, mark + backlog)
+        finally:
+            self.task = None
+            if self.waiting:
+                self.schedule()
+
+    def write(self, replica: Replica, data: bytes) -> bool:
+        if replica.conn.send(data):
+            return True
+        self.config.replication.remove_slave(replica)
+        return False
@@ -0,0 +1,328 @@
+"""
+HyperLogLog values, byte for byte in the layout Redis uses.
+
+A value is a string: a 16 byte header (`HYLL`, the encoding, 3 unused bytes
+and the cached cardinality, little endian, its top bit set when stale), then
+the 16384 registers. Dense values pack them in 6 bits each, 12 KB whatever
+the cardinality. Sparse values run-length encode them, which is a few hundred
+bytes for small sets:
+
+    00xxxxxx           ZERO   x+1 zero registers (1 - 64)
+    01xxxxxx yyyyyyyy  XZERO  xy+1 zero registers (1 - 16384)
+    1vvvvvxx           VAL    x+1 registers (1 - 4) set to v+1 (1 - 32)
+
+A sparse value becomes dense once it outgrows `hll_sparse_max_bytes` or a
+register goes over 32. The standard error of the estimate is 1.04 / sqrt(16384),
+0.81%.
+"""
+
+import math
+import struct
+
+HLL_P = 14  # index bits of the hash
+HLL_Q = 64 - HLL_P  # bits left to count the run of zeros in
+HLL_REGISTERS = 1 << HLL_P
+HLL_BITS = 6
+HLL_REGISTER_MAX = (1 << HLL_BITS) - 1
+HLL_HDR_SIZE = 16
+HLL_DENSE_SIZE = HLL_HDR_SIZE + HLL_REGISTERS * HLL_BITS // 8
+HLL_DENSE = 0
+HLL_SPARSE = 1
+HLL_SPARSE_VAL_MAX_VALUE = 32
+HLL_SPARSE_VAL_MAX_LEN = 4
+HLL_SPARSE_ZERO_MAX_LEN = 64
+HLL_SPARSE_XZERO_MAX_LEN = 16384
+HLL_ALPHA_INF = 0.721347520444481703680
+MAGIC = b"HYLL"
+
+INVALID_HLL = {"error": "WRONGTYPE Key is not a valid HyperLogLog string value."}
+
+_MASK64 = (1 << 64) - 1
+# One byte per register of a group of 4 that share 3 bytes of a dense value,
+# used to unpack and pack all the groups at once as big integers
+_GROUPS = HLL_REGISTERS // 4
+_LANES = {
+    mask: int.from_bytes(bytes((mask,)) * _GROUPS, "big")
+    for mask in (0x03, 0x0F, 0x3F)
+}
+
+
+def murmurhash64a(data: bytes, seed: int = 0xADC83B19) -> int:
+    """MurmurHash64A, the hash Redis feeds HyperLogLogs with."""
+    m, r = 0xC6A4A7935BD1E995, 47
+    h = (seed ^ (len(data) * m)) & _MASK64
+    end = len(data) - len(data) % 8
+    for (k,) in struct.iter_unpack("<Q", data[:end]):
+        k = (k * m) & _MASK64
+        k ^= k >> r
+        k = (k * m) & _MASK64
+        h = ((h ^ k) * m) & _MASK64
+    if end < len(data):
+        h = ((h ^ int.from_bytes(data[end:], "little")) * m) & _MASK64
+    h ^= h >> r
+    h = (h * m) & _MASK64
+    return h ^ (h >> r)
+
+
+def pattern(element: bytes) -> tuple[int, int]:
+    """The register of `element` and the length of its run of zeros plus one."""
+    hash = murmurhash64a(element)
+    index = hash & (HLL_REGISTERS - 1)
+    hash = (hash >> HLL_P) | (1 << HLL_Q)  # so the run stops at HLL_Q
+    return index, (hash & -hash).bit_length()
+
+
+def patterns(elements: list[bytes]) -> list[tuple[int, int]]:
+    return [pattern(element) for element in elements]
+
+
+def new() -> bytearray:
+    """An empty HyperLogLog, sparse, with a valid cached cardinality of 0."""
+    value = bytearray(MAGIC + bytes((HLL_SPARSE,)) + bytes(11))
+    value += encode_zeros(HLL_REGISTERS)
+    return value
+
+
+def is_valid(value: bytes | bytearray) -> bool:
+    if len(value) < HLL_HDR_SIZE or value[:4] != MAGIC:
+        return False
+    if value[4] == HLL_DENSE:
+        return len(value) == HLL_DENSE_SIZE
+    return value[4] == HLL_SPARSE
+
+
+def invalidate_cache(value: bytearray) -> None:
+    value[15] |= 0x80
+
+
+# Dense encoding
+
+
+def dense_get(value: bytearray, index: int) -> int:
+    byte = HLL_HDR_SIZE + index * HLL_BITS // 8
+    shift = index * HLL_BITS & 7
+    high = value[byte + 1] if byte + 1 < len(value) else 0
+    return ((value[byte] >> shift) | (high << (8 - shift))) & HLL_REGISTER_MAX
+
+
+def dense_set(value: bytearray, index: int, count: int) -> None:
+    byte = HLL_HDR_SIZE + index * HLL_BITS // 8
+    shift = index * HLL_BITS & 7
+    low = value[byte] & ~(HLL_REGISTER_MAX << shift)
+    value[byte] = (low | count << shift) & 0xFF
+    if byte + 1 < len(value):
+        spill = 8 - shift
+        high = value[byte + 1] & ~(HLL_REGISTER_MAX >> spill)
+        value[byte + 1] = high | count >> spill
+
+
+def dense_registers(value: bytearray) -> bytearray:
+    """
+    The registers of a dense value, one per byte.
+
+    Every 3 bytes hold 4 registers. Each of the 3 byte positions is gathered
+    with a slice and turned into one big integer, so shifting and masking those
+    unpacks the 4096 groups at once: bits never cross between the byte lanes
+    that are kept by the masks.
+    """
+    payload = value[HLL_HDR_SIZE:]
+    b0, b1, b2 = (int.from_bytes(payload[i::3], "big") for i in range(3))
+    m03, m0f, m3f = _LANES[0x03], _LANES[0x0F], _LANES[0x3F]
+    registers = bytearray(HLL_REGISTERS)
+    registers[0::4] = (b0 & m3f).to_bytes(_GROUPS, "big")
+    registers[1::4] = ((b0 >> 6) & m03 | (b1 & m0f) << 2).to_bytes(_GROUPS, "big")
+    registers[2::4] = ((b1 >> 4) & m0f | (b2 & m03) << 4).to_bytes(_GROUPS, "big")
+    registers[3::4] = ((b2 >> 2) & m3f).to_bytes(_GROUPS, "big")
+    return registers
+
+
+def dense_from_registers(registers: bytes | bytearray) -> bytearray:
+    """A dense value holding `registers`, the inverse of `dense_registers`."""
+    r0, r1, r2, r3 = (int.from_bytes(registers[i::4], "big") for i in range(4))
+    m03, m0f = _LANES[0x03], _LANES[0x0F]
+    value = bytearray(MAGIC + bytes((HLL_DENSE,)) + bytes(11))
+    invalidate_cache(value)
+    payload = bytearray(HLL_DENSE_SIZE - HLL_HDR_SIZE)
+    payload[0::3] = (r0 | (r1 & m03) << 6).to_bytes(_GROUPS, "big")
+    payload[1::3] = ((r1 >> 2) & m0f | (r2 & m0f) << 4).to_bytes(_GROUPS, "big")
+    payload[2::3] = ((r2 >> 4) & m03 | r3 << 2).to_bytes(_GROUPS, "big")
+    return value + payload
+
+
+# Sparse encoding
+
+
+def encode_zeros(count: int) -> bytearray:
+    ops = bytearray()
+    while count > HLL_SPARSE_ZERO_MAX_LEN:
+        run = min(count, HLL_SPARSE_XZERO_MAX_LEN) - 1
+        ops += bytes((0x40 | run >> 8, run & 0xFF))
+        count -= run + 1
+    if count:
+        ops.append(count - 1)
+    return ops
+
+
+def sparse_decode(value: bytearray) -> dict[int, int]:
+    """The non zero registers of a sparse value, as index -> count."""
+    registers, index, pos = {}, 0, HLL_HDR_SIZE
+    while pos < len(value):
+        op = value[pos]
+        if op & 0x80:  # VAL
+            count, run = (op >> 2 & 0x1F) + 1, (op & 0x03) + 1
+            for i in range(index, index + run):
+                registers[i] = count
+            index += run
+            pos += 1
+        elif op & 0x40:  # XZERO
+            index += ((op & 0x3F) << 8 | value[pos + 1]) + 1
+            pos += 2
+        else:  # ZERO
+            index += op + 1
+            pos += 1
+    return registers
+
+
+def sparse_encode(registers: dict[int, int]) -> bytearray:
+    value = bytearray(MAGIC + bytes((HLL_SPARSE,)) + bytes(11))
+    invalidate_cache(value)
+    index = 0
+    items = sorted(registers.items())
+    i = 0
+    while i < len(items):
+        start, count = items[i]
+        run = 1
+        while (
+            run < HLL_SPARSE_VAL_MAX_LEN
+            and i + run < len(items)
+            and items[i + run] == (start + run, count)
+        ):
+            run += 1
+        value += encode_zeros(start - index)
+        value.append(0x80 | (count - 1) << 2 | (run - 1))
+        index = start + run
+        i += run
+    value += encode_zeros(HLL_REGISTERS - index)
+    return value
+
+
+def sparse_histogram(value: bytearray) -> list[int]:
+    histogram, pos = [0] * 64, HLL_HDR_SIZE
+    while pos < len(value):
+        op = value[pos]
+        if op & 0x80:
+            histogram[(op >> 2 & 0x1F) + 1] += (op & 0x03) + 1
+            pos += 1
+        elif op & 0x40:
+            histogram[0] += ((op & 0x3F) << 8 | value[pos + 1]) + 1
+            pos += 2
+        else:
+            histogram[0] += op + 1
+            pos += 1
+    return histogram
+
+
+# Commands
+
+
+def add(
+    value: bytearray, patterns: list[tuple[int, int]], sparse_max_bytes: int
+) -> tuple[bytearray, bool]:
+    """
+    Add the elements whose `pattern`s are given to `value`. Returns the value,
+    a new one if its encoding changed, and whether any register changed.
+    """
+    changed = False
+    if value[4] == HLL_SPARSE:
+        registers = sparse_decode(value)
+        for index, count in patterns:
+            if count > registers.get(index, 0):
+                registers[index] = count
+                changed = True
+        if not changed:
+            return value, False
+        if max(registers.values()) <= HLL_SPARSE_VAL_MAX_VALUE:
+            sparse = sparse_encode(registers)
+            if len(sparse) <= sparse_max_bytes:
+                return sparse, True
+        dense = bytearray(HLL_REGISTERS)
+        for index, count in registers.items():
+            dense[index] = count
+        return dense_from_registers(dense), True
+
+    for index, count in patterns:
+        if count > dense_get(value, index):
+            dense_set(value, index, count)
+            changed = True
+    if changed:
+        invalidate_cache(value)
+    return value, changed
+
+
+def to_registers(value: bytearray) -> bytearray:
+    if value[4] == HLL_DENSE:
+        return dense_registers(value)
+    result = bytearray(HLL_REGISTERS)
+    for index, count in sparse_decode(value).items():
+        result[index] = count
+    return result
+
+
+def merge(values: list[bytearray]) -> bytearray:
+    """Register wise max of `values`, one register per byte."""
+    result = to_registers(values[0])
+    for value in values[1:]:
+        result = bytearray(map(max, result, to_registers(value)))
+    return result
+
+
+def count(value: bytearray) -> int:
+    """The estimated cardinality, from the cache when it is still valid."""
+    if not value[15] & 0x80:
+        return int.from_bytes(value[8:16], "little")
+    if value[4] == HLL_DENSE:
+        cardinality = estimate(histogram(dense_registers(value)))
+    else:
+        cardinality = estimate(sparse_histogram(value))
+    value[8:16] = cardinality.to_bytes(8, "little")
+    return cardinality
+
+
+def histogram(registers: bytes | bytearray) -> list[int]:
+    return [registers.count(n) for n in range(64)]
+
+
+def estimate(histogram: list[int]) -> int:
+    """Otmar Ertl's improved estimator, as used by Redis since 4.0."""
+    m = HLL_REGISTERS
+    z = m * _tau((m - histogram[HLL_Q + 1]) / m)
+    for j in range(HLL_Q, 0, -1):
+        z = (z + histogram[j]) * 0.5
+    z += m * _sigma(histogram[0] / m)
+    return int(HLL_ALPHA_INF * m * m / z + 0.5)
+
+
+def _sigma(x: float) -> float:
+    if x == 1.0:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if previous == z:
+            return z
+
+
+def _tau(x: float) -> float:
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if previous == z:
+            return z / 3
@@ -0,0 +1,149 @@
+"""
+Hot key and big key analysis.
+
+The keys of a sample of the commands, one in `key_stats_sample_ratio`, get
+their LFU counter bumped, the logarithmic access frequency Redis keeps under an
+LFU maxmemory policy (OBJECT FREQ), and are counted in a bounded heavy hitters
+table (HOTKEYS). A sampled access weighs as many as the ratio, so both stay
+estimates of every access while most commands skip the bookkeeping. BIGKEYS
+walks a database in small batches on the loop and reports the largest keys of
+every type.
+"""
+
+import asyncio
+import heapq
+import random
+import sys
+import time
+from operator import itemgetter
+
+from .sets import RedisSet
+from .stream import Stream
+
+LFU_INIT_VAL = 5  # counter of a new key, so it is not the first one evicted
+LFU_COUNTER_MAX = 255
+HOTKEYS_CAPACITY = 128  # keys the heavy hitters table keeps exact-ish counts of
+BIGKEYS_BATCH = 100  # keys looked at between two yields to the loop
+MEMORY_SAMPLES = 5  # elements of a container sampled to estimate its size
+
+
+def lfu_minutes() -> int:
+    return int(time.time() // 60)
+
+
+def lfu_counter(packed: int, decay_time: int) -> int:
+    """
+    The counter of a packed `minutes << 8 | counter` LFU entry, decremented
+    once per `decay_time` minutes since the last access.
+    """
+    counter = packed & 0xFF
+    if decay_time:
+        periods = (lfu_minutes() - (packed >> 8)) // decay_time
+        counter = max(counter - periods, 0)
+    return counter
+
+
+def lfu_access(
+    packed: int | None, log_factor: int, decay_time: int, weight: int = 1
+) -> int:
+    """
+    The LFU entry after one more access. The counter grows with probability
+    1 / ((counter - LFU_INIT_VAL) * log_factor + 1), so 8 bits cover millions
+    of accesses: with a factor of 10 it saturates around a million hits. An
+    access of `weight` stands for that many, its probability is scaled by it.
+    """
+    counter = LFU_INIT_VAL if packed is None else lfu_counter(packed, decay_time)
+    if counter < LFU_COUNTER_MAX:
+        base = max(counter - LFU_INIT_VAL, 0)
+        if random.random() * (base * log_factor + 1) < weight:
+            counter += 1
+    return lfu_minutes() << 8 | counter
+
+
+class HeavyHitters:
+    """
+    Top-k most accessed keys, with the Space-Saving algorithm in bounded memory.
+
+    At most 2 * `capacity` keys are counted. Once the table is full it is cut
+    back to the `capacity` biggest counts, and keys seen afterwards start from
+    the biggest count dropped (`floor`), which is the most a count can be
+    overestimated by. Cutting in batches keeps recording O(1) amortized.
+    """
+
+    def __init__(self, capacity: int = HOTKEYS_CAPACITY):
+        self.capacity = capacity
+        self.counts: dict[tuple[int, bytes], int] = {}
+        self.floor = 0
+        self.total = 0
+
+    def record(self, db: int, key: bytes, weight: int = 1) -> None:
+        self.total += weight
+        entry = (db, key)
+        count = self.counts.get(entry)
+        if count is None:
+            if len(self.counts) >= 2 * self.capacity:
+                self.trim()
+            self.counts[entry] = self.floor + weight
+        else:
+            self.counts[entry] = count + weight
+
+    def trim(self) -> None:
+        kept = heapq.nlargest(
+            self.capacity + 1, self.counts.items(), key=itemgetter(1)
+        )
+        self.floor = kept.pop()[1]
+        self.counts = dict(kept)
+
+    def top(self, count: int) -> list[tuple[int, bytes, int]]:
+        """The `count` hottest keys as (db, key, accesses), hottest first."""
+        best = heapq.nlargest(count, self.counts.items(), key=itemgetter(1))
+        return [(db, key, accesses) for (db, key), accesses in best]
+
+    def reset(self) -> None:
+        self.counts, self.floor, self.total = {}, 0, 0
+
+
+def memory_usage(key: bytes, value, samples: int = MEMORY_SAMPLES) -> int:
+    """Estimated bytes used by a key, containers are sampled (MEMORY USAGE)."""
+    if isinstance(value, (RedisSet, Stream)):
+        return sys.getsizeof(key) + value.memory_usage(samples)
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+
+async def scan_big_keys(
+    store, count: int, batch: int = BIGKEYS_BATCH, samples: int = MEMORY_SAMPLES
+) -> dict[str, dict]:
+    """
+    Per type: the number of keys, their elements (bytes for strings) and
+    estimated memory, and the `count` biggest keys by memory.
+
+    Key names are copied up front at C speed, then looked at `batch` at a time
+    with a yield to the loop in between, so other clients are served while a
+    big database is scanned. Keys deleted meanwhile are skipped.
+    """
+    keys = [*store.store, *store.stream]
+    types: dict[str, dict] = {}
+    for start in range(0, len(keys), batch):
+        if start:
+            await asyncio.sleep(0)
+        for key in keys[start : start + batch]:
+            value = store.stream.get(key)
+            if value is None:
+                value = store.get(key)
+                if value is None:
+                    continue
+            stats = types.setdefault(
+                str(store.type_check(key)),
+                {"keys": 0, "elements": 0, "memory": 0, "biggest": []},
+            )
+            memory, elements = memory_usage(key, value, samples), len(value)
+            stats["keys"] += 1
+            stats["elements"] += elements
+            stats["memory"] += memory
+            if len(stats["biggest"]) < count:
+                heapq.heappush(stats["biggest"], (memory, key, elements))
+            elif count:
+                heapq.heappushpop(stats["biggest"], (memory, key, elements))
+    for stats in types.values():
+        stats["biggest"] = sorted(stats["biggest"], reverse=True)
+    return types
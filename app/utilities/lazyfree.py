@@ -0,0 +1,104 @@
+import asyncio
+from collections import deque
+
+from .sets import RedisSet
+from .stream import Stream
+
+# Values releasing at most this many objects are freed inline, like Redis
+LAZYFREE_THRESHOLD = 64
+# Objects released per step before yielding back to the event loop
+FREE_BATCH = 1024
+
+
+def free_effort(value) -> int:
+    """Roughly how many objects releasing `value` frees (1 for flat values)."""
+    if isinstance(value, RedisSet):
+        # An intset is one array buffer, released with a single free()
+        return 1 if value.is_intset else len(value)
+    if isinstance(value, Stream):
+        return len(value) + sum(len(group.pel) for group in value.groups.values())
+    if isinstance(value, (dict, list, set)):
+        return len(value)
+    return 1
+
+
+class LazyFree:
+    """
+    Releases big values in small steps on the event loop.
+
+    CPython frees a container in one go while holding the GIL, so a worker
+    thread would block the loop just as long. Instead the detached value is
+    taken apart `FREE_BATCH` objects at a time from `call_soon` callbacks, and
+    clients get served between the steps. Values under `LAZYFREE_THRESHOLD` are
+    cheap to free and are left to the caller to drop inline.
+    """
+
+    def __init__(self):
+        # Generators releasing one value each, advanced one batch per step
+        self.pending: deque = deque()
+        self.scheduled = False
+        self.freed_objects = 0
+
+    def free(self, value) -> None:
+        if free_effort(value) > LAZYFREE_THRESHOLD:
+            self.pending.append(self.dismantle(value))
+            self.schedule()
+
+    def free_keyspace(self, keys: dict, streams: dict) -> None:
+        """Release the dicts detached from a database by FLUSHDB / FLUSHALL ASYNC."""
+        if not keys and not streams:
+            return
+        self.pending.append(self.dismantle_keyspace(keys, streams))
+        self.schedule()
+
+    def schedule(self) -> None:
+        if not self.scheduled and self.pending:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.step)
+
+    def step(self) -> None:
+        self.scheduled = False
+        work = self.pending[0]
+        if next(work, None) is None:
+            self.pending.popleft()
+            self.freed_objects += 1
+        self.schedule()
+
+    def dismantle(self, value):
+        if isinstance(value, RedisSet):
+            while value.discard_batch(FREE_BATCH):
+                yield True
+        elif isinstance(value, Stream):
+            for group in value.groups.values():
+                yield from self.drain(group.pel)
+                yield from self.drain(group.consumers)
+            blocks = value.blocks
+            released = 0
+            while blocks:
+                released += len(blocks.pop())
+                if released >= FREE_BATCH:
+                    released = 0
+                    yield True
+        elif isinstance(value, (dict, set, list)):
+            yield from self.drain(value)
+
+    def dismantle_keyspace(self, keys: dict, streams: dict):
+        while keys:
+            for _ in range(min(FREE_BATCH, len(keys))):
+                value = keys.popitem()[1][0]
+                # Big values go through their own steps instead of this batch
+                self.free(value)
+            yield True
+        while streams:
+            for _ in range(min(FREE_BATCH, len(streams))):
+                self.free(streams.popitem()[1])
+            yield True
+
+    @staticmethod
+    def drain(container):
+        """Empty a dict, set or list `FREE_BATCH` elements at a time."""
+        pop = container.popitem if isinstance(container, dict) else container.pop
+        while container:
+            for _ in range(min(FREE_BATCH, len(container))):
+                pop()
+            yield True
@@ -0,0 +1,105 @@
+"""
+Listpacks, the serialization Redis uses for the nodes of a stream in RDB files.
+
+A listpack is a 4 byte total size and a 2 byte element count (little endian),
+the elements, and a 0xFF terminator. Each element is an encoding byte, its
+data, and the length of both written backwards so it can be walked from the
+end too. Integers, and strings holding a canonical int64, use the smallest of
+the integer encodings.
+"""
+
+import struct
+
+from .sets import as_int_member
+
+END = 0xFF
+# Element count written when it does not fit in the 2 byte header field
+UNKNOWN_COUNT = 0xFFFF
+
+
+def encode_element(value: int | bytes) -> bytes:
+    if isinstance(value, bytes):
+        as_int = as_int_member(value)
+        if as_int is None:
+            size = len(value)
+            if size < 1 << 6:
+                return bytes((0x80 | size,)) + value
+            if size < 1 << 12:
+                return bytes((0xE0 | size >> 8, size & 0xFF)) + value
+            return b"\xf0" + struct.pack("<I", size) + value
+        value = as_int
+    if 0 <= value < 1 << 7:
+        return bytes((value,))
+    if -(1 << 12) <= value < 1 << 12:
+        value &= (1 << 13) - 1
+        return bytes((0xC0 | value >> 8, value & 0xFF))
+    for code, width in ((0xF1, 2), (0xF2, 3), (0xF3, 4), (0xF4, 8)):
+        if -(1 << (width * 8 - 1)) <= value < 1 << (width * 8 - 1):
+            return bytes((code,)) + value.to_bytes(width, "little", signed=True)
+    raise ValueError(f"integer {value} does not fit in a listpack")
+
+
+def backlen_size(length: int) -> int:
+    """Bytes taken by the back length of an element `length` bytes long."""
+    if length <= 127:
+        return 1
+    if length < 16383:
+        return 2
+    if length < 2097151:
+        return 3
+    if length < 268435455:
+        return 4
+    return 5
+
+
+def encode_backlen(length: int) -> bytes:
+    size = backlen_size(length)
+    # 7 bits a byte, most significant first, all but the first flagged with 128
+    return bytes(
+        (length >> (7 * (size - 1 - i)) & 127) | (128 if i else 0) for i in range(size)
+    )
+
+
+def encode(values: list[int | bytes]) -> bytes:
+    body = bytearray()
+    for value in values:
+        element = encode_element(value)
+        body += element
+        body += encode_backlen(len(element))
+    body.append(END)
+    count = len(values) if len(values) < UNKNOWN_COUNT else UNKNOWN_COUNT
+    return struct.pack("<IH", len(body) + 6, count) + body
+
+
+def decode(data: bytes) -> list[int | bytes]:
+    """The elements of a listpack: ints for integer encodings, bytes otherwise."""
+    values = []
+    pos = 6
+    while data[pos] != END:
+        start = pos
+        byte = data[pos]
+        if byte < 0x80:
+            value, pos = byte, pos + 1
+        elif byte < 0xC0:
+            size = byte & 0x3F
+            value, pos = bytes(data[pos + 1 : pos + 1 + size]), pos + 1 + size
+        elif byte < 0xE0:
+            value = (byte & 0x1F) << 8 | data[pos + 1]
+            if value >= 1 << 12:
+                value -= 1 << 13
+            pos += 2
+        elif byte < 0xF0:
+            size = (byte & 0x0F) << 8 | data[pos + 1]
+            value, pos = bytes(data[pos + 2 : pos + 2 + size]), pos + 2 + size
+        elif byte == 0xF0:
+            (size,) = struct.unpack_from("<I", data, pos + 1)
+            value, pos = bytes(data[pos + 5 : pos + 5 + size]), pos + 5 + size
+        else:
+            width = {0xF1: 2, 0xF2: 3, 0xF3: 4, 0xF4: 8}.get(byte)
+            if width is None:
+                raise ValueError(f"unknown listpack encoding {byte:#x}")
+            pos += 1 + width
+            value = int.from_bytes(data[pos - width : pos], "little", signed=True)
+        pos += backlen_size(pos - start)
+        values.append(value)
+    return values
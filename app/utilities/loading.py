@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import mmap
+import os
+import time
+
+from .logger import NOTICE
+from .rdb_parser import DatabaseParser
+from .store import Store
+
+# Keys loaded between two yields to the event loop
+LOADING_BATCH = 1024
+
+
+class DatasetLoader:
+    """
+    Loads the RDB file at startup without blocking the event loop.
+
+    The file is mapped rather than read, parsed one key at a time and put
+    straight into its database, yielding to the loop every `LOADING_BATCH`
+    keys. Clients connected meanwhile get `-LOADING` for commands touching the
+    data, see `CommandHandler.LOADING_CMDS`, and can follow the progress in
+    `INFO persistence`.
+    """
+
+    def __init__(self, databases: list[Store], parser: DatabaseParser):
+        self.databases = databases
+        self.parser = parser
+        self.active = False
+        self.start_time = 0.0
+        self.total_bytes = 0
+        self.loaded_bytes = 0
+        self.loaded_keys = 0
+
+    async def load(self, path: str) -> None:
+        if not os.path.exists(path) or not os.path.getsize(path):
+            return
+        self.active = True
+        self.start_time = time.time()
+        self.total_bytes = os.path.getsize(path)
+        self.loaded_bytes = self.loaded_keys = 0
+        try:
+            with open(path, "rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                for entry in self.parser.iter_entries(data, progress=True):
+                    if isinstance(entry, int):
+                        # Part of a big set was read
+                        self.loaded_bytes = entry
+                        await asyncio.sleep(0)
+                        continue
+                    db_number, key, value, expire_time, position = entry
+                    if db_number < len(self.databases):
+                        self.databases[db_number].restore(key, value, expire_time)
+                    self.loaded_keys += 1
+                    if self.loaded_keys % LOADING_BATCH == 0:
+                        self.loaded_bytes = position
+                        await asyncio.sleep(0)
+            self.loaded_bytes = self.total_bytes
+            logging.log(
+                NOTICE,
+                "Loaded %d keys from %s in %.3f seconds",
+                self.loaded_keys,
+                path,
+                time.time() - self.start_time,
+            )
+        except Exception as e:
+            logging.error("Loading %s failed: %s", path, e)
+        finally:
+            self.active = False
+
+    def info(self) -> str:
+        """The loading fields of `INFO persistence`."""
+        lines = [f"loading:{int(self.active)}"]
+        if self.active:
+            elapsed = time.time() - self.start_time
+            if self.loaded_bytes:
+                remaining = self.total_bytes - self.loaded_bytes
+                eta = int(elapsed * remaining / self.loaded_bytes)
+            else:
+                eta = 1
+            perc = self.loaded_bytes / self.total_bytes * 100
+            lines += [
+                f"loading_start_time:{int(self.start_time)}",
+                f"loading_total_bytes:{self.total_bytes}",
+                f"loading_loaded_bytes:{self.loaded_bytes}",
+                f"loading_loaded_perc:{perc:.2f}",
+                f"loading_eta_seconds:{eta}",
+                f"loading_loaded_keys:{self.loaded_keys}",
+            ]
+        return "".join(line + "\r\n" for line in lines)
@@ -0,0 +1,59 @@
+"""
+Server logging, with the Redis log levels and the file I/O off the event loop.
+
+Records that pass `loglevel` are put on a queue by a QueueHandler, and a
+QueueListener thread writes them out, so a command only ever pays for a level
+check, plus an enqueue when the record is kept. Log calls pass their arguments
+separately, `logging.debug("Reply %r", reply)`, so nothing is formatted for a
+level that is off. `CONFIG SET loglevel debug` turns request tracing on at
+runtime.
+"""
+
+import logging
+import logging.handlers
+import queue
+
+VERBOSE = logging.INFO
+NOTICE = logging.INFO + 5
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "verbose": VERBOSE,
+    "notice": NOTICE,
+    "warning": logging.WARNING,
+}
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+logging.addLevelName(NOTICE, "NOTICE")
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(loglevel: str = "notice", logfile: str = "main.log") -> None:
+    """Log to `logfile` through a background thread, to stderr if it is empty."""
+    global _listener
+    stop_logging()
+    handler = logging.FileHandler(logfile) if logfile else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    set_level(loglevel)
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+
+
+def set_level(loglevel: str) -> None:
+    level = LOG_LEVELS.get(loglevel.lower())
+    if level is None:
+        raise ValueError(f"Invalid loglevel '{loglevel}'")
+    logging.getLogger().setLevel(level)
+
+
+def stop_logging() -> None:
+    """Write out the records still queued and stop the thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
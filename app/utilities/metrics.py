@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import resource
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from .logger import NOTICE
+
+# Upper bounds in seconds of the event loop lag histogram buckets
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_INTERVAL = 0.1  # seconds between two probes of the loop lag
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REQUEST_TIMEOUT = 5  # seconds a scraper gets to send its request headers
+
+
+@dataclass
+class ServerStats:
+    """Counters behind INFO stats and /metrics, kept by the CommandHandler."""
+
+    commands_processed: int = 0
+    connections_received: int = 0
+    rejected_connections: int = 0
+    # Bytes of closed connections, open ones keep their own count until they close
+    net_input_bytes: int = 0
+    net_output_bytes: int = 0
+    ops_per_sec: float = 0.0
+    _sample_ops: int = 0
+    _sample_time: float = 0.0
+
+    def track_ops(self, now: float) -> None:
+        """Update `ops_per_sec` from the commands run since the previous call."""
+        elapsed = now - self._sample_time
+        if self._sample_time and elapsed > 0:
+            self.ops_per_sec = (self.commands_processed - self._sample_ops) / elapsed
+        self._sample_ops, self._sample_time = self.commands_processed, now
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition format."""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str) -> list[str]:
+        lines, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop runs a timer.
+
+    Every `interval` seconds a sleep is scheduled and the time it wakes up past
+    its deadline is recorded. Anything holding the loop, a slow command or a
+    big reply being encoded, shows up as lag.
+    """
+
+    def __init__(self, interval: float = LAG_INTERVAL):
+        self.interval = interval
+        self.histogram = Histogram(LAG_BUCKETS)
+        self.max = 0.0
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - deadline, 0.0)
+            self.histogram.observe(lag)
+            self.max = max(self.max, lag)
+
+
+def resident_memory() -> int:
+    """Resident set size of the process in bytes, 0 if it can't be read."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MetricsServer:
+    """
+    Serves `GET /metrics` for Prometheus on `metrics_port`.
+
+    Runs on the same event loop as the server: a scrape only reads counters
+    and sizes that are already maintained, so it never walks the keyspace.
+    """
+
+    def __init__(self, cmd, config):
+        self.cmd = cmd
+        self.config = config
+        self.lag = LoopLagMonitor()
+        self.server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        self.lag.start()
+        self.server = await asyncio.start_server(
+            self.handle, self.config.host, self.config.metrics_port
+        )
+        logging.log(NOTICE, "Metrics on: %s", self.server.sockets[0].getsockname())
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # A peer that never finishes its request must not hold the socket
+            request = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT
+            )
+            method, path, *_ = request.split(b"\r\n", 1)[0].decode().split(" ")
+            if method == "GET" and path.split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    def render(self) -> str:
+        cmd, stats = self.cmd, self.cmd.stats
+        replication = self.config.replication
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples: list) -> None:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        metric(
+            "redis_commands_processed_total",
+            "counter",
+            "Commands processed.",
+            [("", stats.commands_processed)],
+        )
+        metric(
+            "redis_instantaneous_ops_per_sec",
+            "gauge",
+            "Commands per second over the last second.",
+            [("", round(stats.ops_per_sec, 2))],
+        )
+        metric(
+            "redis_connected_clients",
+            "gauge",
+            "Client connections.",
+            [("", len(cmd.clients))],
+        )
+        metric(
+            "redis_connections_received_total",
+            "counter",
+            "Connections accepted.",
+            [("", stats.connections_received)],
+        )
+        metric(
+            "redis_rejected_connections_total",
+            "counter",
+            "Connections refused because of maxclients.",
+            [("", stats.rejected_connections)],
+        )
+
+        dbs = [(f'{{db="db{i}"}}', store) for i, store in enumerate(cmd.databases)]
+        metric(
+            "redis_db_keys",
+            "gauge",
+            "Keys per database.",
+            [(labels, store.dbsize()) for labels, store in dbs if store.dbsize()],
+        )
+        metric(
+            "redis_db_keys_expiring",
+            "gauge",
+            "Keys with an expire per database.",
+            [(labels, len(store.expires)) for labels, store in dbs if store.expires],
+        )
+        metric(
+            "redis_expired_keys_total",
+            "counter",
+            "Keys deleted because their expire was reached.",
+            [("", sum(store.expired_keys for store in cmd.databases))],
+        )
+
+        metric(
+            "redis_master_repl_offset",
+            "gauge",
+            "Replication offset.",
+            [("", replication.master_repl_offset)],
+        )
+        metric(
+            "redis_connected_slaves",
+            "gauge",
+            "Connected replicas.",
+            [("", len(replication._slaves_list))],
+        )
+        replicas = [
+            (
+                f'{{slave_ip="{replica.host}",slave_port="{replica.listening_port}",'
+                f'slave_state="{replica.state}"}}',
+                replica,
+            )
+            for replica in replication._slaves_list
+        ]
+        now = time.time()
+        metric(
+            "redis_connected_slave_offset_bytes",
+            "gauge",
+            "Offset acknowledged by each replica.",
+            [(labels, replica.ack_offset) for labels, replica in replicas],
+        )
+        metric(
+            "redis_connected_slave_lag_bytes",
+            "gauge",
+            "Bytes of the replication stream a replica has not acknowledged.",
+            [
+                (labels, max(replication.master_repl_offset - replica.ack_offset, 0))
+                for labels, replica in replicas
+            ],
+        )
+        metric(
+            "redis_connected_slave_lag_seconds",
+            "gauge",
+            "Seconds since each replica last acknowledged.",
+            [
+                (labels, round(now - replica.ack_time, 3))
+                for labels, replica in replicas
+            ],
+        )
+
+        metric(
+            "redis_process_resident_memory_bytes",
+            "gauge",
+            "Resident memory of the server process.",
+            [("", resident_memory())],
+        )
+        metric(
+            "redis_process_peak_resident_memory_bytes",
+            "gauge",
+            "Peak resident memory of the server process.",
+            # ru_maxrss is in kilobytes on Linux
+            [("", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)],
+        )
+        metric(
+            "redis_client_output_buffer_bytes",
+            "gauge",
+            "Bytes waiting in client output buffers.",
+            [
+                (
+                    "",
+                    sum(
+                        conn.output_buffer_size()
+                        for conn in cmd.clients.values()
+                        if conn.writer is not None
+                    ),
+                )
+            ],
+        )
+        metric(
+            "redis_lazyfree_pending_objects",
+            "gauge",
+            "Values waiting to be freed in the background.",
+            [("", len(cmd.lazyfree.pending))],
+        )
+
+        metric(
+            "redis_event_loop_lag_seconds",
+            "histogram",
+            "How late the event loop ran a timer.",
+            [],
+        )
+        lines.extend(self.lag.histogram.render("redis_event_loop_lag_seconds"))
+        metric(
+            "redis_event_loop_lag_max_seconds",
+            "gauge",
+            "Largest event loop lag seen.",
+            [("", self.lag.max)],
+        )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,55 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class Offloader:
+    """
+    Runs heavy work away from the event loop.
+
+    `run` uses a thread pool. Python code there still needs the GIL, but the
+    loop gets it back every `sys.getswitchinterval()` (5 ms by default), so cheap
+    commands keep being served while a big one is computed. Work must only touch
+    data nobody else mutates meanwhile: callers pass copies or fresh objects.
+
+    `run_process` uses a process pool, for work whose input and output pickle
+    quickly compared to the work itself, like parsing an RDB file.
+
+    Either executor can be replaced, e.g. by one that runs inline in tests.
+    """
+
+    def __init__(
+        self,
+        config,
+        threads: Executor | None = None,
+        processes: Executor | None = None,
+    ):
+        self.config = config
+        self.threads = threads or ThreadPoolExecutor(
+            max_workers=config.offload_threads, thread_name_prefix="offload"
+        )
+        self._processes = processes
+
+    @property
+    def processes(self) -> Executor:
+        if self._processes is None:
+            # spawn, forking a process that runs threads and a loop is not safe
+            self._processes = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._processes
+
+    def is_heavy(self, size: int) -> bool:
+        """True if work over `size` elements is worth the hand-off to a pool."""
+        threshold = self.config.offload_threshold
+        return bool(threshold) and size >= threshold
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.threads, func, *args
+        )
+
+    async def run_process(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.processes, func, *args
+        )
@@ -1,4 +1,168 @@
+import logging
+import sys
+
 DELIMETER = "\r\n"
+# Error messages starting with one of these are sent with it as the error code
+# instead of the generic ERR prefix
+ERROR_CODES = {
+    "WRONGTYPE",
+    "NOGROUP",
+    "BUSYGROUP",
+    "EXECABORT",
+    "LOADING",
+    "BUSYKEY",
+    "MOVED",
+    "ASK",
+    "CROSSSLOT",
+    "TRYAGAIN",
+    "CLUSTERDOWN",
+    "IOERR",
+}
+
+
+# Raw name -> upper case str, filled as names are seen, see `command_name`
+_NAMES: dict[bytes, str] = {}
+MAX_NAMES = 4096
+
+
+def command_name(name: bytes | str) -> str:
+    """
+    Upper case str form of a command or option name, e.g. b"set" -> "SET".
+
+    Names are the only arguments turned into str, keys and values stay bytes.
+    Results are interned and cached per raw spelling, so the lookup in the
+    command table costs one dict hit instead of a decode and an upper().
+    """
+    try:
+        return _NAMES[name]
+    except KeyError:
+        pass
+    if isinstance(name, str):
+        return name.upper()
+    upper = sys.intern(name.decode("utf-8", "replace").upper())
+    # Bounded, a client sending random names must not grow it forever
+    if len(_NAMES) < MAX_NAMES:
+        _NAMES[name] = upper
+    return upper
+
+
+class SimpleString(str):
+    """A str that is always encoded as a RESP simple string (`+...`)."""
+
+
+class RespMap(dict):
+    """Encoded as a RESP3 map (`%`), or as a flat key/value array for RESP2."""
+
+
+class RespSet(list):
+    """Encoded as a RESP3 set (`~`), or as an array for RESP2."""
+
+
+class RespPush(list):
+    """Encoded as a RESP3 push (`>`), or as an array for RESP2."""
+
+
+# Longest inline command, or multibulk or bulk length line, accepted like Redis
+INLINE_MAX_SIZE = 64 * 1024
+MULTIBULK_MAX_COUNT = 1024 * 1024
+PROTO_MAX_BULK_LEN = 512 * 1024**2
+
+
+class ProtocolError(ValueError):
+    """A malformed request, replied to with `-ERR` before the connection closes."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Protocol error: {reason}")
+
+
+class PartialCommand:
+    """
+    What `parse_command` got of a multibulk command before the buffer ran out:
+    its arguments, their count and how many bytes they took from the start of
+    the command. Given back with the next read, the parse resumes after them
+    instead of scanning the command from its start again.
+    """
+
+    __slots__ = ("args", "count", "consumed")
+
+    def __init__(self):
+        self.args: list[bytes] | None = None
+        self.count = 0
+        self.consumed = 0
+
+
+def parse_length(line: bytes | bytearray, limit: int, what: str) -> int:
+    try:
+        length = int(line)
+    except ValueError:
+        raise ProtocolError(f"invalid {what}") from None
+    if length > limit:
+        raise ProtocolError(f"invalid {what}")
+    return length
+
+
+def parse_command(
+    buffer: bytes | bytearray, pos: int = 0, partial: PartialCommand | None = None
+) -> tuple[list, int] | None:
+    """
+    Parse one command (a RESP array of bulk strings) from `buffer` at `pos`.
+
+    Returns the command and the position right after it, or None if the buffer
+    does not hold the whole command yet. Works on raw bytes, so the caller knows
+    exactly how many bytes each command took, and the arguments are returned
+    as bytes, binary safe and without a decode.
+
+    With `partial`, the arguments of an incomplete command are kept in it and
+    the next call at the same `pos` resumes after them, so a command arriving
+    over many reads is parsed in linear time. Raises ProtocolError on
+    malformed input.
+    """
+    size = len(buffer)
+    if pos >= size:
+        return None
+    start = pos
+    if partial is not None and partial.args is not None:
+        command, count = partial.args, partial.count
+        pos += partial.consumed
+    else:
+        end = buffer.find(b"\r\n", pos)
+        if end == -1:
+            if size - pos > INLINE_MAX_SIZE:
+                raise ProtocolError("too big inline request")
+            return None
+        if buffer[pos] != 42:  # "*"
+            # Inline command, e.g. a bare PING
+            if end - pos > INLINE_MAX_SIZE:
+                raise ProtocolError("too big inline request")
+            return bytes(buffer[pos:end]).split(), end + 2
+        line = buffer[pos + 1 : end]
+        count = parse_length(line, MULTIBULK_MAX_COUNT, "multibulk length")
+        pos = end + 2
+        command = []
+    while len(command) < count:
+        end = buffer.find(b"\r\n", pos)
+        if end == -1:
+            if size - pos > INLINE_MAX_SIZE:
+                raise ProtocolError("too big bulk count string")
+            break
+        if buffer[pos] != 36:  # "$"
+            raise ProtocolError(f"expected '$', got {chr(buffer[pos])!r}")
+        line = buffer[pos + 1 : end]
+        length = parse_length(line, PROTO_MAX_BULK_LEN, "bulk length")
+        if length < 0:
+            raise ProtocolError("invalid bulk length")
+        stop = end + 2 + length
+        if stop + 2 > size:
+            break
+        command.append(bytes(buffer[end + 2 : stop]))
+        pos = stop + 2
+    else:
+        if partial is not None:
+            partial.args = None
+        return command, pos
+    if partial is not None:
+        partial.args, partial.count, partial.consumed = command, count, pos - start
+    return None
 
 
 class RedisProtocolParser:
@@ -17,35 +181,65 @@ class RedisProtocolParser:
         self.decoded = None
         self.encoded = None
 
-    def encoder(self, data: list | str | dict) -> bytes | None:
+    def encoder(
+        self, data: list | str | bytes | dict, protocol: int = 2
+    ) -> bytes | None:
         try:
             self.encoded = None
-            if isinstance(data, str):
+            if isinstance(data, (bytes, bytearray)):
+                # Keys and values are kept as bytes and sent back untouched
+                self.encoded = b"$%d\r\n%s\r\n" % (len(data), data)
+
+            elif isinstance(data, SimpleString):
+                self.encoded = self.simple_string(data, encode=True)
+
+            elif isinstance(data, str):
                 if data.lower() in self.STRING_CONSTANTS:
                     self.encoded = self.simple_string(data, encode=True)
                 else:
                     self.encoded = self.bulk_string(data, encode=True)
 
+            elif isinstance(data, bool):
+                if protocol == 3:
+                    self.encoded = b"#t\r\n" if data else b"#f\r\n"
+                else:
+                    self.encoded = self.integer(int(data), encode=True)
+
             elif isinstance(data, int):
                 self.encoded = self.integer(data, encode=True)
 
+            elif isinstance(data, float):
+                self.encoded = self.double(data, protocol)
+
+            elif isinstance(data, RespPush):
+                type_prefix = ">" if protocol == 3 else "*"
+                self.encoded = self.array(data, True, protocol, type_prefix)
+
+            elif isinstance(data, RespSet):
+                type_prefix = "~" if protocol == 3 else "*"
+                self.encoded = self.array(data, True, protocol, type_prefix)
+
             elif isinstance(data, list):
-                self.encoded = self.array(data, encode=True)
+                self.encoded = self.array(data, encode=True, protocol=protocol)
+
+            elif isinstance(data, RespMap):
+                self.encoded = self.map(data, protocol)
 
             elif isinstance(data, dict):
                 self.encoded = self.simple_error(data["error"], encode=True)
 
+            elif protocol == 3:
+                self.encoded = b"_\r\n"  # RESP3 Null
+
             else:
-                self.encoded = "$-1\r\n"  # Null Bulk String
+                self.encoded = b"$-1\r\n"  # Null Bulk String
 
         except UnicodeEncodeError:
-            print("Unicode Enncode Error")
-
+            logging.exception("Could not encode %r", data)
             return None
-        except Exception as e:
-            print("Error in encoder")
-            print(e)
-        return bytes(self.encoded, "utf-8")
+        except Exception:
+            logging.exception("Error in encoder")
+        return self.encoded
 
     def decoder(self, data: bytes):
         self.decoded = None
@@ -104,7 +298,7 @@ class RedisProtocolParser:
     @staticmethod
     def simple_string(data: str, encode=False):
         if encode:
-            return "+" + data + DELIMETER
+            return b"+%s\r\n" % data.encode("utf-8")
         else:
             if " " not in data:
                 keyword = data[1:].rstrip(DELIMETER)
@@ -117,17 +311,19 @@ class RedisProtocolParser:
     @staticmethod
     def simple_error(data, encode=False):
         if encode:
-            return "-ERR " + data.rstrip(DELIMETER) + DELIMETER
+            message = data.rstrip(DELIMETER).encode("utf-8")
+            if data.split(" ", 1)[0] in ERROR_CODES:
+                return b"-%s\r\n" % message
+            return b"-ERR %s\r\n" % message
         else:
             return data[1:].rstrip(DELIMETER)
 
     @staticmethod
     def bulk_string(data, index=0, encode=False):
         if encode:
-            raw_data = data.split(" ")
-            convert_data = lambda keywords: "".join(
-                f"${len(keyword)}{DELIMETER}{keyword}{DELIMETER}"
-                for keyword in keywords
+            raw_data = data.encode("utf-8").split(b" ")
+            convert_data = lambda keywords: b"".join(
+                b"$%d\r\n%s\r\n" % (len(keyword), keyword) for keyword in keywords
             )
             new_data = convert_data(raw_data)
             return new_data
@@ -142,17 +338,39 @@ class RedisProtocolParser:
     @staticmethod
     def integer(data, encode=False):
         if encode:
-            return ":" + str(data) + DELIMETER
+            return b":%d\r\n" % data
+
+    @staticmethod
+    def double(data: float, protocol: int = 2):
+        if data != data:
+            value = "nan"
+        elif data in (float("inf"), float("-inf")):
+            value = "inf" if data > 0 else "-inf"
+        else:
+            value = repr(data)
+        if protocol == 3:
+            return b",%s\r\n" % value.encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value.encode())
 
     @staticmethod
-    def array(data, encode=False):
+    def map(data: dict, protocol: int = 2):
+        resp = RedisProtocolParser()
+        if protocol == 3:
+            prefix = b"%%%d\r\n" % len(data)
+        else:
+            prefix = b"*%d\r\n" % (len(data) * 2)
+        return prefix + b"".join(
+            resp.encoder(key, protocol) + resp.encoder(value, protocol)
+            for key, value in data.items()
+        )
+
+    @staticmethod
+    def array(data, encode=False, protocol=2, type_prefix="*"):
         resp = RedisProtocolParser()
         if encode:
-            prefix = "*" + str(len(data)) + DELIMETER
-            mapped_data = map(
-                lambda keyword: resp.encoder(keyword).decode("utf-8"), data
-            )
-            return prefix + "".join(mapped_data)
+            prefix = b"%s%d\r\n" % (type_prefix.encode(), len(data))
+            mapped_data = map(lambda keyword: resp.encoder(keyword, protocol), data)
+            return prefix + b"".join(mapped_data)
         else:
             new_data = []
             raw_data = data.split(DELIMETER)
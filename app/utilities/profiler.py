@@ -0,0 +1,186 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+# Lines of the pstats report and allocation sites returned by default
+REPORT_LIMIT = 30
+
+
+class StackSampler:
+    """
+    Low overhead CPU profiler: a thread that looks at the stack of the event
+    loop thread every `interval` seconds and counts the stacks it sees.
+
+    The loop itself runs untouched, the cost is one `sys._current_frames()`
+    call per sample. Results are in the collapsed stack format read by
+    flamegraph.pl and speedscope: `outer;inner;leaf count` per line.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self.run, name="profile-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = os.path.basename(code.co_filename)
+                stack.append(f"{name}:{code.co_qualname}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class Profiler:
+    """
+    DEBUG PROFILE: CPU profiling of the live server.
+
+    `cprofile` mode traces every call made on the event loop thread, exact but
+    slowing the server down noticeably. `sample` mode uses a StackSampler.
+    Nothing is installed until START, so there is no cost while it is off.
+    """
+
+    def __init__(self):
+        self.mode: str | None = None
+        self.running = False
+        self.profile: cProfile.Profile | None = None
+        self.sampler: StackSampler | None = None
+
+    def start(self, mode: str = "cprofile", interval: float = 0.01) -> str | dict:
+        if self.running:
+            return {"error": "profiler already running"}
+        if mode == "cprofile":
+            self.profile = cProfile.Profile()
+            # Installed on the calling thread, which is the event loop's
+            self.profile.enable()
+        elif mode == "sample":
+            self.sampler = StackSampler(threading.get_ident(), interval)
+            self.sampler.start()
+        else:
+            return {"error": "profiler mode must be CPROFILE or SAMPLE"}
+        self.mode = mode
+        self.running = True
+        return "OK"
+
+    def stop(self) -> str | dict:
+        if not self.running:
+            return {"error": "profiler not running"}
+        if self.mode == "cprofile":
+            self.profile.disable()
+        else:
+            self.sampler.stop()
+        self.running = False
+        return "OK"
+
+    def dump(
+        self, path: str | None = None, directory: str = ".", limit: int = REPORT_LIMIT
+    ) -> str | bytes | dict:
+        """
+        The results of the last run: a pstats report sorted by cumulative time,
+        or collapsed stacks. With `path` they are written there instead, as a
+        pstats file loadable with `pstats.Stats(path)` or as collapsed stacks.
+        `path` is relative to `directory` (the server's `dir`) and may not
+        leave it, since any client can send DEBUG.
+        """
+        if self.mode is None:
+            return {"error": "no profile to dump, use DEBUG PROFILE START first"}
+        if self.running:
+            return {"error": "stop the profiler before dumping it"}
+        if path is not None:
+            root = os.path.realpath(directory)
+            path = os.path.realpath(os.path.join(root, path))
+            if os.path.commonpath([root, path]) != root:
+                return {"error": "the dump path must be inside the server's dir"}
+        try:
+            if self.mode == "cprofile":
+                if path is not None:
+                    self.profile.dump_stats(path)
+                    return "OK"
+                output = io.StringIO()
+                stats = pstats.Stats(self.profile, stream=output)
+                stats.sort_stats("cumulative").print_stats(limit)
+                return output.getvalue().encode()
+            report = self.sampler.collapsed()
+            if path is not None:
+                with open(path, "w") as file:
+                    file.write(report)
+                return "OK"
+        except OSError as e:
+            return {"error": f"could not write the profile: {e.strerror}"}
+        return report.encode()
+
+
+class MemoryProfiler:
+    """
+    DEBUG MEMPROFILE: allocation tracking with tracemalloc.
+
+    START begins tracing, SNAPSHOT records a baseline and reports the top
+    allocation sites, DIFF reports what grew since the baseline. Tracing
+    slows allocations down, so it only runs between START and STOP.
+    """
+
+    def __init__(self):
+        self.baseline: tracemalloc.Snapshot | None = None
+
+    def start(self, frames: int = 1) -> str:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return "OK"
+
+    def stop(self) -> str:
+        tracemalloc.stop()
+        self.baseline = None
+        return "OK"
+
+    def snapshot(self, limit: int = REPORT_LIMIT) -> bytes | dict:
+        if not tracemalloc.is_tracing():
+            return {"error": "memory profiler not running"}
+        self.baseline = self.take()
+        stats = self.baseline.statistics("lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current} bytes, peak: {peak} bytes"]
+        lines += [str(stat) for stat in stats[:limit]]
+        return "\n".join(lines).encode()
+
+    def diff(self, limit: int = REPORT_LIMIT) -> bytes | dict:
+        if not tracemalloc.is_tracing():
+            return {"error": "memory profiler not running"}
+        if self.baseline is None:
+            return {"error": "no baseline, use DEBUG MEMPROFILE SNAPSHOT first"}
+        stats = self.take().compare_to(self.baseline, "lineno")
+        return "\n".join(str(stat) for stat in stats[:limit]).encode()
+
+    @staticmethod
+    def take() -> tracemalloc.Snapshot:
+        # The tracer's own allocations would otherwise top every report
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
@@ -0,0 +1,157 @@
+import asyncio
+import re
+from fnmatch import translate
+
+from .connection import Connection
+
+# Subscribers written to before yielding back to the event loop during a PUBLISH
+FANOUT_BATCH = 1024
+
+
+def bulk(data: str | bytes) -> bytes:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def glob_matcher(pattern: bytes):
+    """Compiled `match` of a glob pattern over bytes, like `fnmatch` does it."""
+    # latin-1 maps every byte to one code point and back
+    regex = translate(pattern.decode("latin-1")).encode("latin-1")
+    return re.compile(regex).match
+
+
+class PubSub:
+    """
+    Channel and pattern subscriptions.
+
+    A published message is encoded once per channel (and once per matching
+    pattern), with a RESP2 array and a RESP3 push header, and the same bytes
+    object is handed to every subscriber's transport using that protocol.
+    Writes are not drained: slow subscribers just accumulate transport buffer.
+    """
+
+    def __init__(self):
+        self.channels: dict[bytes, set[Connection]] = {}
+        # pattern -> (compiled matcher, subscribers)
+        self.patterns: dict[bytes, tuple] = {}
+
+    def subscribe(self, conn: Connection, channels: list[bytes]) -> tuple[bytes, ...]:
+        replies = []
+        for channel in channels:
+            if channel not in conn.channels:
+                conn.channels.add(channel)
+                self.channels.setdefault(channel, set()).add(conn)
+            replies.append(self.reply("subscribe", channel, conn))
+        return tuple(replies)
+
+    def unsubscribe(
+        self, conn: Connection, channels: list[bytes]
+    ) -> tuple[bytes, ...]:
+        if not channels:
+            channels = list(conn.channels)
+            if not channels:
+                return (self.reply("unsubscribe", None, conn),)
+        replies = []
+        for channel in channels:
+            if channel in conn.channels:
+                conn.channels.discard(channel)
+                subscribers = self.channels.get(channel)
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.channels[channel]
+            replies.append(self.reply("unsubscribe", channel, conn))
+        return tuple(replies)
+
+    def psubscribe(
+        self, conn: Connection, patterns: list[bytes]
+    ) -> tuple[bytes, ...]:
+        replies = []
+        for pattern in patterns:
+            if pattern not in conn.patterns:
+                conn.patterns.add(pattern)
+                if pattern not in self.patterns:
+                    self.patterns[pattern] = (glob_matcher(pattern), set())
+                self.patterns[pattern][1].add(conn)
+            replies.append(self.reply("psubscribe", pattern, conn))
+        return tuple(replies)
+
+    def punsubscribe(
+        self, conn: Connection, patterns: list[bytes]
+    ) -> tuple[bytes, ...]:
+        if not patterns:
+            patterns = list(conn.patterns)
+            if not patterns:
+                return (self.reply("punsubscribe", None, conn),)
+        replies = []
+        for pattern in patterns:
+            if pattern in conn.patterns:
+                conn.patterns.discard(pattern)
+                subscribers = self.patterns[pattern][1]
+                subscribers.discard(conn)
+                if not subscribers:
+                    del self.patterns[pattern]
+            replies.append(self.reply("punsubscribe", pattern, conn))
+        return tuple(replies)
+
+    def unsubscribe_all(self, conn: Connection) -> None:
+        if conn.channels:
+            self.unsubscribe(conn, [])
+        if conn.patterns:
+            self.punsubscribe(conn, [])
+
+    async def publish(
+        self, channel: bytes, message: bytes, in_exec: bool = False
+    ) -> int:
+        targets = []
+        subscribers = self.channels.get(channel)
+        if subscribers:
+            body = b"$7\r\nmessage\r\n" + bulk(channel) + bulk(message)
+            frames = self.frames(body, 3)
+            targets.append((frames, list(subscribers)))
+        for pattern, (matcher, subscribers) in self.patterns.items():
+            if matcher(channel):
+                body = (
+                    b"$8\r\npmessage\r\n"
+                    + bulk(pattern)
+                    + bulk(channel)
+                    + bulk(message)
+                )
+                frames = self.frames(body, 4)
+                targets.append((frames, list(subscribers)))
+
+        receivers = sum(len(conns) for _, conns in targets)
+        written = 0
+        for frames, conns in targets:
+            for conn in conns:
+                conn.send(frames[conn.protocol == 3])
+                written += 1
+                # Let other clients run between batches of a large fan-out,
+                # unless that would put their commands inside a transaction
+                if written % FANOUT_BATCH == 0 and not in_exec:
+                    await asyncio.sleep(0)
+        return receivers
+
+    def active_channels(self, pattern: bytes | None = None) -> list[bytes]:
+        if pattern is None:
+            return list(self.channels)
+        matcher = glob_matcher(pattern)
+        return [channel for channel in self.channels if matcher(channel)]
+
+    def numsub(self, channels: list[bytes]) -> list:
+        response = []
+        for channel in channels:
+            response.extend([channel, len(self.channels.get(channel, ()))])
+        return response
+
+    @staticmethod
+    def frames(body: bytes, length: int) -> tuple[bytes, bytes]:
+        """The RESP2 array and RESP3 push frames of `length` encoded elements."""
+        return b"*%d\r\n" % length + body, b">%d\r\n" % length + body
+
+    @staticmethod
+    def reply(kind: str, name: bytes | None, conn: Connection) -> bytes:
+        """A (un)subscribe confirmation, a push frame for RESP3 connections."""
+        name = bulk(name) if name is not None else b"$-1\r\n"
+        header = b">3\r\n" if conn.protocol == 3 else b"*3\r\n"
+        return header + bulk(kind) + name + b":%d\r\n" % conn.subscriptions
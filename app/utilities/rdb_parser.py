@@ -1,11 +1,57 @@
+import struct
 import time
+from . import listpack
+from .consumer_group import Consumer, ConsumerGroup, PendingEntry
+from .rdb_writer import STREAM_ITEM_DELETED, STREAM_ITEM_SAMEFIELDS
 from .store import Store
+from .sets import RedisSet
+from .stream import Stream
 import logging
 
+# Set members read and added at a time
+SET_BATCH = 1024
+# RDB payloads from this size on are parsed in the Offloader's process pool
+RDB_OFFLOAD_BYTES = 1024 * 1024
+# RDB_TYPE_STREAM_LISTPACKS, _2 (Redis 7.0) and _3 (Redis 7.2)
+STREAM_TYPES = (0x0F, 0x13, 0x15)
+
+
+def as_bytes(value: int | bytes) -> bytes:
+    """A listpack element as the string it was, integers are stored as such."""
+    return b"%d" % value if isinstance(value, int) else value
+
+
+def decode_stream_node(master_id: bytes, node: bytes) -> list[tuple]:
+    """The live `(ms, seq, fields)` entries of a stream node's listpack."""
+    master_ms, master_seq = struct.unpack(">QQ", master_id)
+    values = listpack.decode(node)
+    names = [as_bytes(name) for name in values[3 : 3 + values[2]]]
+    pos = 4 + len(names)  # the master entry ends with a 0
+    entries = []
+    while pos < len(values):
+        flags = values[pos]
+        ms = (master_ms + values[pos + 1]) % 2**64
+        seq = (master_seq + values[pos + 2]) % 2**64
+        pos += 3
+        if flags & STREAM_ITEM_SAMEFIELDS:
+            fields = []
+            for name, value in zip(names, values[pos : pos + len(names)]):
+                fields += [name, as_bytes(value)]
+            pos += len(names)
+        else:
+            size = 2 * values[pos]
+            fields = [as_bytes(value) for value in values[pos + 1 : pos + 1 + size]]
+            pos += 1 + size
+        pos += 1  # the number of elements of the entry
+        if not flags & STREAM_ITEM_DELETED:
+            entries.append((ms, seq, fields))
+    return entries
+
 
 class DatabaseParser:
     def __init__(self) -> None:
-        self.key_value_pair: dict = {}
+        # db number -> {key: (value, expire)}
+        self.databases: dict[int, dict] = {}
 
     def parse_lenght(self, data: bytes, current_index: int):
 
@@ -29,10 +75,10 @@ class DatabaseParser:
             length = (first_byte << 8) | second_byte  # Bitwise OR operation
 
         elif ms2_bits == 0b10:
-            length = int.from_bytes(
-                data[current_index : current_index + 4]
-            )  # Value of next 4bytes is length
-            current_index += 4
+            # 0x80 is followed by a 32 bit length, 0x81 by a 64 bit one
+            size = 8 if byte == 0x81 else 4
+            length = int.from_bytes(data[current_index : current_index + size])
+            current_index += size
 
         elif ms2_bits == 0b11:
             byte = byte & 0b00111111  # Remove the most significant 2 bits
@@ -47,24 +93,94 @@ class DatabaseParser:
 
         return (string, current_index)
 
+    def parse_stream(self, data: bytes, current_index: int, rdb_type: int):
+        """
+        A stream with its consumer groups, in any of the `STREAM_TYPES`: the
+        listpack nodes, the length and IDs, then each group with its pending
+        entries and consumers.
+        """
+        stream = Stream()
+        nodes, current_index = self.parse_lenght(data, current_index)
+        for _ in range(nodes):
+            master_id, current_index = self.parse_rdb_string(data, current_index)
+            node, current_index = self.parse_rdb_string(data, current_index)
+            block = decode_stream_node(master_id, node)
+            if block:
+                stream.blocks.append(block)
+        stream.length = sum(len(block) for block in stream.blocks)
+        numbers = 3 if rdb_type == 0x0F else 8  # then the first and max deleted IDs
+        values = []
+        for _ in range(numbers):
+            value, current_index = self.parse_lenght(data, current_index)
+            values.append(value)
+        stream.last_id = (values[1], values[2])
+        stream.entries_added = values[7] if rdb_type != 0x0F else values[0]
+
+        groups, current_index = self.parse_lenght(data, current_index)
+        for _ in range(groups):
+            name, current_index = self.parse_rdb_string(data, current_index)
+            ms, current_index = self.parse_lenght(data, current_index)
+            seq, current_index = self.parse_lenght(data, current_index)
+            if rdb_type != 0x0F:
+                _, current_index = self.parse_lenght(data, current_index)
+            group = stream.groups[bytes(name)] = ConsumerGroup(bytes(name), (ms, seq))
+
+            pel = {}  # id -> (delivery time, delivery count), owners come later
+            size, current_index = self.parse_lenght(data, current_index)
+            for _ in range(size):
+                id = struct.unpack_from(">QQ", data, current_index)
+                (time_ms,) = struct.unpack_from("<Q", data, current_index + 16)
+                count, current_index = self.parse_lenght(data, current_index + 24)
+                pel[id] = (time_ms, count)
+            owners = {}
+            size, current_index = self.parse_lenght(data, current_index)
+            for _ in range(size):
+                name, current_index = self.parse_rdb_string(data, current_index)
+                (seen_time,) = struct.unpack_from("<Q", data, current_index)
+                current_index += 16 if rdb_type == 0x15 else 8  # and the active time
+                consumer = group.consumers[bytes(name)] = Consumer(
+                    bytes(name), seen_time
+                )
+                ids, current_index = self.parse_lenght(data, current_index)
+                for _ in range(ids):
+                    owners[struct.unpack_from(">QQ", data, current_index)] = consumer
+                    current_index += 16
+            for id, (time_ms, count) in pel.items():
+                if id in owners:
+                    group.restore(PendingEntry(id, owners[id], time_ms, count))
+        return stream, current_index
+
     def database_parser(self, path: str = None, rdb_data: bytes = None):
+        self.databases = {}
         try:
             if not path:
                 data = rdb_data
             else:
-                print('path :', path)
                 with open(path, "rb") as file:
                     data = file.read()
-                    # print(f"DATA: {data}")
         except Exception as e:
             logging.error(e)
-            print(e)
             return None
 
-        magic, data = data[:5], data[5:]
-        ver, data = data[:4], data[4:]
-        current_index = 0
+        for db_number, key, value, expire_time, _ in self.iter_entries(data):
+            self.databases.setdefault(db_number, {})[key] = (value, expire_time)
+
+        return self.databases
+
+    def iter_entries(self, data: bytes, progress: bool = False):
+        """
+        Yield `(db number, key, value, expire, position)` for every key of the RDB
+        in `data` that has not expired yet.
+
+        `position` is the offset right after the entry, so a caller loading the
+        file step by step can tell how far it got. With `progress`, the offset
+        alone is also yielded every `SET_BATCH` members of a set, which lets
+        the caller pause in the middle of a big one. `data` is only indexed,
+        never sliced as a whole, so it can be an mmap of the file.
+        """
+        current_index = 9  # "REDIS" and the 4 digit version
         expire_time = None
+        db_number = 0
 
         while current_index < len(data):
             op_code = data[current_index]
@@ -101,23 +217,96 @@ class DatabaseParser:
                 key, current_index = self.parse_rdb_string(data, current_index)
                 value, current_index = self.parse_rdb_string(data, current_index)
 
-                if expire_time and expire_time < time.time():
-                    print('EXPIRED')
-                    pass
-                else:
+                if not (expire_time and expire_time < time.time()):
+                    yield (
+                        db_number,
+                        key,
+                        value,
+                        expire_time,
+                        current_index,
+                    )
+
+                expire_time = None
+
+            elif op_code == 0x02:  # Set, a length then that many strings
+                key, current_index = self.parse_rdb_string(data, current_index)
+                size, current_index = self.parse_lenght(data, current_index)
+                value = RedisSet()
+                members = []
+                for _ in range(size):
+                    member, current_index = self.parse_rdb_string(data, current_index)
+                    members.append(member)
+                    if len(members) == SET_BATCH:
+                        value.add(members)
+                        members = []
+                        if progress:
+                            yield current_index
+                value.add(members)
+
+                if not (expire_time and expire_time < time.time()):
+                    yield (
+                        db_number,
+                        key,
+                        value,
+                        expire_time,
+                        current_index,
+                    )
+
+                expire_time = None
+
+            elif op_code in STREAM_TYPES:
+                key, current_index = self.parse_rdb_string(data, current_index)
+                value, current_index = self.parse_stream(data, current_index, op_code)
 
-                    self.key_value_pair[key.decode("utf-8")] = (
-                        value.decode("utf-8"),
+                if not (expire_time and expire_time < time.time()):
+                    yield (
+                        db_number,
+                        key,
+                        value,
                         expire_time,
+                        current_index,
                     )
 
                 expire_time = None
             else:
                 continue
 
-        return self.key_value_pair
-
-    def update_store(self, store: Store, path: str):
-        self.database_parser(path)
-        store.store.update(self.key_value_pair)
+    def update_store(self, databases: list[Store], path: str = None, rdb_data=None):
+        """Load an RDB file into `databases`, keeping every key in its own db."""
+        self.database_parser(path, rdb_data)
+        self.load(databases, self.databases)
         return True
+
+    @staticmethod
+    def load(databases: list[Store], parsed: dict[int, dict]) -> None:
+        for db_number, key_value_pair in parsed.items():
+            if db_number < len(databases):
+                databases[db_number].load(key_value_pair)
+
+
+def parse_rdb(path: str = None, rdb_data: bytes = None) -> dict[int, dict]:
+    """Parse an RDB file in a worker process, see `Offloader.run_process`."""
+    return DatabaseParser().database_parser(path, rdb_data) or {}
+
+
+def load_dump(payload: bytes):
+    """The value in a DUMP payload, None if it is not one this server can read."""
+    # The payload ends with a 2 byte RDB version and an 8 byte checksum
+    body = payload[:-10]
+    parser = DatabaseParser()
+    try:
+        if body[0] == 0x00:
+            value, end = parser.parse_rdb_string(body, 1)
+        elif body[0] == 0x02:
+            size, end = parser.parse_lenght(body, 1)
+            members = []
+            for _ in range(size):
+                member, end = parser.parse_rdb_string(body, end)
+                members.append(member)
+            value = RedisSet()
+            value.add(members)
+        else:
+            return None
+    except (IndexError, TypeError):
+        return None
+    return value if end == len(body) else None
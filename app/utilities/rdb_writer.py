@@ -0,0 +1,208 @@
+import struct
+import time
+
+from . import listpack
+from .sets import RedisSet
+from .stream import Stream
+
+RDB_VERSION = b"REDIS0011"
+
+# Object types and op codes, as read back by DatabaseParser
+TYPE_STRING = 0x00
+TYPE_SET = 0x02
+TYPE_STREAM = 0x15  # RDB_TYPE_STREAM_LISTPACKS_3, nodes as listpacks
+OP_AUX = 0xFA
+OP_RESIZEDB = 0xFB
+OP_EXPIRETIME_MS = 0xFC
+OP_SELECTDB = 0xFE
+OP_EOF = 0xFF
+# Closes a DUMP payload together with a checksum
+DUMP_VERSION = struct.pack("<H", 11)
+
+CHUNK_SIZE = 64 * 1024
+# Flags of the entries in a stream node
+STREAM_ITEM_NONE = 0
+STREAM_ITEM_DELETED = 1
+STREAM_ITEM_SAMEFIELDS = 2
+# A consumer group's entries_read when it is not known
+UNKNOWN_ENTRIES_READ = 2**64 - 1
+
+
+def encode_length(length: int) -> bytes:
+    if length < 1 << 6:
+        return bytes((length,))
+    if length < 1 << 14:
+        return bytes((0x40 | length >> 8, length & 0xFF))
+    if length < 1 << 32:
+        return b"\x80" + struct.pack(">I", length)
+    return b"\x81" + struct.pack(">Q", length)
+
+
+def encode_string(value: str | bytes) -> bytes:
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return encode_length(len(value)) + value
+
+
+def encode_stream_id(id: tuple[int, int]) -> bytes:
+    """An ID as the 128 bit big endian key of the stream's radix tree."""
+    return struct.pack(">QQ", *id)
+
+
+def id_delta(value: int, base: int) -> int:
+    """`value - base` as the int64 it wraps to, like Redis' unsigned arithmetic."""
+    return (value - base + 2**63) % 2**64 - 2**63
+
+
+def encode_stream_node(block: list[tuple]) -> bytes:
+    """
+    A block of entries as the listpack of a stream node: a master entry with
+    the count and the field names of the first entry, then each entry as
+    flags, its ID relative to the first one, its fields (or only the values
+    when the names are the master's), and its number of elements.
+    """
+    master_ms, master_seq, master_fields = block[0]
+    names = master_fields[::2]
+    values = [len(block), 0, len(names), *names, 0]
+    for ms, seq, fields in block:
+        id = [id_delta(ms, master_ms), id_delta(seq, master_seq)]
+        if fields[::2] == names:
+            values += [STREAM_ITEM_SAMEFIELDS, *id, *fields[1::2], 3 + len(names)]
+        else:
+            pairs = len(fields) // 2
+            values += [STREAM_ITEM_NONE, *id, pairs, *fields, 4 + 2 * pairs]
+    return listpack.encode(values)
+
+
+def iter_stream(stream: Stream):
+    """
+    The RDB body of `stream`, one part per node then one for the metadata and
+    the consumer groups with their pending entries.
+    """
+    blocks = [block for block in stream.blocks if block]
+    yield encode_length(len(blocks))
+    for block in blocks:
+        yield encode_string(encode_stream_id(block[0][:2]))
+        yield encode_string(encode_stream_node(block))
+
+    first_id = blocks[0][0][:2] if blocks else (0, 0)
+    body = bytearray(encode_length(len(stream)))
+    for number in (*stream.last_id, *first_id, 0, 0, stream.entries_added):
+        body += encode_length(number)  # 0-0 as the max deleted entry ID
+    # Groups and consumers in name order, as Redis keeps them in radix trees
+    body += encode_length(len(stream.groups))
+    for _, group in sorted(stream.groups.items()):
+        body += encode_string(group.name)
+        body += encode_length(group.last_delivered[0])
+        body += encode_length(group.last_delivered[1])
+        body += encode_length(UNKNOWN_ENTRIES_READ)
+        pending = list(group.iter_pending((0, 0)))
+        body += encode_length(len(pending))
+        for entry in pending:
+            body += encode_stream_id(entry.id)
+            body += struct.pack("<Q", entry.delivery_time)
+            body += encode_length(entry.delivery_count)
+        body += encode_length(len(group.consumers))
+        for _, consumer in sorted(group.consumers.items()):
+            body += encode_string(consumer.name)
+            # The seen time and the active time, only the first one is tracked
+            body += struct.pack("<QQ", consumer.seen_time, consumer.seen_time)
+            body += encode_length(len(consumer.pending))
+            for id in sorted(consumer.pending):
+                body += encode_stream_id(id)
+    yield bytes(body)
+
+
+def dump_value(value) -> bytes:
+    """
+    DUMP payload of `value`: its RDB type and encoding followed by the RDB
+    version and a checksum, left as zero like in the files written here.
+    """
+    if isinstance(value, RedisSet):
+        body = bytearray((TYPE_SET,))
+        body += encode_length(len(value))
+        for member in value:
+            body += encode_string(member)
+    else:
+        body = bytearray((TYPE_STRING,))
+        body += encode_string(value)
+    return bytes(body) + DUMP_VERSION + bytes(8)
+
+
+def snapshot(databases: list) -> list[tuple[int, list[tuple]]]:
+    """
+    Point in time view of every non empty database, as `(db number, entries)`
+    pairs where entries are `(key, value, expire)` tuples.
+
+    Immutable string values are only referenced. Sets, mutable strings and
+    streams are copied since they change in place, mostly a C level copy of
+    the members, bytes or stream blocks. Keys that already expired are left out.
+    """
+    now = time.time()
+    result = []
+    for db_number, store in enumerate(databases):
+        entries = []
+        for key, (value, expire) in store.store.items():
+            if expire is not None and expire < now:
+                continue
+            if isinstance(value, RedisSet):
+                value = value.copy()
+            elif isinstance(value, bytearray):
+                value = bytes(value)
+            entries.append((key, value, expire))
+        for key, stream in store.stream.items():
+            entries.append((key, stream.copy(), None))
+        if entries:
+            result.append((db_number, entries))
+    return result
+
+
+def iter_rdb(databases: list[tuple[int, list[tuple]]], chunk_size: int = CHUNK_SIZE):
+    """
+    Serialize a `snapshot` to RDB, yielding chunks of about `chunk_size` bytes.
+
+    The caller can hand each chunk to the network before the next one is built,
+    so the whole file is never held in memory. The checksum is left as zero,
+    which means "not computed" to RDB readers.
+    """
+    buffer = bytearray(RDB_VERSION)
+    buffer += bytes((OP_AUX,)) + encode_string("redis-ver") + encode_string("7.2.0")
+
+    for db_number, entries in databases:
+        buffer += bytes((OP_SELECTDB,)) + encode_length(db_number)
+        expires = sum(1 for entry in entries if entry[2] is not None)
+        buffer += bytes((OP_RESIZEDB,)) + encode_length(len(entries))
+        buffer += encode_length(expires)
+
+        for key, value, expire in entries:
+            if expire is not None:
+                buffer.append(OP_EXPIRETIME_MS)
+                buffer += struct.pack("<Q", int(expire * 1000))
+            if isinstance(value, RedisSet):
+                buffer.append(TYPE_SET)
+                buffer += encode_string(key)
+                buffer += encode_length(len(value))
+                for member in value:
+                    buffer += encode_string(member)
+                    if len(buffer) >= chunk_size:
+                        yield bytes(buffer)
+                        buffer.clear()
+            elif isinstance(value, Stream):
+                buffer.append(TYPE_STREAM)
+                buffer += encode_string(key)
+                for part in iter_stream(value):
+                    buffer += part
+                    if len(buffer) >= chunk_size:
+                        yield bytes(buffer)
+                        buffer.clear()
+            else:
+                buffer.append(TYPE_STRING)
+                buffer += encode_string(key)
+                buffer += encode_string(value)
+            if len(buffer) >= chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+
+    buffer.append(OP_EOF)
+    buffer += bytes(8)
+    yield bytes(buffer)
@@ -0,0 +1,279 @@
+import itertools
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from heapq import merge
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+SCAN_SNAPSHOTS = 64  # SSCAN iterations in progress kept per database
+
+
+def as_int_member(member: bytes) -> int | None:
+    """
+    Return the integer value of a set member if it can be stored in an intset.
+
+    Only canonical decimal representations fit ("12" does, "012" and "+12" do not),
+    otherwise SMEMBERS could not give the member back exactly as it was added.
+    """
+    if not member or len(member) > 20:
+        return None
+    try:
+        value = int(member)
+    except ValueError:
+        return None
+    if b"%d" % value != member or not INT64_MIN <= value <= INT64_MAX:
+        return None
+    return value
+
+
+class IntSet:
+    """
+    Sorted array of signed 64 bit integers.
+
+    Uses 8 bytes per member instead of a hash table slot plus a bytes object,
+    lookups are a binary search.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, values=()):
+        self._data = array("q", sorted(set(values)))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __contains__(self, value: int) -> bool:
+        data = self._data
+        i = bisect_left(data, value)
+        return i < len(data) and data[i] == value
+
+    def add(self, value: int) -> bool:
+        data = self._data
+        i = bisect_left(data, value)
+        if i < len(data) and data[i] == value:
+            return False
+        data.insert(i, value)
+        return True
+
+    def update(self, values: list[int]) -> int:
+        """Add many values with a single linear merge instead of one insert each."""
+        new = sorted({value for value in values if value not in self})
+        if not new:
+            return 0
+        if len(new) == 1:
+            self.add(new[0])
+        else:
+            self._data = array("q", merge(self._data, new))
+        return len(new)
+
+    def remove(self, value: int) -> bool:
+        data = self._data
+        i = bisect_left(data, value)
+        if i < len(data) and data[i] == value:
+            del data[i]
+            return True
+        return False
+
+    def slice(self, start: int, stop: int) -> list[int]:
+        return self._data[start:stop].tolist()
+
+    def copy(self) -> "IntSet":
+        clone = IntSet()
+        clone._data = array("q", self._data)
+        return clone
+
+
+class RedisSet:
+    """
+    Set value stored in `Store.store`.
+
+    Starts as an `IntSet` while every member is an integer and there are at most
+    `max_intset_entries` of them, then gets promoted to a plain `set` of bytes.
+    Promotion is one way, like the intset -> hashtable conversion in Redis.
+    """
+
+    __slots__ = ("_members", "max_intset_entries")
+
+    def __init__(self, max_intset_entries: int = 512):
+        self._members: IntSet | set = IntSet()
+        self.max_intset_entries = max_intset_entries
+
+    @property
+    def encoding(self) -> str:
+        return "intset" if isinstance(self._members, IntSet) else "hashtable"
+
+    @property
+    def is_intset(self) -> bool:
+        return isinstance(self._members, IntSet)
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __iter__(self):
+        """Yield members as bytes, the way they are replied to clients."""
+        if self.is_intset:
+            return map(b"%d".__mod__, self._members)
+        return iter(self._members)
+
+    def __contains__(self, member: bytes) -> bool:
+        if self.is_intset:
+            value = as_int_member(member)
+            return value is not None and value in self._members
+        return member in self._members
+
+    def raw_members(self):
+        """Members in their native encoding: ints for an intset, bytes otherwise."""
+        return iter(self._members)
+
+    def add(self, members: list[bytes]) -> int:
+        if self.is_intset:
+            values = [as_int_member(member) for member in members]
+            if None not in values:
+                added = self._members.update(values)
+                if len(self._members) > self.max_intset_entries:
+                    self._promote()
+                return added
+            self._promote()
+        before = len(self._members)
+        self._members.update(members)
+        return len(self._members) - before
+
+    def remove(self, members: list[bytes]) -> int:
+        removed = 0
+        if self.is_intset:
+            for member in members:
+                value = as_int_member(member)
+                if value is not None and self._members.remove(value):
+                    removed += 1
+            return removed
+        for member in members:
+            if member in self._members:
+                self._members.discard(member)
+                removed += 1
+        return removed
+
+    def discard_batch(self, count: int) -> int:
+        """Remove up to `count` arbitrary members and return how many are left."""
+        if self.is_intset:
+            self._members = IntSet()  # a single buffer, no point in going in steps
+            return 0
+        members = self._members
+        for _ in range(min(count, len(members))):
+            members.pop()
+        return len(members)
+
+    def copy(self) -> "RedisSet":
+        """A copy whose members no longer change with this set, e.g. for a snapshot."""
+        clone = RedisSet(self.max_intset_entries)
+        clone._members = self._members.copy()
+        return clone
+
+    def memory_usage(self, samples: int) -> int:
+        """Estimated bytes, from the average size of `samples` members."""
+        if self.is_intset:
+            # A single array buffer, measured exactly
+            return sys.getsizeof(self) + sys.getsizeof(self._members._data)
+        size = sys.getsizeof(self) + sys.getsizeof(self._members)
+        sample = list(itertools.islice(self._members, samples))
+        if sample:
+            size += sum(map(sys.getsizeof, sample)) * len(self) // len(sample)
+        return size
+
+    def _promote(self) -> None:
+        self._members = set(map(b"%d".__mod__, self._members))
+
+
+class SetScans:
+    """
+    SSCAN iterations in progress.
+
+    Scanning a set bigger than one batch takes a snapshot of its members on the
+    first call and walks it, so every member present during the whole scan is
+    returned exactly once, whatever happens to the set in between, and a full
+    scan is O(n). The cursor is `scan id << 32 | position`. Beyond `limit`
+    scans in progress the oldest snapshot is dropped, and a cursor whose
+    snapshot is gone starts its scan over.
+    """
+
+    def __init__(self, limit: int = SCAN_SNAPSHOTS):
+        self.limit = limit
+        # scan id -> (the set scanned, its members when the scan started)
+        self.snapshots: OrderedDict[int, tuple[RedisSet, list[bytes]]] = OrderedDict()
+        self._next_id = itertools.count(1).__next__
+
+    def scan(self, value: RedisSet, cursor: int, count: int) -> tuple[int, list]:
+        """Up to `count` members from `cursor` and the next cursor, 0 at the end."""
+        scan_id, position = cursor >> 32, cursor & 0xFFFFFFFF
+        snapshot = self.snapshots.pop(scan_id, None)
+        if snapshot is None or snapshot[0] is not value:
+            if len(value) <= count:
+                return 0, list(value)
+            snapshot, position, scan_id = (value, list(value)), 0, self._next_id()
+        members = snapshot[1]
+        batch = members[position : position + count]
+        position += len(batch)
+        if position >= len(members):
+            return 0, batch
+        self.snapshots[scan_id] = snapshot
+        if len(self.snapshots) > self.limit:
+            self.snapshots.popitem(last=False)
+        return scan_id << 32 | position, batch
+
+    def clear(self) -> None:
+        self.snapshots.clear()
+
+
+def intersect(sets: list[RedisSet], limit: int = 0) -> list[bytes]:
+    """
+    Intersect sets, walking the smallest one and probing the others.
+
+    Stops as soon as `limit` members were found (0 means no limit).
+    """
+    if not sets or any(len(s) == 0 for s in sets):
+        return []
+    sets = sorted(sets, key=len)
+    smallest, others = sets[0], sets[1:]
+    result = []
+    if smallest.is_intset and all(s.is_intset for s in others):
+        # Compare ints directly and skip the bytes round trip per probe
+        others = [s._members for s in others]
+        for value in smallest.raw_members():
+            if all(value in other for other in others):
+                result.append(b"%d" % value)
+                if limit and len(result) >= limit:
+                    break
+        return result
+    for member in smallest:
+        if all(member in other for other in others):
+            result.append(member)
+            if limit and len(result) >= limit:
+                break
+    return result
+
+
+def combine(op: str, sets: list[RedisSet | None], limit: int = 0) -> list[bytes]:
+    """SINTER, SUNION or SDIFF of `sets`, None standing for a missing key."""
+    if op == "SINTER":
+        return [] if None in sets else intersect(sets, limit)
+    if op == "SUNION":
+        return union([s for s in sets if s is not None])
+    return difference(sets[0], [s for s in sets[1:] if s is not None])
+
+
+def union(sets: list[RedisSet]) -> list[bytes]:
+    result = set()
+    for s in sets:
+        result.update(s)
+    return list(result)
+
+
+def difference(first: RedisSet | None, others: list[RedisSet]) -> list[bytes]:
+    if first is None:
+        return []
+    others = [s for s in others if len(s)]
+    return [member for member in first if not any(member in s for s in others)]
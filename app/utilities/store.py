@@ -1,17 +1,74 @@
 import time
 import asyncio
+from fnmatch import fnmatchcase
+from itertools import islice
+from .sets import RedisSet, SetScans, combine
+from .parser_protocol import SimpleString
+from .stream import Stream, check_id, parse_id, format_id, INVALID_ID, MAX_SEQ
+from .consumer_group import Consumer, ConsumerGroup, now_ms
+from .cluster import key_slot
+from . import bitmaps, hyperloglog, keystats
+
+NOGROUP = "NOGROUP No such key '{key}' or consumer group '{group}'"
+
+WRONGTYPE = {
+    "error": "WRONGTYPE Operation against a key holding the wrong kind of value"
+}
+
+MAX_STRING_LENGTH = 512 * 1024 * 1024
+STRING_TOO_LONG = {"error": "string exceeds maximum allowed size (proto-max-bulk-len)"}
+
+
+def match_keys(keys, streams, expires: dict, pattern: bytes) -> list[bytes]:
+    """KEYS over iterables of key names, skipping keys that already expired."""
+    now = time.time()
+    result = [
+        key
+        for key in keys
+        if not (key in expires and expires[key] < now)
+        and (pattern == b"*" or fnmatchcase(key, pattern))
+    ]
+    result.extend(
+        key for key in streams if pattern == b"*" or fnmatchcase(key, pattern)
+    )
+    return result
 
 
 class Store:
 
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config
         self.store = {}
         self.stream = {}
+        # key -> expire time, for the keys of `store` that have one
+        self.expires: dict[str, float] = {}
+        self.expired_keys = 0  # keys deleted because they expired, for INFO stats
         self.last_stream = "0-0"
 
+        # WATCH support: versions are only kept for keys someone is watching
+        self.watchers: dict[str, int] = {}
+        self.versions: dict[str, int] = {}
+        self._version = 0
+
+        # CLIENT TRACKING table and LazyFree, set by the CommandHandler
+        self.tracking = None
+        self.lazyfree = None
+
+        # key -> LFU access frequency, packed as `minutes << 8 | counter`
+        self.lfu: dict[bytes, int] = {}
+        self.set_scans: SetScans = SetScans()
+
+        # Futures of clients blocked on a stream, resolved by the next XADD
+        self.stream_waiters: dict[str, set[asyncio.Future]] = {}
+
+        # Cluster mode: hash slot -> its keys, so a slot is listed or migrated
+        # without a scan of the whole keyspace
+        self.cluster_enabled = getattr(config, "cluster_enabled", False)
+        self.slot_keys: dict[int, set[bytes]] = {}
+
         self.arguments = {
-            "px": self.px,
-            "ex": self.ex,
+            b"px": self.px,
+            b"ex": self.ex,
         }
 
     def set(self, key: str, value: any, args: list):
@@ -25,14 +82,14 @@ class Store:
         """
         expire_time = None
         if args:
-            args = list(map(str.lower, args))
-            if "nx" in args:
-                args.remove("nx")
+            args = [arg.lower() for arg in args]
+            if b"nx" in args:
+                args.remove(b"nx")
                 val = self.check_availability(key)
                 if val:
                     return False
-            elif "xx" in args:
-                args.remove("xx")
+            elif b"xx" in args:
+                args.remove(b"xx")
                 val = self.check_availability(key)
                 if not val:
                     return False
@@ -43,7 +100,17 @@ class Store:
                 expire_time = self.call_args(arg, param)
                 args = args[2:]
 
+        old = self.store.get(key)
         self.store[key] = (value, expire_time)
+        if old is not None:
+            self.release(old[0])
+        else:
+            self.index(key)
+        if expire_time is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = expire_time
+        self.touch(key)
         return True
 
     def get(self, key: str):
@@ -56,45 +123,562 @@ class Store:
         """
         value, expire_time = self.store.get(key, (None, None))
         if expire_time is not None and expire_time < time.time():
-            del self.store[key]
+            self.delete(key)
+            self.expired_keys += 1
+            return None
+        return value
+
+    def delete(self, key: str) -> None:
+        """Remove an expired or emptied key, a big value is freed lazily."""
+        value, _ = self.store.pop(key)
+        self.expires.pop(key, None)
+        self.lfu.pop(key, None)
+        self.unindex(key)
+        self.touch(key)
+        self.release(value)
+
+    def remove(self, key: str):
+        """Remove `key` whatever its type (DEL / UNLINK), returns its value or None."""
+        if self.check_availability(key):
+            value, _ = self.store.pop(key)
+            self.expires.pop(key, None)
+        elif key in self.stream:
+            value = self.stream.pop(key)
+        else:
             return None
+        self.lfu.pop(key, None)
+        self.unindex(key)
+        self.touch(key)
         return value
 
-    def xadd(self, key: str, id: str, data: list):
-        validation = self.validate_stream_id(id, self.last_stream)
+    def exists(self, key: bytes) -> bool:
+        return bool(self.check_availability(key)) or key in self.stream
+
+    def index(self, key: bytes) -> None:
+        if self.cluster_enabled:
+            self.slot_keys.setdefault(key_slot(key), set()).add(key)
+
+    def unindex(self, key: bytes) -> None:
+        if self.cluster_enabled:
+            slot = key_slot(key)
+            keys = self.slot_keys.get(slot)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.slot_keys[slot]
+
+    def count_keys_in_slot(self, slot: int) -> int:
+        return len(self.slot_keys.get(slot, ()))
+
+    def keys_in_slot(self, slot: int, count: int) -> list[bytes]:
+        return list(islice(self.slot_keys.get(slot, ()), count))
+
+    def record_access(self, key: bytes, weight: int = 1) -> None:
+        """Bump the LFU counter of `key` if it exists, for `weight` accesses."""
+        if key in self.store or key in self.stream:
+            self.lfu[key] = keystats.lfu_access(
+                self.lfu.get(key),
+                getattr(self.config, "lfu_log_factor", 10),
+                getattr(self.config, "lfu_decay_time", 1),
+                weight,
+            )
+
+    def object_freq(self, key: bytes) -> int | None:
+        """OBJECT FREQ: the decayed LFU counter, None if there is no such key."""
+        if not self.check_availability(key) and key not in self.stream:
+            return None
+        packed = self.lfu.get(key)
+        if packed is None:
+            return keystats.LFU_INIT_VAL
+        return keystats.lfu_counter(packed, getattr(self.config, "lfu_decay_time", 1))
+
+    def release(self, value) -> None:
+        if self.lazyfree is not None:
+            self.lazyfree.free(value)
+
+    def touch(self, key: str) -> None:
+        """
+        Mark `key` as modified for any client WATCHing it and send invalidations
+        to clients caching it. O(1) per write.
+        """
+        if key in self.watchers:
+            self._version += 1
+            self.versions[key] = self._version
+        if self.tracking is not None:
+            self.tracking.invalidate(key)
+
+    def watch(self, key: str) -> int:
+        """Start watching `key` and return its current version."""
+        self.get(key)  # let a key that already expired count as modified now
+        self.watchers[key] = self.watchers.get(key, 0) + 1
+        return self.versions.get(key, 0)
+
+    def unwatch(self, key: str) -> None:
+        count = self.watchers.get(key, 0) - 1
+        if count > 0:
+            self.watchers[key] = count
+        else:
+            self.watchers.pop(key, None)
+            self.versions.pop(key, None)
+
+    def is_dirty(self, key: str, version: int) -> bool:
+        """True if the watched `key` changed since `version` was taken."""
+        self.get(key)
+        return self.versions.get(key, 0) != version
+
+    def touch_watched(self) -> None:
+        """Mark every watched key as modified, e.g. after FLUSHDB or SWAPDB."""
+        for key in self.watchers:
+            self._version += 1
+            self.versions[key] = self._version
+
+    def load(self, pairs: dict) -> None:
+        """Add `key -> (value, expire)` pairs read from an RDB file."""
+        for key, (value, expire_time) in pairs.items():
+            self.restore(key, value, expire_time)
+
+    def restore(self, key: str, value, expire_time: float | None) -> None:
+        """Add one key read from an RDB file."""
+        if isinstance(value, Stream):
+            if key not in self.stream:
+                self.index(key)
+            max_entries = getattr(self.config, "stream_node_max_entries", 100)
+            value.node_max_entries = max_entries
+            self.stream[key] = value
+            return
+        if key not in self.store:
+            self.index(key)
+        self.store[key] = (value, expire_time)
+        if expire_time is not None:
+            self.expires[key] = expire_time
+
+    def flush(self) -> tuple[dict, dict]:
+        """
+        Empty the database.
+
+        Returns the detached key and stream dicts, so the caller decides when
+        their memory is released.
+        """
+        store, stream = self.store, self.stream
+        self.store, self.stream, self.expires = {}, {}, {}
+        self.slot_keys, self.lfu = {}, {}
+        self.set_scans.clear()
+        self.touch_watched()
+        return store, stream
+
+    def dbsize(self) -> int:
+        return len(self.store) + len(self.stream)
+
+    def keys(self, pattern: str) -> list[str]:
+        return match_keys(self.store, self.stream, self.expires, pattern)
+
+    def get_stream(self, key: str, create: bool = False) -> Stream | None:
+        stream = self.stream.get(key)
+        if stream is None and create:
+            max_entries = getattr(self.config, "stream_node_max_entries", 100)
+            stream = self.stream[key] = Stream(max_entries)
+            self.index(key)
+        return stream
+
+    def xadd(
+        self,
+        key: str,
+        id: str,
+        data: list,
+        trim: tuple | None = None,
+        nomkstream: bool = False,
+    ):
+        """
+        Append an entry to the stream at `key`, creating it unless `nomkstream`.
+
+        `trim` is an optional `(strategy, approx, threshold, limit)` tuple as parsed
+        from the MAXLEN / MINID options, applied after the entry is added.
+        """
+        stream = self.get_stream(key)
+        if stream is None and nomkstream:
+            return None
+        # Validated before the stream is created, so a bad ID leaves no key
+        last_id = stream.last_id_str if stream is not None else "0-0"
+        validation = self.validate_stream_id(id, last_id)
         if isinstance(validation, dict):
-            print("Validation error: ", validation)
             return validation
 
         id = validation
-
-        slot = self.stream.get(key, None)
-        if slot:
-            self.stream[key][id] = data
-        else:
-            self.stream[key] = {id: data}
+        stream = self.get_stream(key, create=True)
+        stream.add(parse_id(id), data)
+        if trim is not None:
+            self.trim_stream(stream, *trim)
 
         self.last_stream = id
+        self.touch(key)
+        self.signal_stream(key)
 
         return id
 
+    def signal_stream(self, key: str) -> None:
+        """Wake every client blocked on the stream at `key`."""
+        waiters = self.stream_waiters.pop(key, None)
+        if waiters:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(key)
+
+    async def wait_for_streams(self, keys: list, timeout: float | None) -> bool:
+        """
+        Block until an entry is added to one of `keys`, without polling.
+
+        Returns False on timeout, `timeout` None blocks forever.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        for key in keys:
+            self.stream_waiters.setdefault(key, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for key in keys:
+                waiters = self.stream_waiters.get(key)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self.stream_waiters[key]
+
+    def get_group(self, key: str, group: str) -> ConsumerGroup | dict:
+        stream = self.get_stream(key)
+        if stream is None or group not in stream.groups:
+            return {
+                "error": NOGROUP.format(
+                    key=key.decode(errors="replace"),
+                    group=group.decode(errors="replace"),
+                )
+            }
+        return stream.groups[group]
+
+    def xgroup_create(
+        self, key: str, group: str, id: str, mkstream: bool = False
+    ) -> str | dict:
+        stream = self.get_stream(key, create=mkstream)
+        if stream is None:
+            return {
+                "error": "The XGROUP subcommand requires the key to exist. Note that for CREATE you may want to use the MKSTREAM option to create an empty stream automatically."
+            }
+        if group in stream.groups:
+            return {"error": "BUSYGROUP Consumer Group name already exists"}
+        last = stream.last_id if id == "$" else parse_id(id)
+        stream.groups[group] = ConsumerGroup(group, last)
+        self.touch(key)
+        return "OK"
+
+    def xgroup_setid(self, key: str, group: str, id: str) -> str | dict:
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        stream = self.get_stream(key)
+        consumer_group.last_delivered = stream.last_id if id == "$" else parse_id(id)
+        return "OK"
+
+    def xgroup_destroy(self, key: str, group: str) -> int:
+        stream = self.get_stream(key)
+        if stream is None or stream.groups.pop(group, None) is None:
+            return 0
+        self.touch(key)
+        # Clients blocked on the group must notice it is gone
+        self.signal_stream(key)
+        return 1
+
+    def xgroup_createconsumer(self, key: str, group: str, name: str) -> int | dict:
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        if name in consumer_group.consumers:
+            return 0
+        consumer_group.consumer(name)
+        return 1
+
+    def xgroup_delconsumer(self, key: str, group: str, name: str) -> int | dict:
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        return consumer_group.delete_consumer(name)
+
+    def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        keys: list,
+        ids: list,
+        count: int | None = None,
+        noack: bool = False,
+        effects: list | None = None,
+    ) -> list | dict | None:
+        """
+        Read for `consumer` of `group` from each stream.
+
+        `>` reads entries never delivered to the group and adds them to the PEL,
+        any other ID re-reads the consumer's own pending entries after that ID.
+        Returns None when no stream has anything new to deliver.
+
+        The changes to the groups are added to `effects` as the commands that
+        replay them on a replica: XCLAIM ... JUSTID for each delivered entry and
+        XGROUP SETID, since re-running the read would depend on the replica's
+        clock.
+        """
+        time_ms = now_ms()
+        response = []
+        for key, id in zip(keys, ids):
+            consumer_group = self.get_group(key, group)
+            if isinstance(consumer_group, dict):
+                return consumer_group
+            stream = self.get_stream(key)
+            reader = self.group_consumer(key, consumer_group, consumer, effects)
+            reader.seen_time = time_ms
+            if id == ">":
+                entries = stream.after(consumer_group.last_delivered, count)
+                if not entries:
+                    continue
+                consumer_group.last_delivered = parse_id(entries[-1][0])
+                if not noack:
+                    for entry_id, _ in entries:
+                        entry_id = parse_id(entry_id)
+                        consumer_group.deliver(entry_id, reader, time_ms)
+                        if effects is not None:
+                            entry = consumer_group.pel[entry_id]
+                            effects.append(consumer_group.claim_command(key, entry))
+                if effects is not None:
+                    effects.append(["XGROUP", "SETID", key, group, entries[-1][0]])
+                response.append([key, entries])
+            else:
+                start = parse_id(id)
+                pending = sorted(
+                    entry_id for entry_id in reader.pending if entry_id > start
+                )
+                if count:
+                    pending = pending[:count]
+                entries = [
+                    [format_id(entry_id), stream.get(entry_id)] for entry_id in pending
+                ]
+                response.append([key, entries])
+        return response or None
+
+    @staticmethod
+    def group_consumer(
+        key: bytes, group: ConsumerGroup, name: bytes, effects: list | None
+    ) -> Consumer:
+        """The consumer called `name`, created as XGROUP CREATECONSUMER does."""
+        consumer = group.consumer(name, create=False)
+        if consumer is None:
+            consumer = group.consumer(name)
+            if effects is not None:
+                effects.append(["XGROUP", "CREATECONSUMER", key, group.name, name])
+        return consumer
+
+    def xack(self, key: str, group: str, ids: list) -> int:
+        stream = self.get_stream(key)
+        if stream is None or group not in stream.groups:
+            return 0
+        consumer_group = stream.groups[group]
+        return sum(consumer_group.ack(parse_id(id)) for id in ids)
+
+    def xpending(
+        self,
+        key: str,
+        group: str,
+        start: str | None = None,
+        end: str = "+",
+        count: int = 0,
+        consumer: str | None = None,
+        min_idle: int = 0,
+    ) -> list | dict:
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        if start is None:
+            return consumer_group.summary()
+        time_ms = now_ms()
+        end_id = parse_id(end, MAX_SEQ)
+        response = []
+        for entry in consumer_group.iter_pending(parse_id(start)):
+            if entry.id > end_id or len(response) >= count:
+                break
+            if consumer is not None and entry.consumer.name != consumer:
+                continue
+            idle = time_ms - entry.delivery_time
+            if idle < min_idle:
+                continue
+            response.append(
+                [format_id(entry.id), entry.consumer.name, idle, entry.delivery_count]
+            )
+        return response
+
+    def xclaim(
+        self,
+        key: str,
+        group: str,
+        consumer: str,
+        min_idle: int,
+        ids: list,
+        idle: int | None = None,
+        retrycount: int | None = None,
+        force: bool = False,
+        justid: bool = False,
+        lastid: str | None = None,
+        effects: list | None = None,
+    ) -> list | dict:
+        """
+        XCLAIM, the changes are added to `effects` like `xreadgroup` does: the
+        claims as XCLAIM ... JUSTID with their exact time and delivery count,
+        entries gone from the stream as XACK.
+        """
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        stream = self.get_stream(key)
+        time_ms = now_ms()
+        if lastid is not None:
+            consumer_group.last_delivered = max(
+                consumer_group.last_delivered, parse_id(lastid)
+            )
+        claimer = self.group_consumer(key, consumer_group, consumer, effects)
+        response = []
+        for id in ids:
+            id = parse_id(id)
+            fields = stream.get(id)
+            entry = consumer_group.pel.get(id)
+            if entry is None:
+                if not force or fields is None:
+                    continue
+                consumer_group.deliver(id, claimer, time_ms)
+                entry = consumer_group.pel[id]
+                entry.delivery_count = 0
+            if fields is None:
+                # The entry was deleted from the stream, drop it from the PEL
+                consumer_group.ack(id)
+                if effects is not None:
+                    effects.append(["XACK", key, group, format_id(id)])
+                continue
+            if min_idle and time_ms - entry.delivery_time < min_idle:
+                continue
+            consumer_group.claim(entry, claimer, time_ms)
+            if idle is not None:
+                entry.delivery_time = time_ms - idle
+            if retrycount is not None:
+                entry.delivery_count = retrycount
+            elif not justid:
+                entry.delivery_count += 1
+            if effects is not None:
+                effects.append(consumer_group.claim_command(key, entry))
+            response.append(format_id(id) if justid else [format_id(id), fields])
+        return response
+
+    def xautoclaim(
+        self,
+        key: str,
+        group: str,
+        consumer: str,
+        min_idle: int,
+        start: str,
+        count: int = 100,
+        justid: bool = False,
+        effects: list | None = None,
+    ) -> list | dict:
+        """
+        Claim up to `count` entries idle for at least `min_idle` ms, from `start`.
+
+        Looks at no more than `count * 10` pending entries per call and returns
+        the cursor to continue from, like Redis does. `effects` as in `xclaim`.
+        """
+        consumer_group = self.get_group(key, group)
+        if isinstance(consumer_group, dict):
+            return consumer_group
+        stream = self.get_stream(key)
+        time_ms = now_ms()
+        claimer = self.group_consumer(key, consumer_group, consumer, effects)
+        claimed, deleted = [], []
+        attempts = count * 10
+        cursor = "0-0"
+        for entry in consumer_group.iter_pending(parse_id(start)):
+            if attempts == 0 or len(claimed) >= count:
+                cursor = format_id(entry.id)
+                break
+            attempts -= 1
+            fields = stream.get(entry.id)
+            if fields is None:
+                deleted.append(format_id(entry.id))
+                continue
+            if time_ms - entry.delivery_time < min_idle:
+                continue
+            consumer_group.claim(entry, claimer, time_ms)
+            if not justid:
+                entry.delivery_count += 1
+            if effects is not None:
+                effects.append(consumer_group.claim_command(key, entry))
+            claimed.append(
+                format_id(entry.id) if justid else [format_id(entry.id), fields]
+            )
+        for id in deleted:
+            consumer_group.ack(parse_id(id))
+        if deleted and effects is not None:
+            effects.append(["XACK", key, group, *deleted])
+        return [cursor, claimed, deleted]
+
+    def xtrim(
+        self, key: str, strategy: str, approx: bool, threshold: str, limit: int = 0
+    ) -> int:
+        stream = self.get_stream(key)
+        if stream is None:
+            return 0
+        removed = self.trim_stream(stream, strategy, approx, threshold, limit)
+        if removed:
+            self.touch(key)
+        return removed
+
+    @staticmethod
+    def trim_stream(
+        stream: Stream, strategy: str, approx: bool, threshold: str, limit: int = 0
+    ) -> int:
+        if strategy == "MAXLEN":
+            return stream.trim_maxlen(int(threshold), approx, limit)
+        return stream.trim_minid(parse_id(threshold), approx, limit)
+
+    def xdel(self, key: str, ids: list) -> int:
+        stream = self.get_stream(key)
+        if stream is None:
+            return 0
+        deleted = stream.delete([parse_id(id) for id in ids])
+        if deleted:
+            self.touch(key)
+        return deleted
+
+    def xlen(self, key: str) -> int:
+        stream = self.get_stream(key)
+        return len(stream) if stream is not None else 0
+
     def xrange(self, key: str, args: list):
-        start, end = args
-        array = self.stream.get(key, {})
-        if start == "-":
-            start = "0-0"
-        elif start.isdigit():
-            start += "-0"
-        if end == "+":
-            end = self.last_stream
-        data = list(
-            filter(lambda x: self.collect_range_data(x, start, end), array.items())
-        )
-        data = list(map(list, data))
-        return data
+        bounds = self.parse_range(args)
+        if isinstance(bounds, dict):
+            return bounds
+        stream = self.get_stream(key)
+        if stream is None:
+            return []
+        return stream.range(*bounds)
+
+    @staticmethod
+    def parse_range(args: list) -> tuple | dict:
+        """`start end [COUNT n]` as the arguments of `Stream.range`."""
+        start, end, *options = args
+        count = None
+        if options and options[0].upper() == b"COUNT":
+            if len(options) < 2 or not options[1].isdigit():
+                return {"error": "value is not an integer or out of range"}
+            count = int(options[1])
+        start, end = check_id(start), check_id(end, MAX_SEQ)
+        if start is None or end is None:
+            return INVALID_ID
+        return start, end, count
 
     async def xread(self, streams: list, id: str, block: int | None = None):
-        print(self.stream)
         if block != None:
             block_ms = (time.time() * 1000) + block
             start = id
@@ -113,11 +697,9 @@ class Store:
                 await asyncio.sleep(0.2)
 
         response = []
-        if id.isdigit():
-            id += "-0"
         for key in streams:
-            array = self.stream.get(key, {})
-            result = self.read_stream(array, id)
+            stream = self.get_stream(key)
+            result = stream.after(parse_id(id)) if stream is not None else []
 
             response.append([key, result])
         return response
@@ -142,6 +724,362 @@ class Store:
                 return None
             await asyncio.sleep(0.2)
 
+    def get_set(self, key: str, create: bool = False) -> RedisSet | dict | None:
+        """
+        Return the set stored at `key`, or None if there is none.
+
+        With `create` a new empty set is stored when the key is missing.
+        Returns the WRONGTYPE error if the key holds another type.
+        """
+        if key in self.stream:
+            return WRONGTYPE
+        value = self.get(key)
+        if value is None:
+            if not create:
+                return None
+            max_entries = getattr(self.config, "set_max_intset_entries", 512)
+            value = RedisSet(max_entries)
+            self.store[key] = (value, None)
+            self.index(key)
+        if not isinstance(value, RedisSet):
+            return WRONGTYPE
+        return value
+
+    def get_sets(self, keys: list) -> list[RedisSet | None] | dict:
+        sets = []
+        for key in keys:
+            value = self.get_set(key)
+            if isinstance(value, dict):
+                return value
+            sets.append(value)
+        return sets
+
+    def sadd(self, key: str, members: list) -> int | dict:
+        value = self.get_set(key, create=True)
+        if isinstance(value, dict):
+            return value
+        added = value.add(members)
+        if added:
+            self.touch(key)
+        return added
+
+    def srem(self, key: str, members: list) -> int | dict:
+        value = self.get_set(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        removed = value.remove(members)
+        if not value:
+            self.delete(key)
+        elif removed:
+            self.touch(key)
+        return removed
+
+    def sismember(self, key: str, member: str) -> int | dict:
+        value = self.get_set(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        return int(member in value)
+
+    def smembers(self, key: str) -> list | dict:
+        value = self.get_set(key)
+        if value is None or isinstance(value, dict):
+            return value or []
+        return list(value)
+
+    def scard(self, key: str) -> int | dict:
+        value = self.get_set(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        return len(value)
+
+    def sinter(self, keys: list, limit: int = 0) -> list | dict:
+        sets = self.get_sets(keys)
+        if isinstance(sets, dict):
+            return sets
+        return combine("SINTER", sets, limit)
+
+    def sunion(self, keys: list) -> list | dict:
+        sets = self.get_sets(keys)
+        if isinstance(sets, dict):
+            return sets
+        return combine("SUNION", sets)
+
+    def sdiff(self, keys: list) -> list | dict:
+        sets = self.get_sets(keys)
+        if isinstance(sets, dict):
+            return sets
+        return combine("SDIFF", sets)
+
+    def sscan(
+        self, key: str, cursor: int, match: str | None = None, count: int = 10
+    ) -> list | dict:
+        value = self.get_set(key)
+        if value is None or isinstance(value, dict):
+            return value or ["0", []]
+        cursor, members = self.set_scans.scan(value, cursor, count)
+        if match is not None:
+            members = [member for member in members if fnmatchcase(member, match)]
+        return [str(cursor), members]
+
+    def get_hll(self, key: bytes, create: bool = False) -> bytearray | dict | None:
+        """
+        Return the HyperLogLog stored at `key`, or None if there is none.
+
+        With `create` an empty one is stored when the key is missing. Returns an
+        error for a key holding anything but a valid HyperLogLog string.
+        """
+        if key in self.stream:
+            return WRONGTYPE
+        value = self.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = hyperloglog.new()
+            self.store[key] = (value, None)
+            self.index(key)
+            return value
+        if not isinstance(value, (bytes, bytearray)):
+            return WRONGTYPE
+        if not hyperloglog.is_valid(value):
+            return hyperloglog.INVALID_HLL
+        if isinstance(value, bytes):
+            # Loaded from an RDB file or written with SET, made mutable once
+            value = bytearray(value)
+            self.store[key] = (value, self.store[key][1])
+        return value
+
+    def pfadd(self, key: bytes, patterns: list[tuple[int, int]]) -> int | dict:
+        """PFADD of the elements whose `hyperloglog.pattern`s are given."""
+        existed = bool(self.check_availability(key))
+        value = self.get_hll(key, create=True)
+        if isinstance(value, dict):
+            return value
+        max_bytes = getattr(self.config, "hll_sparse_max_bytes", 3000)
+        value, changed = hyperloglog.add(value, patterns, max_bytes)
+        if changed:
+            self.store[key] = (value, self.store[key][1])
+        if changed or not existed:
+            self.touch(key)
+            return 1
+        return 0
+
+    def pfcount(self, keys: list) -> int | dict:
+        values = []
+        for key in keys:
+            value = self.get_hll(key)
+            if isinstance(value, dict):
+                return value
+            if value is not None:
+                values.append(value)
+        if not values:
+            return 0
+        if len(keys) == 1:
+            return hyperloglog.count(values[0])
+        registers = hyperloglog.merge(values)
+        return hyperloglog.estimate(hyperloglog.histogram(registers))
+
+    def pfmerge(self, destination: bytes, keys: list) -> str | dict:
+        values = []
+        for key in [destination, *keys]:
+            value = self.get_hll(key, create=key == destination)
+            if isinstance(value, dict):
+                return value
+            if value is not None:
+                values.append(value)
+        merged = hyperloglog.dense_from_registers(hyperloglog.merge(values))
+        self.store[destination] = (merged, self.store[destination][1])
+        self.touch(destination)
+        return "OK"
+
+    def get_string(
+        self, key: bytes, create: bool = False
+    ) -> bytes | bytearray | dict | None:
+        """
+        Return the string stored at `key`, or None if there is none.
+
+        With `create` the value is made mutable to be written in place: a
+        missing key gets an empty bytearray and a bytes value is converted once.
+        Returns the WRONGTYPE error if the key holds another type.
+        """
+        if key in self.stream:
+            return WRONGTYPE
+        value = self.get(key)
+        if value is None:
+            if not create:
+                return None
+            value = bytearray()
+            self.store[key] = (value, None)
+            self.index(key)
+            return value
+        if not isinstance(value, (bytes, bytearray)):
+            return WRONGTYPE
+        if create and isinstance(value, bytes):
+            value = bytearray(value)
+            self.store[key] = (value, self.store[key][1])
+        return value
+
+    def setbit(self, key: bytes, offset: int, bit: int) -> int | dict:
+        value = self.get_string(key, create=True)
+        if isinstance(value, dict):
+            return value
+        old = bitmaps.setbit(value, offset, bit)
+        self.touch(key)
+        return old
+
+    def getbit(self, key: bytes, offset: int) -> int | dict:
+        value = self.get_string(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        return bitmaps.getbit(value, offset)
+
+    def bitcount(
+        self, key: bytes, start: int = 0, end: int = -1, bit_unit: bool = False
+    ) -> int | dict:
+        value = self.get_string(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        return bitmaps.bitcount(value, start, end, bit_unit)
+
+    def bitpos(
+        self,
+        key: bytes,
+        bit: int,
+        start: int = 0,
+        end: int | None = None,
+        bit_unit: bool = False,
+    ) -> int | dict:
+        value = self.get_string(key)
+        if value is None:
+            return -1 if bit else 0
+        if isinstance(value, dict):
+            return value
+        return bitmaps.bitpos(value, bit, start, end, bit_unit)
+
+    def bitop(self, operation: str, destination: bytes, keys: list) -> int | dict:
+        """BITOP into `destination`, which is deleted when the result is empty."""
+        values = []
+        for key in keys:
+            value = self.get_string(key)
+            if isinstance(value, dict):
+                return value
+            values.append(value if value is not None else b"")
+        result = bitmaps.bitop(operation, values)
+        if result:
+            self.set(destination, result, [])
+        else:
+            old = self.remove(destination)
+            if old is not None:
+                self.release(old)
+        return len(result)
+
+    def bitfield(self, key: bytes, operations: list[tuple]) -> list | dict:
+        """
+        BITFIELD `operations`, as (GET / SET / INCRBY, signed, bits, offset,
+        argument, overflow mode). An operation that fails on overflow replies nil
+        and leaves the field as it was.
+        """
+        writes = any(operation[0] != "GET" for operation in operations)
+        value = self.get_string(key, create=writes)
+        if isinstance(value, dict):
+            return value
+        results, changed = [], False
+        for action, signed, bits, offset, argument, mode in operations:
+            old = bitmaps.get_field(value or b"", offset, signed, bits)
+            if action == "GET":
+                results.append(old)
+                continue
+            new = argument if action == "SET" else old + argument
+            new = bitmaps.overflow(new, signed, bits, mode)
+            if new is not None:
+                bitmaps.set_field(value, offset, bits, new)
+                changed = True
+                new = old if action == "SET" else new
+            results.append(new)
+        if changed:
+            self.touch(key)
+        return results
+
+    def set_expire(self, key: bytes, expire_time: float | None) -> None:
+        """Change the expire time of an existing key, None makes it persistent."""
+        self.store[key] = (self.store[key][0], expire_time)
+        if expire_time is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = expire_time
+        self.touch(key)
+
+    def append(self, key: bytes, data: bytes) -> int | dict:
+        """
+        APPEND, in place: the value is a bytearray from the first append on, which
+        grows with spare room, so appending a small record does not copy the value.
+        """
+        value = self.get_string(key, create=True)
+        if isinstance(value, dict):
+            return value
+        if len(value) + len(data) > MAX_STRING_LENGTH:
+            return STRING_TOO_LONG
+        value += data
+        self.touch(key)
+        return len(value)
+
+    def setrange(self, key: bytes, offset: int, data: bytes) -> int | dict:
+        if not data:
+            value = self.get_string(key)
+            if value is None or isinstance(value, dict):
+                return value or 0
+            return len(value)
+        if offset + len(data) > MAX_STRING_LENGTH:
+            return STRING_TOO_LONG
+        value = self.get_string(key, create=True)
+        if isinstance(value, dict):
+            return value
+        if offset > len(value):
+            value.extend(bytes(offset - len(value)))
+        value[offset : offset + len(data)] = data
+        self.touch(key)
+        return len(value)
+
+    def getrange(self, key: bytes, start: int, end: int) -> bytes | dict:
+        """GETRANGE, only the requested range of the value is copied."""
+        value = self.get_string(key)
+        if value is None or isinstance(value, dict):
+            return value or b""
+        length = len(value)
+        if start < 0:
+            start = max(length + start, 0)
+        if end < 0:
+            end = max(length + end, 0)
+        end = min(end, length - 1)
+        if start > end:
+            return b""
+        return value[start : end + 1]
+
+    def strlen(self, key: bytes) -> int | dict:
+        value = self.get_string(key)
+        if value is None or isinstance(value, dict):
+            return value or 0
+        return len(value)
+
+    def getdel(self, key: bytes) -> bytes | bytearray | dict | None:
+        value = self.get_string(key)
+        if value is not None and not isinstance(value, dict):
+            self.remove(key)
+        return value
+
+    def getex(
+        self, key: bytes, expire_time: float | None, persist: bool = False
+    ) -> bytes | bytearray | dict | None:
+        """GETEX, setting `expire_time` or removing the expire with `persist`."""
+        value = self.get_string(key)
+        if value is None or isinstance(value, dict):
+            return value
+        if persist:
+            if key in self.expires:
+                self.set_expire(key, None)
+        elif expire_time is not None:
+            self.set_expire(key, expire_time)
+        return value
+
     def call_args(self, arg: str, param: int):
         """
         A function to call the specified argument with the given parameter.
@@ -167,14 +1105,15 @@ class Store:
         if key in self.store:
             expire_time = self.store[key][1]
             if expire_time is not None and expire_time < time.time():
-                del self.store[key]
+                self.delete(key)
+                self.expired_keys += 1
                 return False
             return True
 
     def type_check(self, key: str) -> str:
         value, _ = self.store.get(key, (None, None))
-        if value:
-            if isinstance(value, str):
+        if value is not None:
+            if isinstance(value, (bytes, bytearray)):
                 return "string"
             elif isinstance(value, int):
                 return "integer"
@@ -182,9 +1121,11 @@ class Store:
                 return "list"
             elif isinstance(value, dict):
                 return "hash"
+            elif isinstance(value, RedisSet):
+                return SimpleString("set")
         else:
             value = self.stream.get(key, None)
-            if value:
+            if value is not None:
                 return "stream"
 
         return "none"
@@ -246,38 +1187,6 @@ class Store:
             )
         return message
 
-    @staticmethod
-    def collect_range_data(data: dict, start: str, end: str) -> bool:
-        ms, sq = data[0].split("-")
-        start_ms, start_sq = start.split("-")
-
-        if end.isdigit():
-            end = int(end)
-            if int(ms) >= start_ms and int(ms) <= end:
-                return True
-
-        else:
-            end_ms, end_sq = end.split("-")
-        if int(ms) == int(start_ms) or int(ms) == int(end_ms):
-            if int(sq) >= int(start_sq) and int(sq) <= int(end_sq):
-                return True
-        elif int(ms) > int(start_ms) and int(ms) < int(end_ms):
-            return True
-        return False
-
-    @staticmethod
-    def read_stream(data: dict, start: str) -> list:
-        start_ms, start_sq = start.split("-")
-        result = []
-        for key, value in data.items():
-            ms, sq = key.split("-")
-            if int(ms) > int(start_ms):
-                result.append([key, value])
-            elif int(ms) == int(start_ms):
-                if int(sq) > int(start_sq):
-                    result.append([key, value])
-        return result
-
     @staticmethod
     async def listen_stream(last_id, latest_id):
         ms, sq = latest_id.split("-")
@@ -292,8 +1201,8 @@ class Store:
 
 if __name__ == "__main__":
     s = Store()
-    s.set("hello", "world", ["PX", "100", "NX"])
-    s.set("hey", "HEY", ["NX"])
-    print(s.get("hello"))
+    s.set(b"hello", b"world", [b"PX", b"100", b"NX"])
+    s.set(b"hey", b"HEY", [b"NX"])
+    print(s.get(b"hello"))
     time.sleep(1)
-    print(s.get("hey"))
+    print(s.get(b"hey"))
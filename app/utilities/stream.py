@@ -0,0 +1,250 @@
+import sys
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+MAX_SEQ = 2**64 - 1
+INVALID_ID = {"error": "Invalid stream ID specified as stream command argument"}
+
+
+def parse_id(id: str | bytes, default_seq: int = 0) -> tuple[int, int]:
+    """Parse `ms-seq` (or a bare `ms`, using `default_seq`) into a comparable tuple."""
+    if isinstance(id, bytes):
+        id = id.decode()
+    if id == "-":
+        return (0, 0)
+    if id == "+":
+        return (MAX_SEQ, MAX_SEQ)
+    if "-" in id:
+        ms, seq = id.split("-", 1)
+        return (int(ms), int(seq))
+    return (int(id), default_seq)
+
+
+def check_id(id: str | bytes, default_seq: int = 0) -> tuple[int, int] | None:
+    """`parse_id` of an ID sent by a client, None if it is not a valid one."""
+    try:
+        ms, seq = parse_id(id, default_seq)
+    except ValueError:
+        return None
+    if 0 <= ms <= MAX_SEQ and 0 <= seq <= MAX_SEQ:
+        return ms, seq
+    return None
+
+
+def format_id(id: tuple[int, int]) -> str:
+    return f"{id[0]}-{id[1]}"
+
+
+def _entry_id(entry: tuple) -> tuple[int, int]:
+    return (entry[0], entry[1])
+
+
+def _entry_size(entry: tuple) -> int:
+    ms, seq, fields = entry
+    size = sys.getsizeof(entry) + sys.getsizeof(ms) + sys.getsizeof(seq)
+    return size + sys.getsizeof(fields) + sum(map(sys.getsizeof, fields))
+
+
+class Stream:
+    """
+    Append only log of `(ms, seq, fields)` entries, kept in blocks.
+
+    Each block holds at most `node_max_entries` entries, like the listpack nodes
+    of a Redis stream. Trimming drops whole blocks from the front, which keeps
+    the cost of approximate (`~`) trimming O(1) amortized per XADD, and range
+    lookups are a binary search over the blocks and then inside one block.
+    """
+
+    def __init__(self, node_max_entries: int = 100):
+        self.node_max_entries = node_max_entries
+        self.blocks: list[list[tuple]] = []
+        self.length = 0
+        self.last_id: tuple[int, int] = (0, 0)
+        self.entries_added = 0
+        self.groups: dict = {}  # name -> ConsumerGroup
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    @property
+    def last_id_str(self) -> str:
+        return format_id(self.last_id)
+
+    @property
+    def first_id_str(self) -> str | None:
+        return format_id(self.blocks[0][0]) if self.blocks else None
+
+    def add(self, id: tuple[int, int], fields: list) -> None:
+        blocks = self.blocks
+        if not blocks or len(blocks[-1]) >= self.node_max_entries:
+            blocks.append([])
+        blocks[-1].append((id[0], id[1], fields))
+        self.length += 1
+        self.entries_added += 1
+        self.last_id = id
+
+    def get(self, id: tuple[int, int]) -> list | None:
+        """The fields of entry `id`, None if there is no such entry."""
+        i = self._find_block(id)
+        if i is None:
+            return None
+        block = self.blocks[i]
+        j = bisect_left(block, id, key=_entry_id)
+        if j < len(block) and _entry_id(block[j]) == id:
+            return block[j][2]
+        return None
+
+    def delete(self, ids: list[tuple[int, int]]) -> int:
+        deleted = 0
+        for id in ids:
+            i = self._find_block(id)
+            if i is None:
+                continue
+            block = self.blocks[i]
+            j = bisect_left(block, id, key=_entry_id)
+            if j < len(block) and _entry_id(block[j]) == id:
+                del block[j]
+                deleted += 1
+                self.length -= 1
+                if not block:
+                    del self.blocks[i]
+        return deleted
+
+    def trim_maxlen(self, maxlen: int, approx: bool = False, limit: int = 0) -> int:
+        """
+        Remove the oldest entries until at most `maxlen` are left.
+
+        With `approx` only whole blocks are removed, so the stream may keep a few
+        more entries than asked for. `limit` caps how many entries one call removes.
+        """
+        removed = 0
+        blocks = self.blocks
+        drop = 0
+        while drop < len(blocks) and self.length - len(blocks[drop]) >= maxlen:
+            if limit and removed + len(blocks[drop]) > limit:
+                break
+            removed += len(blocks[drop])
+            self.length -= len(blocks[drop])
+            drop += 1
+        if drop:
+            del blocks[:drop]
+        if not approx and blocks and self.length > maxlen:
+            extra = self.length - maxlen
+            if limit:
+                extra = min(extra, limit - removed)
+            if extra > 0:
+                del blocks[0][:extra]
+                self.length -= extra
+                removed += extra
+        return removed
+
+    def trim_minid(
+        self, minid: tuple[int, int], approx: bool = False, limit: int = 0
+    ) -> int:
+        """Remove entries with an ID lower than `minid`, see `trim_maxlen`."""
+        removed = 0
+        blocks = self.blocks
+        drop = 0
+        while drop < len(blocks) and _entry_id(blocks[drop][-1]) < minid:
+            if limit and removed + len(blocks[drop]) > limit:
+                break
+            removed += len(blocks[drop])
+            self.length -= len(blocks[drop])
+            drop += 1
+        if drop:
+            del blocks[:drop]
+        if not approx and blocks:
+            extra = bisect_left(blocks[0], minid, key=_entry_id)
+            if limit:
+                extra = min(extra, limit - removed)
+            if extra > 0:
+                del blocks[0][:extra]
+                self.length -= extra
+                removed += extra
+                if not blocks[0]:
+                    del blocks[0]
+        return removed
+
+    def range(
+        self, start: tuple[int, int], end: tuple[int, int], count: int | None = None
+    ) -> list[list]:
+        """Entries with start <= id <= end, as `[id, fields]` pairs."""
+        result = []
+        if not self.blocks or start > end:
+            return result
+        i = self._find_block(start)
+        if i is None:
+            i = 0
+        blocks = self.blocks
+        j = bisect_left(blocks[i], start, key=_entry_id)
+        for b in range(i, len(blocks)):
+            block = blocks[b]
+            for k in range(j, len(block)):
+                entry = block[k]
+                if _entry_id(entry) > end:
+                    return result
+                result.append([format_id(entry), entry[2]])
+                if count is not None and len(result) >= count:
+                    return result
+            j = 0
+        return result
+
+    def memory_usage(self, samples: int) -> int:
+        """
+        Estimated bytes: the blocks, `samples` entries extrapolated to all of
+        them, and the pending entries of the consumer groups.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.blocks)
+        if self.blocks:
+            size += len(self.blocks) * sys.getsizeof(self.blocks[0])
+        sample = list(islice(self, samples))
+        if sample:
+            size += sum(map(_entry_size, sample)) * self.length // len(sample)
+        for group in self.groups.values():
+            size += sys.getsizeof(group.pel) * 2  # the group and consumer PELs
+            pending = list(islice(group.pel.values(), samples))
+            if pending:
+                size += sys.getsizeof(pending[0]) * len(group.pel)
+        return size
+
+    def copy(self) -> "Stream":
+        """A copy that no longer changes with this stream, e.g. for a snapshot."""
+        clone = Stream(self.node_max_entries)
+        clone.blocks = [block.copy() for block in self.blocks]
+        clone.length = self.length
+        clone.last_id = self.last_id
+        clone.entries_added = self.entries_added
+        clone.groups = {name: group.copy() for name, group in self.groups.items()}
+        return clone
+
+    def view(self, start: tuple[int, int], end: tuple[int, int]) -> "Stream":
+        """
+        Copy of the blocks that may hold IDs between `start` and `end`.
+
+        Entries are immutable tuples, so the copy can be read from another
+        thread while this stream keeps changing.
+        """
+        view = Stream(self.node_max_entries)
+        first, last = self._find_block(start), self._find_block(end)
+        if last is not None:
+            view.blocks = [block.copy() for block in self.blocks[first or 0 : last + 1]]
+            view.length = sum(len(block) for block in view.blocks)
+        view.last_id = self.last_id
+        return view
+
+    def after(self, id: tuple[int, int], count: int | None = None) -> list[list]:
+        """Entries with an ID strictly greater than `id`."""
+        if id[1] < MAX_SEQ:
+            start = (id[0], id[1] + 1)
+        else:
+            start = (id[0] + 1, 0)
+        return self.range(start, (MAX_SEQ, MAX_SEQ), count)
+
+    def _find_block(self, id: tuple[int, int]) -> int | None:
+        """Index of the block that would contain `id`, None if it precedes all."""
+        i = bisect_right(self.blocks, id, key=lambda block: _entry_id(block[0]))
+        return i - 1 if i else None
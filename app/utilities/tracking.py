@@ -0,0 +1,110 @@
+from .connection import Connection
+from .parser_protocol import RedisProtocolParser, RespPush
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class TrackingTable:
+    """
+    Server side state for client side caching (CLIENT TRACKING).
+
+    In the default mode the table remembers which connections read which keys,
+    and a write to a key sends one invalidation to each of them and forgets
+    the key. In BCAST mode connections register key prefixes instead and are
+    told about every write under those prefixes.
+
+    The table holds at most `tracking_table_max_keys` keys, when it is full the
+    oldest key is evicted and its readers are invalidated right away.
+    """
+
+    def __init__(self, config, clients: dict[int, Connection]):
+        self.config = config
+        self.clients = clients
+        self.keys: dict[bytes, set[Connection]] = {}
+        self.prefixes: dict[bytes, set[Connection]] = {}
+        self.parser = RedisProtocolParser()
+
+    def enable(self, conn: Connection, prefixes: list[bytes]) -> None:
+        conn.tracking = True
+        if conn.tracking_bcast:
+            for prefix in prefixes or [b""]:
+                conn.tracking_prefixes.add(prefix)
+                self.prefixes.setdefault(prefix, set()).add(conn)
+
+    def disable(self, conn: Connection) -> None:
+        for key in conn.tracking_keys:
+            readers = self.keys.get(key)
+            if readers is not None:
+                readers.discard(conn)
+                if not readers:
+                    del self.keys[key]
+        conn.tracking_keys = set()
+        for prefix in conn.tracking_prefixes:
+            conns = self.prefixes.get(prefix)
+            if conns is not None:
+                conns.discard(conn)
+                if not conns:
+                    del self.prefixes[prefix]
+        conn.tracking = False
+        conn.tracking_bcast = conn.tracking_optin = conn.tracking_optout = False
+        conn.tracking_prefixes = set()
+        conn.tracking_redirect = None
+        conn.caching = None
+
+    def record_read(self, conn: Connection, keys: list[bytes]) -> None:
+        if conn.tracking_bcast:
+            return
+        if conn.tracking_optin and conn.caching is not True:
+            return
+        if conn.tracking_optout and conn.caching is False:
+            return
+        max_keys = self.config.tracking_table_max_keys
+        for key in keys:
+            readers = self.keys.get(key)
+            if readers is None:
+                while max_keys and len(self.keys) >= max_keys:
+                    self.evict()
+                readers = self.keys[key] = set()
+            readers.add(conn)
+            conn.tracking_keys.add(key)
+
+    def evict(self) -> None:
+        """Drop the oldest key (dict order is insertion order) and invalidate it."""
+        key = next(iter(self.keys))
+        for conn in self.keys.pop(key):
+            conn.tracking_keys.discard(key)
+            self.send(conn, [key])
+
+    def invalidate(self, key: bytes) -> None:
+        readers = self.keys.pop(key, None)
+        if readers:
+            for conn in readers:
+                conn.tracking_keys.discard(key)
+                self.send(conn, [key])
+        if self.prefixes:
+            for prefix, conns in self.prefixes.items():
+                if key.startswith(prefix):
+                    for conn in conns:
+                        self.send(conn, [key])
+
+    def invalidate_all(self) -> None:
+        """After a flush: a null key list tells clients to drop their whole cache."""
+        self.keys.clear()
+        for conn in self.clients.values():
+            if conn.tracking:
+                conn.tracking_keys.clear()
+                self.send(conn, None)
+
+    def send(self, conn: Connection, keys: list[bytes] | None) -> None:
+        if not conn.tracking:
+            return
+        target = conn
+        if conn.tracking_redirect is not None:
+            target = self.clients.get(conn.tracking_redirect)
+            if target is None:
+                return
+        if target.protocol == 3:
+            frame = RespPush(["invalidate", keys])
+        else:
+            frame = ["message", INVALIDATE_CHANNEL, keys]
+        target.send(self.parser.encoder(frame, target.protocol))
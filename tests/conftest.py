@@ -0,0 +1,131 @@
+"""
+Fixtures starting real servers, each in a process of its own on a free port.
+
+There is no pytest-asyncio here: tests are plain functions running their
+coroutine with `asyncio.run`.
+"""
+
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from app.client import Redis, encode_command, parse_reply
+
+ROOT = Path(__file__).resolve().parent.parent
+START_TIMEOUT = 10  # seconds for a server to accept connections
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_listening(port: int, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            code = process.returncode
+            raise RuntimeError(f"server on port {port} exited with {code}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """
+    `start_server(*args)` runs a server with the extra command line `args` and
+    returns its port. Every server started is terminated after the test.
+    """
+    processes = []
+
+    def start(*args) -> int:
+        port = free_port()
+        directory = tmp_path / str(port)
+        directory.mkdir()
+        with open(directory / "server.log", "wb") as log:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "app.main", "--port", str(port)]
+                + ["--dir", str(directory), "--logfile", "", *map(str, args)],
+                cwd=ROOT,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        processes.append(process)
+        wait_listening(port, process)
+        return port
+
+    yield start
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def eventually(check, timeout: float = START_TIMEOUT, interval: float = 0.05):
+    """Await `check()` until it returns something truthy, which is returned."""
+    deadline = time.monotonic() + timeout
+    while not (result := await check()):
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(interval)
+    return result
+
+
+async def replication_info(client: Redis) -> dict[str, str]:
+    info = (await client.execute("INFO", "replication")).decode()
+    return dict(line.split(":", 1) for line in info.splitlines() if ":" in line)
+
+
+def replica_field(info: dict[str, str], name: str) -> str | None:
+    if "slave0" not in info:
+        return None
+    return dict(item.split("=") for item in info["slave0"].split(","))[name]
+
+
+async def online(master: Redis) -> bool:
+    return replica_field(await replication_info(master), "state") == "online"
+
+
+class Subscriber:
+    """
+    A client on a raw socket that sees every frame in order, the replies and
+    the pushes (in RESP3 even the SUBSCRIBE replies are pushes).
+    """
+
+    async def connect(self, port: int, *commands) -> "Subscriber":
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.buffer = bytearray()
+        for command in commands:
+            self.writer.write(encode_command(command))
+            await self.next()
+        return self
+
+    async def next(self):
+        while (parsed := parse_reply(self.buffer)) is None:
+            data = await asyncio.wait_for(self.reader.read(65536), 5)
+            assert data, "connection closed"
+            self.buffer += data
+        reply, pos = parsed
+        del self.buffer[:pos]
+        return reply
+
+    async def execute(self, *command):
+        """Send a command and return the next frame, pushes included."""
+        self.writer.write(encode_command(command))
+        return await self.next()
+
+    def close(self) -> None:
+        self.writer.close()
@@ -0,0 +1,169 @@
+import asyncio
+import random
+
+import pytest
+
+from app.client import Redis, ReplyError
+from app.utilities import bitmaps
+
+
+def bits_of(value: bytes) -> str:
+    return "".join(f"{byte:08b}" for byte in value)
+
+
+def reference_bitpos(value, bit, start, end, bit_unit):
+    """BITPOS done bit by bit on a string of 0s and 1s."""
+    if not value:
+        return -1 if bit else 0
+    bits = bits_of(value)
+    length = len(bits) if bit_unit else len(value)
+    bounds = bitmaps.resolve_range(start, length - 1 if end is None else end, length)
+    if bounds is None:
+        return -1
+    first, last = bounds
+    if not bit_unit:
+        first, last = first * 8, last * 8 + 7
+    found = bits.find(str(bit), first, last + 1)
+    if found < 0 and not bit and end is None:
+        return len(bits)
+    return found
+
+
+def test_counts_and_searches_match_a_bit_by_bit_reference(monkeypatch):
+    # Small chunks so the ranges cross chunk boundaries
+    monkeypatch.setattr(bitmaps, "COUNT_CHUNK", 3)
+    monkeypatch.setattr(bitmaps, "SCAN_CHUNK", 4)
+    rng = random.Random(46)
+    for _ in range(300):
+        filler = rng.choice([b"\x00", b"\xff"])
+        value = bytearray(filler * rng.randrange(0, 40))
+        for _ in range(rng.randrange(0, 3)):
+            if value:
+                value[rng.randrange(len(value))] = rng.randrange(256)
+        bits = bits_of(value)
+        bit_unit = rng.random() < 0.5
+        length = len(bits) if bit_unit else len(value)
+        start = rng.randrange(-length - 2, length + 2) if length else 0
+        end = rng.randrange(-length - 2, length + 2) if length else 0
+
+        bounds = bitmaps.resolve_range(start, end, length)
+        if bounds is None:
+            expected = 0
+        elif bit_unit:
+            expected = bits[bounds[0] : bounds[1] + 1].count("1")
+        else:
+            expected = bits[bounds[0] * 8 : bounds[1] * 8 + 8].count("1")
+        assert bitmaps.bitcount(value, start, end, bit_unit) == expected
+        assert bitmaps.bitcount(value) == bits.count("1")
+
+        for bit in (0, 1):
+            for stop in (None, end):
+                args = (value, bit, start, stop, bit_unit)
+                assert bitmaps.bitpos(*args) == reference_bitpos(*args)
+
+
+def test_fields_and_overflow_modes():
+    value = bytearray()
+    bitmaps.set_field(value, 3, 12, 0xABC)
+    assert bits_of(value) == "000" + "101010111100" + "0"
+    assert bitmaps.get_field(value, 3, False, 12) == 0xABC
+    assert bitmaps.get_field(value, 3, True, 12) == 0xABC - 4096
+    # Past the end of the value reads zeros
+    assert bitmaps.get_field(value, 12, False, 16) == 0b1000 << 12
+
+    assert bitmaps.overflow(300, False, 8, "WRAP") == 44
+    assert bitmaps.overflow(-1, False, 8, "WRAP") == 255
+    assert bitmaps.overflow(130, True, 8, "WRAP") == -126
+    assert bitmaps.overflow(300, False, 8, "SAT") == 255
+    assert bitmaps.overflow(-300, True, 8, "SAT") == -128
+    assert bitmaps.overflow(256, False, 8, "FAIL") is None
+    assert bitmaps.overflow(-128, True, 8, "FAIL") == -128
+
+    assert bitmaps.parse_type(b"u63") == (False, 63)
+    assert bitmaps.parse_type(b"I64") == (True, 64)
+    assert bitmaps.parse_type(b"u64") is None and bitmaps.parse_type(b"x8") is None
+    assert bitmaps.parse_field_offset(b"#3", 8) == 24
+    assert bitmaps.parse_field_offset(b"%d" % bitmaps.MAX_BIT_OFFSET, 2) is None
+    assert bitmaps.bitop("AND", [b"\xff\x0f", b"\x3c"]) == b"\x3c\x00"
+    assert bitmaps.bitop("XOR", [b"\xff", b"\x0f", b"\x01"]) == b"\xf1"
+    assert bitmaps.bitop("NOT", [b"\x0f"]) == b"\xf0"
+
+
+def test_bit_commands(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            assert await client.execute("SETBIT", "bits", 7, 1) == 0
+            assert await client.execute("SETBIT", "bits", 7, 1) == 1
+            assert await client.execute("GET", "bits") == b"\x01"
+            assert await client.execute("GETBIT", "bits", 7) == 1
+            assert await client.execute("GETBIT", "bits", 1000) == 0
+            with pytest.raises(ReplyError, match="bit offset"):
+                await client.execute("SETBIT", "bits", 2**32, 1)
+            with pytest.raises(ReplyError, match="bit is not an integer"):
+                await client.execute("SETBIT", "bits", 0, 2)
+
+            await client.execute("SET", "text", "foobar")
+            assert await client.execute("BITCOUNT", "text") == 26
+            assert await client.execute("BITCOUNT", "text", 1, 1) == 6
+            assert await client.execute("BITCOUNT", "text", 5, 30, "BIT") == 17
+            assert await client.execute("BITCOUNT", "missing") == 0
+
+            await client.execute("SET", "pos", b"\xff\xf0\x00")
+            assert await client.execute("BITPOS", "pos", 0) == 12
+            await client.execute("SET", "pos", b"\x00\xff\xf0")
+            assert await client.execute("BITPOS", "pos", 1, 2, -1, "BYTE") == 16
+            assert await client.execute("BITPOS", "pos", 1, 7, 15, "BIT") == 8
+            await client.execute("SET", "ones", b"\xff\xff")
+            assert await client.execute("BITPOS", "ones", 0) == 16
+            assert await client.execute("BITPOS", "ones", 0, 0, -1) == -1
+
+            await client.execute("SET", "a", b"\xff\x0f")
+            await client.execute("SET", "b", b"\x3c")
+            assert await client.execute("BITOP", "AND", "dest", "a", "b") == 2
+            assert await client.execute("GET", "dest") == b"\x3c\x00"
+            with pytest.raises(ReplyError, match="single source key"):
+                await client.execute("BITOP", "NOT", "dest", "a", "b")
+            await client.execute("SADD", "set", "member")
+            with pytest.raises(ReplyError, match="WRONGTYPE"):
+                await client.execute("SETBIT", "set", 0, 1)
+
+    asyncio.run(run())
+
+
+def test_bitfield_overflow(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            reply = await client.execute(
+                "BITFIELD", "field", "INCRBY", "i5", 100, 1, "GET", "u4", 0
+            )
+            assert reply == [1, 0]
+            # WRAP for the first field, SAT for the second
+            increments = [
+                "INCRBY", "u2", 100, 1, "OVERFLOW", "SAT", "INCRBY", "u2", 102, 1
+            ]
+            replies = [
+                await client.execute("BITFIELD", "counters", *increments)
+                for _ in range(4)
+            ]
+            assert replies == [[1, 1], [2, 2], [3, 3], [0, 3]]
+            failed = ["OVERFLOW", "FAIL", "INCRBY", "u2", 102, 1]
+            assert await client.execute("BITFIELD", "counters", *failed) == [None]
+            assert await client.execute("BITFIELD", "counters", "GET", "u2", 102) == [3]
+            reply = await client.execute(
+                "BITFIELD", "counters", "SET", "i8", "#1", -2, "GET", "u8", "#1"
+            )
+            assert reply == [0, 254]
+            reply = await client.execute("BITFIELD_RO", "counters", "GET", "i8", 8)
+            assert reply == [-2]
+            with pytest.raises(ReplyError, match="only supports the GET"):
+                await client.execute("BITFIELD_RO", "counters", "SET", "u8", 0, 1)
+            with pytest.raises(ReplyError, match="Invalid bitfield type"):
+                await client.execute("BITFIELD", "counters", "GET", "u64", 0)
+            with pytest.raises(ReplyError, match="Invalid OVERFLOW type"):
+                await client.execute("BITFIELD", "counters", "OVERFLOW", "NONE")
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.client import ClientConnection, Redis, ReplyError
+
+
+def test_auto_pipelining_keeps_order(start_server):
+    port = start_server()
+
+    async def run():
+        conn = ClientConnection("127.0.0.1", port)
+        await conn.connect()
+        writes = []
+        write = conn.writer.write
+        conn.writer.write = lambda data: (writes.append(data), write(data))
+        try:
+            replies = await asyncio.gather(
+                *(conn.execute("APPEND", "counter", "x") for _ in range(500))
+            )
+            assert replies == list(range(1, 501))
+            # Issued in one loop iteration, they went out in one write
+            assert len(writes) == 1
+
+            # Replies of mixed sizes still go to the coroutine that asked
+            values = {f"key:{i}": b"v" * (i * 37) for i in range(200)}
+            await asyncio.gather(
+                *(conn.execute("SET", key, value) for key, value in values.items())
+            )
+            got = await asyncio.gather(*(conn.execute("GET", k) for k in values))
+            assert got == list(values.values())
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_error_reply_only_fails_its_own_command(start_server):
+    port = start_server()
+
+    async def run():
+        conn = ClientConnection("127.0.0.1", port)
+        await conn.connect()
+        try:
+            replies = await asyncio.gather(
+                conn.execute("SET", "text", "abc"),
+                conn.execute("SADD", "text", "a"),
+                conn.execute("XADD", "stream", "0-0", "field", "value"),
+                conn.execute("GET", "text"),
+                return_exceptions=True,
+            )
+            assert replies[0] == "OK"
+            assert isinstance(replies[1], ReplyError)
+            assert str(replies[1]).startswith("WRONGTYPE")
+            assert isinstance(replies[2], ReplyError)
+            assert "greater than 0-0" in str(replies[2])
+            assert replies[3] == b"abc"
+            # The connection is still in step with the server
+            assert await conn.execute("PING") == "PONG"
+            assert not conn.pending
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_pending_commands_fail_when_the_server_closes(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            conn = ClientConnection("127.0.0.1", port)
+            await conn.connect()
+            conn_id = await conn.execute("CLIENT", "ID")
+            blocked = asyncio.ensure_future(
+                conn.execute("XREAD", "BLOCK", 0, "STREAMS", "s", "$")
+            )
+            queued = asyncio.ensure_future(conn.execute("PING"))
+            await asyncio.sleep(0.1)
+            assert await client.execute("CLIENT", "KILL", "ID", conn_id) == 1
+            for future in (blocked, queued):
+                with pytest.raises(ConnectionError):
+                    await future
+            assert not conn.pending
+            with pytest.raises(ConnectionError):
+                conn.send("PING")
+            await conn.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_callers_share_one_connection(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            replies = await asyncio.gather(
+                *(client.execute("ECHO", str(i)) for i in range(100))
+            )
+            assert replies == [str(i).encode() for i in range(100)]
+            assert len(client.pool.in_use) == 1
+            assert await client.execute("CLIENT", "ID") == await client.execute(
+                "CLIENT", "ID"
+            )
+
+    asyncio.run(run())
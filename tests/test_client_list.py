@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from conftest import eventually, online
+
+from app.client import Redis, ReplyError
+
+
+def parse_list(reply: bytes) -> list[dict[str, str]]:
+    return [
+        dict(field.split("=", 1) for field in line.split())
+        for line in reply.decode().splitlines()
+    ]
+
+
+def test_client_list_info_and_kill(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            async with client.connection() as named, client.connection() as sub:
+                assert await named.execute("CLIENT", "SETNAME", "worker") == "OK"
+                await named.execute("SET", "key", "x" * 100)
+                info = parse_list(await named.execute("CLIENT", "INFO"))[0]
+                assert info["name"] == "worker" and info["cmd"] == "client"
+                assert info["flags"] == "N" and int(info["tot-net-in"]) > 100
+                await sub.execute("SUBSCRIBE", "news")
+
+                clients = parse_list(await client.execute("CLIENT", "LIST"))
+                assert len(clients) == 3
+                pubsub = await client.execute("CLIENT", "LIST", "TYPE", "pubsub")
+                assert [c["flags"] for c in parse_list(pubsub)] == ["P"]
+                with pytest.raises(ReplyError, match="Unknown client type"):
+                    await client.execute("CLIENT", "LIST", "TYPE", "bogus")
+                assert await client.execute("CLIENT", "LIST", "TYPE", "master") == b""
+
+                assert await client.execute("CLIENT", "KILL", "TYPE", "pubsub") == 1
+                # SKIPME yes by default, so only the named connection goes
+                assert await client.execute("CLIENT", "KILL", "TYPE", "normal") == 1
+                with pytest.raises(ReplyError, match="No such client"):
+                    await client.execute("CLIENT", "KILL", info["addr"])
+                clients = parse_list(await client.execute("CLIENT", "LIST"))
+                assert [c["name"] for c in clients] == [""]
+
+    asyncio.run(run())
+
+
+def test_killing_the_master_link_reconnects(start_server):
+    master_port = start_server()
+    replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        replica = Redis("127.0.0.1", replica_port)
+        try:
+            await eventually(lambda: online(master))
+            await master.execute("SET", "before", 1)
+            assert await master.execute("WAIT", 1, 5000) == 1
+            masters = ["CLIENT", "LIST", "TYPE", "master"]
+            links = parse_list(await replica.execute(*masters))
+            assert [link["flags"] for link in links] == ["M"]
+            assert int(links[0]["tot-net-in"]) > 0
+            replicas = await master.execute("CLIENT", "LIST", "TYPE", "replica")
+            assert [link["flags"] for link in parse_list(replicas)] == ["S"]
+
+            assert await replica.execute("CLIENT", "KILL", "TYPE", "master") == 1
+            # The replica syncs again and gets what was written meanwhile
+            await master.execute("SET", "after", 2)
+            await eventually(lambda: replica.execute("GET", "after"))
+            relinked = parse_list(await replica.execute(*masters))
+            assert len(relinked) == 1 and relinked[0]["id"] != links[0]["id"]
+        finally:
+            await master.close()
+            await replica.close()
+
+    asyncio.run(run())
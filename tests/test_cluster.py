@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from conftest import eventually
+
+from app.client import Redis, ReplyError
+from app.client.cluster import create, node_id, reshard
+
+
+async def known_nodes(client: Redis) -> bool:
+    return b"cluster_known_nodes:2" in await client.execute("CLUSTER", "INFO")
+
+
+def test_moved_and_ask_during_a_reshard(start_server):
+    ports = [start_server("--cluster-enabled", "yes") for _ in range(2)]
+    target, source = (f"127.0.0.1:{port}" for port in ports)
+
+    async def run():
+        a, b = (Redis("127.0.0.1", port) for port in ports)
+        try:
+            # a serves slots 0-8191, b 8192-16383
+            await create([target, source])
+            await eventually(lambda: known_nodes(a))
+            await eventually(lambda: known_nodes(b))
+            keys = [f"{{t}}{n}" for n in range(3)]
+            slot = await a.execute("CLUSTER", "KEYSLOT", keys[0])
+            assert slot >= 8192
+            for key in keys:
+                assert await b.execute("SET", key, key) == "OK"
+            with pytest.raises(ReplyError, match=f"MOVED {slot} {source}"):
+                await a.execute("GET", keys[0])
+
+            # Move the first key only, like a reshard halfway through the slot
+            a_id, b_id = await node_id(a), await node_id(b)
+            await a.execute("CLUSTER", "SETSLOT", slot, "IMPORTING", b_id)
+            await b.execute("CLUSTER", "SETSLOT", slot, "MIGRATING", a_id)
+            migrate = ["MIGRATE", "127.0.0.1", ports[0], "", 0, 5000, "KEYS"]
+            assert await b.execute(*migrate, keys[0]) == "OK"
+
+            # Keys not moved yet are still served by the source
+            assert await b.execute("GET", keys[1]) == keys[1].encode()
+            with pytest.raises(ReplyError, match=f"ASK {slot} {target}"):
+                await b.execute("GET", keys[0])
+            with pytest.raises(ReplyError, match="TRYAGAIN"):
+                await b.execute("SUNION", keys[0], keys[1])
+            # The target only serves the slot to a client redirected by ASK
+            with pytest.raises(ReplyError, match=f"MOVED {slot} {source}"):
+                await a.execute("GET", keys[0])
+            async with a.connection() as conn:
+                assert await conn.execute("ASKING") == "OK"
+                assert await conn.execute("GET", keys[0]) == keys[0].encode()
+                # ASKING is good for one command
+                with pytest.raises(ReplyError, match=f"MOVED {slot} {source}"):
+                    await conn.execute("GET", keys[0])
+
+            await reshard(source, target, [slot])
+            with pytest.raises(ReplyError, match=f"MOVED {slot} {target}"):
+                await b.execute("GET", keys[1])
+            for key in keys:
+                assert await a.execute("GET", key) == key.encode()
+            assert await a.execute("CLUSTER", "COUNTKEYSINSLOT", slot) == 3
+            assert await b.execute("CLUSTER", "COUNTKEYSINSLOT", slot) == 0
+        finally:
+            await a.close()
+            await b.close()
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from conftest import eventually
+
+from app.client import Redis, ReplyError, encode_command
+from app.utilities.config import ServerConfiguration, parse_bool
+
+
+def test_settings_are_parsed_by_type():
+    config = ServerConfiguration(port=0, dir=".", dbfilename="dump.rdb")
+    config.set_config("maxclients", "100")
+    config.set_config("client-query-buffer-limit", "2mb")
+    assert (config.maxclients, config.client_query_buffer_limit) == (100, 2 * 1024**2)
+    with pytest.raises(ValueError, match=r"'timeout'\) - argument couldn't be parsed"):
+        config.set_config("timeout", "soon")
+    config.set_output_buffer_limit("pubsub 1mb 512kb 10")
+    assert config.client_output_buffer_limit["pubsub"] == [1024**2, 512 * 1024, 10]
+
+    # bool is a subclass of int, yes/no must not go through int()
+    assert parse_bool("yes") is True and parse_bool("NO") is False
+    with pytest.raises(ValueError, match="'yes' or 'no'"):
+        parse_bool("1")
+    with pytest.raises(ValueError, match="immutable"):
+        config.set_config("cluster-enabled", "yes")
+    assert config.cluster_enabled is False
+    assert config.get_config("cluster-enabled") == ["cluster-enabled", b"no"]
+
+
+def test_maxclients_and_idle_timeout(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            assert await client.execute("CONFIG", "SET", "maxclients", 2) == "OK"
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            extra, extra_writer = await asyncio.open_connection("127.0.0.1", port)
+            reply = await asyncio.wait_for(extra.read(), 5)
+            assert reply == b"-ERR max number of clients reached\r\n"
+            extra_writer.close()
+
+            await client.execute("CONFIG", "SET", "maxclients", 10)
+            await client.execute("CONFIG", "SET", "timeout", 1)
+
+            async def keep_busy():
+                while True:
+                    await client.execute("PING")
+                    await asyncio.sleep(0.2)
+
+            # The idle connection goes, the one in use stays
+            busy = asyncio.create_task(keep_busy())
+            assert await asyncio.wait_for(reader.read(), 5) == b""
+            busy.cancel()
+            writer.close()
+            assert await client.execute("PING") == "PONG"
+
+    asyncio.run(run())
+
+
+def test_subscribers_over_their_output_limit_are_dropped(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            limit = "pubsub 256kb 0 0"
+            await client.execute("CONFIG", "SET", "client-output-buffer-limit", limit)
+            with pytest.raises(ReplyError, match="Invalid client class"):
+                await client.execute(
+                    "CONFIG", "SET", "client-output-buffer-limit", "bogus 1 1 1"
+                )
+            # A subscriber that never reads its messages
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(encode_command(["SUBSCRIBE", "news"]))
+
+            async def subscribers() -> int:
+                return (await client.execute("PUBSUB", "NUMSUB", "news"))[1]
+
+            await eventually(subscribers)
+            message = b"x" * 64 * 1024
+            for _ in range(200):
+                if not await client.execute("PUBLISH", "news", message):
+                    break
+            assert await subscribers() == 0
+            writer.close()
+
+    asyncio.run(run())
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from conftest import eventually, online
+
+from app.client import Redis, ReplyError
+
+
+async def pending(client: Redis, *args) -> list[list]:
+    """XPENDING extended form without the idle times, which differ by node."""
+    entries = await client.execute("XPENDING", "s", "g", "-", "+", 10, *args)
+    return [[id, consumer, count] for id, consumer, _, count in entries]
+
+
+async def fill(client: Redis) -> None:
+    for n in range(1, 4):
+        await client.execute("XADD", "s", f"{n}-1", "field", n)
+    assert await client.execute("XGROUP", "CREATE", "s", "g", 0) == "OK"
+
+
+def test_pending_entries_follow_reads_acks_and_claims(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await fill(client)
+            new = ["STREAMS", "s", ">"]
+            with pytest.raises(ReplyError, match="BUSYGROUP"):
+                await client.execute("XGROUP", "CREATE", "s", "g", 0)
+            read = ["XREADGROUP", "GROUP", "g"]
+            with pytest.raises(ReplyError, match="NOGROUP"):
+                await client.execute(*read[:2], "x", "c", *new)
+            reply = await client.execute(*read, "alice", "COUNT", 2, *new)
+            assert [id for id, _ in reply[0][1]] == [b"1-1", b"2-1"]
+            reply = await client.execute(*read, "bob", *new)
+            assert [id for id, _ in reply[0][1]] == [b"3-1"]
+            # Nothing new is left for the group
+            assert await client.execute(*read, "carol", *new) is None
+
+            summary = await client.execute("XPENDING", "s", "g")
+            assert summary == [3, b"1-1", b"3-1", [[b"alice", b"2"], [b"bob", b"1"]]]
+            assert await pending(client, "alice") == [
+                [b"1-1", b"alice", 1],
+                [b"2-1", b"alice", 1],
+            ]
+            # 0 replays the consumer's own pending entries
+            reply = await client.execute(*read, "alice", "STREAMS", "s", 0)
+            assert [id for id, _ in reply[0][1]] == [b"1-1", b"2-1"]
+
+            assert await client.execute("XACK", "s", "g", "1-1", "9-9") == 1
+            claimed = await client.execute("XCLAIM", "s", "g", "bob", 0, "2-1")
+            assert [id for id, _ in claimed] == [b"2-1"]
+            # Entries idle for less than min-idle-time stay where they are
+            assert await client.execute("XCLAIM", "s", "g", "carol", 60000, "2-1") == []
+            next_id, entries, deleted = await client.execute(
+                "XAUTOCLAIM", "s", "g", "carol", 0, "0-0"
+            )
+            assert next_id == b"0-0"
+            assert [id for id, _ in entries] == [b"2-1", b"3-1"]
+            assert deleted == []
+            assert await pending(client) == [
+                [b"2-1", b"carol", 3],
+                [b"3-1", b"carol", 2],
+            ]
+
+    asyncio.run(run())
+
+
+def test_group_reads_in_multi_reach_the_replica(start_server):
+    master_port = start_server()
+    replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        replica = Redis("127.0.0.1", replica_port)
+        try:
+            await eventually(lambda: online(master))
+            await fill(master)
+            async with master.connection() as conn:
+                await conn.execute("MULTI")
+                await conn.execute("XREADGROUP", "GROUP", "g", "a", "STREAMS", "s", ">")
+                await conn.execute("XCLAIM", "s", "g", "bob", 0, "2-1")
+                await conn.execute("XAUTOCLAIM", "s", "g", "carol", 0, "3-1")
+                await conn.execute("XACK", "s", "g", "1-1")
+                replies = await conn.execute("EXEC")
+                assert [len(reply) for reply in replies[:3]] == [1, 1, 3]
+            assert await master.execute("WAIT", 1, 5000) == 1
+
+            expected = [[b"2-1", b"bob", 2], [b"3-1", b"carol", 2]]
+            assert await pending(master) == expected
+            assert await pending(replica) == expected
+            assert await replica.execute("XPENDING", "s", "g") == await master.execute(
+                "XPENDING", "s", "g"
+            )
+        finally:
+            await master.close()
+            await replica.close()
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from conftest import eventually, online
+
+from app.client import Redis, ReplyError
+
+
+def test_select_swapdb_and_flushes(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            async with client.connection() as conn:
+                with pytest.raises(ReplyError, match="out of range"):
+                    await conn.execute("SELECT", 16)
+                await conn.execute("SET", "a", "db0")
+                await conn.execute("SELECT", 1)
+                await conn.execute("SET", "a", "db1")
+                await conn.execute("SET", "b", "db1")
+                assert await conn.execute("DBSIZE") == 2
+
+                assert await conn.execute("SWAPDB", 0, 1) == "OK"
+                # The connection keeps its index and sees the other data
+                assert await conn.execute("GET", "a") == b"db0"
+                assert await conn.execute("DBSIZE") == 1
+                with pytest.raises(ReplyError, match="invalid second DB index"):
+                    await conn.execute("SWAPDB", 0, 99)
+                info = await conn.execute("INFO", "keyspace")
+                assert b"db0:keys=2,expires=0" in info and b"db1:keys=1" in info
+
+                assert await conn.execute("FLUSHDB", "ASYNC") == "OK"
+                assert await conn.execute("DBSIZE") == 0
+                await conn.execute("SELECT", 0)
+                assert await conn.execute("DBSIZE") == 2
+                assert await conn.execute("FLUSHALL") == "OK"
+                assert await conn.execute("DBSIZE") == 0
+                assert await conn.execute("INFO", "keyspace") == b""
+
+    asyncio.run(run())
+
+
+def test_swapdb_wakes_blocked_readers_and_aborts_watchers(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            async with client.connection() as reader, client.connection() as other:
+                await other.execute("XADD", "s", "1-1", "field", "db0")
+                await other.execute("XGROUP", "CREATE", "s", "g", "$")
+                await other.execute("SELECT", 1)
+                await other.execute("XADD", "s", "1-1", "field", "db1")
+                await other.execute("XGROUP", "CREATE", "s", "g", 0)
+                read = asyncio.ensure_future(
+                    reader.execute(
+                        "XREADGROUP", "GROUP", "g", "c", "BLOCK", 0, "STREAMS", "s", ">"
+                    )
+                )
+                await asyncio.sleep(0.1)
+                assert not read.done()
+                await other.execute("WATCH", "s")
+                assert await client.execute("SWAPDB", 0, 1) == "OK"
+                # The blocked reader waits on db 0, which now holds the db 1 data
+                reply = await asyncio.wait_for(read, 5)
+                assert reply == [[b"s", [[b"1-1", [b"field", b"db1"]]]]]
+                await other.execute("MULTI")
+                await other.execute("SET", "s", 1)
+                assert await other.execute("EXEC") is None
+
+    asyncio.run(run())
+
+
+def test_writes_reach_the_replica_in_their_database(start_server):
+    master_port = start_server()
+    replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        replica = Redis("127.0.0.1", replica_port)
+        try:
+            await eventually(lambda: online(master))
+            async with master.connection() as conn:
+                await conn.execute("SELECT", 3)
+                await conn.execute("SET", "key", "db3")
+                await conn.execute("SELECT", 5)
+                await conn.execute("SET", "key", "db5")
+                await conn.execute("SWAPDB", 3, 4)
+                assert await conn.execute("WAIT", 1, 5000) == 1
+            async with replica.connection() as conn:
+                for db, value in ((3, None), (4, b"db3"), (5, b"db5"), (0, None)):
+                    await conn.execute("SELECT", db)
+                    assert await conn.execute("GET", "key") == value
+        finally:
+            await master.close()
+            await replica.close()
+
+    asyncio.run(run())
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from app.client import Redis, ReplyError
+from app.utilities import hyperloglog
+from app.utilities.hyperloglog import HLL_HDR_SIZE, HLL_REGISTERS
+
+
+def registers(dense: bytes) -> list[int]:
+    """Unpack the 6 bit registers the way Redis lays them out, LSB first."""
+    bits = int.from_bytes(dense[HLL_HDR_SIZE:], "little")
+    return [bits >> 6 * index & 0x3F for index in range(HLL_REGISTERS)]
+
+
+def test_estimates_stay_within_the_standard_error():
+    value = hyperloglog.new()
+    for start in range(0, 200_000, 10_000):
+        elements = [b"element:%d" % n for n in range(start, start + 10_000)]
+        value, changed = hyperloglog.add(value, hyperloglog.patterns(elements), 3000)
+        assert changed
+        # 3 times the standard error of 0.81%
+        assert hyperloglog.count(value) == pytest.approx(start + 10_000, rel=0.025)
+
+
+def test_values_use_the_redis_byte_layout(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            assert await client.execute("PFADD", "empty") == 1
+            # Sparse, cached cardinality 0, one XZERO opcode for all registers
+            empty = b"HYLL\x01" + bytes(11) + b"\x7f\xff"
+            assert await client.execute("GET", "empty") == empty
+
+            elements = [b"item:%d" % n for n in range(1000)]
+            assert await client.execute("PFADD", "sparse", *elements) == 1
+            sparse = await client.execute("GET", "sparse")
+            assert sparse[:5] == b"HYLL\x01" and sparse[15] & 0x80
+            assert await client.execute("PFCOUNT", "sparse") == pytest.approx(
+                1000, rel=0.03
+            )
+            # PFCOUNT caches the cardinality in the header, little endian
+            cached = await client.execute("GET", "sparse")
+            count = await client.execute("PFCOUNT", "sparse")
+            assert int.from_bytes(cached[8:16], "little") == count
+
+            await client.execute("CONFIG", "SET", "hll-sparse-max-bytes", 0)
+            assert await client.execute("PFADD", "dense", *elements) == 1
+            dense = await client.execute("GET", "dense")
+            assert len(dense) == HLL_HDR_SIZE + HLL_REGISTERS * 6 // 8
+            assert dense[:5] == b"HYLL\x00"
+            expected = [0] * HLL_REGISTERS
+            for index, run in hyperloglog.patterns(elements):
+                expected[index] = max(expected[index], run)
+            assert registers(dense) == expected
+
+            # Both encodings estimate the same, and a copy with SET is usable
+            assert await client.execute("PFCOUNT", "dense") == count
+            await client.execute("SET", "copy", dense)
+            assert await client.execute("PFMERGE", "merged", "copy", "sparse") == "OK"
+            assert await client.execute("PFCOUNT", "merged") == count
+
+    asyncio.run(run())
+
+
+def test_other_types_are_rejected(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("SET", "text", "not an hll")
+            await client.execute("SADD", "members", "a")
+            await client.execute("XADD", "events", "1-1", "field", "value")
+            with pytest.raises(ReplyError, match="not a valid HyperLogLog"):
+                await client.execute("PFADD", "text", "a")
+            for key in ("members", "events"):
+                with pytest.raises(ReplyError, match="WRONGTYPE Operation"):
+                    await client.execute("PFADD", key, "a")
+                with pytest.raises(ReplyError, match="WRONGTYPE"):
+                    await client.execute("PFCOUNT", key)
+            assert await client.execute("TYPE", "events") == "stream"
+            assert await client.execute("XLEN", "events") == 1
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.client import Redis
+from app.utilities.keystats import LFU_INIT_VAL, HeavyHitters
+
+
+def test_heavy_hitters_keep_the_hottest_keys_in_bounded_memory():
+    hitters = HeavyHitters(capacity=8)
+    for n in range(10_000):
+        hitters.record(0, b"cold:%d" % n)
+        if n % 4 == 0:
+            hitters.record(0, b"hot")
+        if n % 10 == 0:
+            hitters.record(1, b"warm", weight=2)
+    assert len(hitters.counts) <= 16
+    (db, key, hot), (_, _, warm) = hitters.top(2)
+    assert (db, key) == (0, b"hot")
+    # Counts are over by at most the floor, the largest count dropped
+    assert 2500 <= hot <= 2500 + hitters.floor
+    assert 2000 <= warm <= 2000 + hitters.floor
+    assert hitters.total == 10_000 + 2500 + 2000
+
+
+async def hotkeys(client: Redis) -> dict[bytes, int]:
+    return {key: accesses for key, _, accesses, _ in await client.execute("HOTKEYS")}
+
+
+def test_sampled_access_counts(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            ratio = ["CONFIG", "SET", "key-stats-sample-ratio"]
+            await client.execute(*ratio, 1)
+            await client.execute("SET", "hot", "value")
+            await client.execute("SET", "cold", "value")
+            for _ in range(99):
+                await client.execute("GET", "hot")
+            assert await hotkeys(client) == {b"hot": 100, b"cold": 1}
+            assert await client.execute("OBJECT", "FREQ", "hot") > LFU_INIT_VAL
+            assert await client.execute("OBJECT", "FREQ", "cold") <= LFU_INIT_VAL + 1
+
+            # Off: commands leave the counters alone
+            await client.execute(*ratio, 0)
+            assert await client.execute("HOTKEYS", "RESET") == "OK"
+            await client.execute("GET", "hot")
+            await client.execute("MULTI")
+            await client.execute("GET", "cold")
+            await client.execute("EXEC")
+            assert await hotkeys(client) == {}
+
+            # Sampled: the counts are estimates of every access
+            await client.execute(*ratio, 10)
+            await asyncio.gather(*(client.execute("GET", "hot") for _ in range(3000)))
+            assert (await hotkeys(client))[b"hot"] == pytest.approx(3000, rel=0.3)
+
+    asyncio.run(run())
+
+
+def test_bigkeys_reports_the_largest_keys_per_type(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("SET", "small", "x")
+            await client.execute("SET", "large", "x" * 10_000)
+            await client.execute("SADD", "members", *range(100))
+            await client.execute("XADD", "events", "1-1", "field", "value")
+            reply = await client.execute("BIGKEYS", "COUNT", 1)
+            types = dict(zip(reply[::2], reply[1::2]))
+            assert sorted(types) == [b"set", b"stream", b"string"]
+            strings = dict(zip(types[b"string"][::2], types[b"string"][1::2]))
+            assert strings[b"keys"] == 2 and strings[b"elements"] == 10_001
+            [[key, memory, elements]] = strings[b"biggest"]
+            assert key == b"large" and elements == 10_000 and memory > 10_000
+            sets = dict(zip(types[b"set"][::2], types[b"set"][1::2]))
+            assert sets[b"biggest"][0][0] == b"members" and sets[b"elements"] == 100
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import asyncio
+
+from app.client import Redis
+from app.utilities.consumer_group import ConsumerGroup
+from app.utilities.lazyfree import FREE_BATCH, LAZYFREE_THRESHOLD, LazyFree
+from app.utilities.sets import RedisSet
+from app.utilities.stream import Stream
+
+
+def members(count: int) -> list[bytes]:
+    return [b"m%d" % i for i in range(count)]
+
+
+def test_big_values_are_freed_in_steps():
+    async def run():
+        lazyfree = LazyFree()
+        small, intset, big = RedisSet(), RedisSet(), RedisSet()
+        small.add(members(LAZYFREE_THRESHOLD))
+        intset.add([b"%d" % i for i in range(500)])
+        big.add(members(FREE_BATCH * 3))
+        # Cheap values are left to the caller, an intset is a single buffer
+        lazyfree.free(small)
+        lazyfree.free(intset)
+        assert not lazyfree.pending and len(small) == LAZYFREE_THRESHOLD
+
+        lazyfree.free(big)
+        assert len(lazyfree.pending) == 1 and len(big) == FREE_BATCH * 3
+        await asyncio.sleep(0)
+        # One batch per step, the loop gets to run other work in between
+        assert len(big) == FREE_BATCH * 2
+        while lazyfree.pending:
+            await asyncio.sleep(0)
+        assert len(big) == 0 and lazyfree.freed_objects == 1
+
+    asyncio.run(run())
+
+
+def test_streams_and_flushed_keyspaces_are_dismantled():
+    async def run():
+        lazyfree = LazyFree()
+        stream = Stream()
+        for i in range(1, FREE_BATCH + 1):
+            stream.add((i, 0), [b"field", b"value"])
+        group = stream.groups[b"g"] = ConsumerGroup(b"g", (0, 0))
+        consumer = group.consumer(b"alice")
+        for i in range(1, 101):
+            group.deliver((i, 0), consumer, 0)
+        big = RedisSet()
+        big.add(members(FREE_BATCH))
+        keys = {b"k%d" % i: (b"value", None) for i in range(FREE_BATCH + 1)}
+        keys[b"set"] = (big, None)
+        streams = {b"s": stream}
+
+        lazyfree.free_keyspace(keys, streams)
+        lazyfree.free_keyspace({}, {})
+        assert len(lazyfree.pending) == 1
+        while lazyfree.pending:
+            await asyncio.sleep(0)
+        assert not keys and not streams
+        assert not stream.blocks and not group.pel and not group.consumers
+        assert len(big) == 0
+        # The keyspace, then the set and the stream it handed over
+        assert lazyfree.freed_objects == 3
+
+    asyncio.run(run())
+
+
+def test_unlink_and_async_flushes(start_server):
+    port = start_server()
+
+    async def lazyfreed(client: Redis) -> int:
+        info = (await client.execute("INFO", "memory")).decode()
+        return int(info.split("lazyfreed_objects:")[1].split()[0])
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("SADD", "big", *members(FREE_BATCH * 2))
+            await client.execute("SADD", "small", "a", "b")
+            await client.execute("SET", "plain", "value")
+            assert await client.execute("UNLINK", "big", "small", "missing") == 2
+            assert await client.execute("SCARD", "big") == 0
+            assert await client.execute("DEL", "plain", "plain") == 1
+            assert await lazyfreed(client) == 1
+
+            await client.execute("SADD", "big", *members(FREE_BATCH * 2))
+            assert await client.execute("FLUSHALL", "ASYNC") == "OK"
+            assert await client.execute("DBSIZE") == 0
+            assert await lazyfreed(client) == 3
+
+    asyncio.run(run())
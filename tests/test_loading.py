@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from conftest import eventually
+
+from app.client import Redis, ReplyError
+from app.utilities.loading import LOADING_BATCH, DatasetLoader
+from app.utilities.rdb_parser import SET_BATCH, DatabaseParser
+from app.utilities.rdb_writer import iter_rdb
+from app.utilities.sets import RedisSet
+from app.utilities.store import Store
+
+
+def write_rdb(path, databases) -> None:
+    with open(path, "wb") as file:
+        for chunk in iter_rdb(databases):
+            file.write(chunk)
+
+
+def test_loader_yields_to_the_loop_and_reports_progress(tmp_path):
+    big = RedisSet()
+    big.add([b"m%d" % i for i in range(SET_BATCH * 4)])
+    strings = [(b"k%d" % i, b"v%d" % i, None) for i in range(LOADING_BATCH * 3)]
+    path = tmp_path / "dump.rdb"
+    # db 20 is past the databases of the server and is skipped
+    write_rdb(path, [(0, strings), (1, [(b"set", big, None)]), (20, strings[:1])])
+
+    async def run():
+        databases = [Store() for _ in range(16)]
+        loader = DatasetLoader(databases, DatabaseParser())
+        seen = []
+        load = asyncio.create_task(loader.load(str(path)))
+        while not load.done():
+            if loader.active:
+                seen.append(loader.info())
+            await asyncio.sleep(0)
+        # Some steps in the strings and some in the middle of the set
+        assert len(seen) >= 3 + 3
+        assert all("loading:1\r\n" in info for info in seen)
+        assert "loading_total_bytes:%d\r\n" % path.stat().st_size in seen[0]
+        assert "loading_loaded_keys:%d\r\n" % (LOADING_BATCH * 3) in seen[-1]
+        assert loader.info() == "loading:0\r\n"
+        assert loader.loaded_keys == LOADING_BATCH * 3 + 2
+        assert databases[0].dbsize() == LOADING_BATCH * 3
+        assert databases[0].get(b"k7") == b"v7"
+        assert len(databases[1].get_set(b"set")) == SET_BATCH * 4
+
+        # A missing file leaves the databases empty
+        empty = DatasetLoader([Store()], DatabaseParser())
+        await empty.load(str(tmp_path / "missing.rdb"))
+        assert empty.loaded_keys == 0 and not empty.active
+
+    asyncio.run(run())
+
+
+def test_data_commands_get_loading_until_the_dataset_is_in(start_server, tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    keys = [(b"k%d" % i, b"value", None) for i in range(500_000)]
+    write_rdb(directory / "big.rdb", [(0, keys)])
+    port = start_server("--dir", directory, "--dbfilename", "big.rdb")
+
+    async def loaded(client: Redis) -> bool:
+        return b"loading:0" in await client.execute("INFO", "persistence")
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            with pytest.raises(ReplyError, match="^LOADING"):
+                await client.execute("GET", "k1")
+            assert await client.execute("PING") == "PONG"
+            info = await client.execute("INFO", "persistence")
+            assert b"loading:1" in info and b"loading_eta_seconds" in info
+
+            await eventually(lambda: loaded(client))
+            assert await client.execute("GET", "k1") == b"value"
+            assert await client.execute("DBSIZE") == len(keys)
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+import pytest
+from conftest import eventually
+
+from app.client import Redis, ReplyError
+from app.utilities.logger import NOTICE, VERBOSE, set_level, setup_logging, stop_logging
+
+
+@pytest.fixture
+def root_logger():
+    """Puts back the handlers and level of the root logger, which pytest uses."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    stop_logging()
+    root.handlers, root.level = handlers, level
+
+
+def test_records_pass_the_level_and_reach_the_file(root_logger, tmp_path):
+    path = tmp_path / "server.log"
+    setup_logging("notice", str(path))
+    assert [type(h).__name__ for h in root_logger.handlers] == ["QueueHandler"]
+    logging.debug("debug %s", "hidden")
+    logging.log(VERBOSE, "verbose %s", "hidden")
+    logging.log(NOTICE, "notice %s", "shown")
+    set_level("DEBUG")
+    logging.debug("debug %s", "shown")
+    with pytest.raises(ValueError, match="Invalid loglevel 'loud'"):
+        set_level("loud")
+    # Stopping writes out what is still queued
+    stop_logging()
+    lines = path.read_text().splitlines()
+    assert [line.split(" - ", 1)[1] for line in lines] == [
+        "NOTICE - notice shown",
+        "DEBUG - debug shown",
+    ]
+
+
+def test_loglevel_changes_at_runtime(start_server, tmp_path):
+    path = tmp_path / "server.log"
+    port = start_server("--logfile", path)
+
+    async def logged(text: str) -> bool:
+        return path.exists() and text in path.read_text()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await eventually(lambda: logged("NOTICE - Ready to accept connections"))
+            await client.execute("SET", "before", "value")
+            assert await client.execute("CONFIG", "GET", "loglevel") == [
+                b"loglevel",
+                b"notice",
+            ]
+            assert await client.execute("CONFIG", "SET", "loglevel", "DEBUG") == "OK"
+            await client.execute("SET", "after", "value")
+            await eventually(lambda: logged("'after'"))
+            assert await client.execute("CONFIG", "GET", "loglevel") == [
+                b"loglevel",
+                b"debug",
+            ]
+            with pytest.raises(ReplyError, match="Invalid loglevel"):
+                await client.execute("CONFIG", "SET", "loglevel", "loud")
+        # Requests are only traced from the CONFIG SET on
+        text = path.read_text()
+        assert "'before'" not in text and "Accepted" not in text
+
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+import asyncio
+
+from conftest import eventually, free_port, online
+
+from app.client import Redis, encode_command
+from app.utilities.metrics import Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.01, 0.1))
+    for value in (0.001, 0.01, 0.05, 3):
+        histogram.observe(value)
+    assert histogram.render("lag") == [
+        'lag_bucket{le="0.01"} 2',
+        'lag_bucket{le="0.1"} 3',
+        'lag_bucket{le="+Inf"} 4',
+        "lag_sum 3.061",
+        "lag_count 4",
+    ]
+
+
+async def get(port: int, path: str) -> tuple[bytes, dict[str, float]]:
+    """The status line and the samples of a scrape, by name with labels."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    status = head.split(b"\r\n")[0]
+    if not status.endswith(b"200 OK"):
+        return status, {}
+    samples = {}
+    for line in body.decode().splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return status, samples
+
+
+def test_metrics_endpoint(start_server):
+    metrics_port = free_port()
+    port = start_server("--metrics-port", metrics_port)
+    replica_port = start_server("--replicaof", "127.0.0.1", port)
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await eventually(lambda: online(client))
+            await client.execute("SET", "plain", 1)
+            await client.execute("SET", "expiring", 1, "EX", 100)
+            await client.execute("SET", "gone", 1, "PX", 1)
+            await asyncio.sleep(0.3)
+            assert await client.execute("GET", "gone") is None
+            await client.execute("SELECT", 3)
+            await client.execute("SADD", "members", "a")
+            assert await client.execute("WAIT", 1, 5000) == 1
+
+            status, samples = await get(metrics_port, "/metrics")
+            assert status == b"HTTP/1.1 200 OK"
+            assert samples["redis_commands_processed_total"] >= 7
+            assert samples["redis_connected_clients"] >= 1
+            assert samples['redis_db_keys{db="db0"}'] == 2
+            assert samples['redis_db_keys{db="db3"}'] == 1
+            assert samples['redis_db_keys_expiring{db="db0"}'] == 1
+            assert samples["redis_expired_keys_total"] == 1
+            assert samples["redis_connected_slaves"] == 1
+            [lag] = [name for name in samples if "slave_lag_bytes" in name]
+            assert f'slave_port="{replica_port}"' in lag
+            # At most the REPLCONF GETACK sent by WAIT is not acknowledged yet
+            assert samples[lag] <= len(encode_command(["REPLCONF", "GETACK", "*"]))
+            # The loop is probed every 100ms from the start
+            assert samples["redis_event_loop_lag_seconds_count"] >= 2
+            assert samples["redis_process_resident_memory_bytes"] > 0
+            # Nothing evicts keys, so no such counter is exported
+            assert not any("evicted" in name for name in samples)
+
+            status, _ = await get(metrics_port, "/other")
+            assert status == b"HTTP/1.1 404 Not Found"
+
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+import asyncio
+
+from app.client import Redis
+
+MEMBERS = 20_000  # twice the default offload_threshold
+
+
+def test_heavy_commands_in_exec_do_not_let_other_clients_in(start_server):
+    port = start_server()
+
+    async def writer(client: Redis, stop: asyncio.Event) -> int:
+        n = 0
+        while not stop.is_set():
+            await client.execute("SADD", "big1", f"new:{n}")
+            n += 1
+        return n
+
+    async def run():
+        client, other = Redis("127.0.0.1", port), Redis("127.0.0.1", port)
+        try:
+            members = [f"member:{i}" for i in range(MEMBERS)]
+            await client.execute("SADD", "big1", *members)
+            await client.execute("SADD", "big2", *members)
+            # Outside a transaction the pool computes it, other clients run meanwhile
+            assert len(await client.execute("SINTER", "big1", "big2")) == MEMBERS
+
+            stop = asyncio.Event()
+            writes = asyncio.create_task(writer(other, stop))
+            async with client.connection() as conn:
+                for _ in range(5):
+                    await conn.execute("MULTI")
+                    await conn.execute("SCARD", "big1")
+                    await conn.execute("SINTER", "big1", "big2")
+                    await conn.execute("SCARD", "big1")
+                    before, inter, after = await conn.execute("EXEC")
+                    assert before == after
+                    assert len(inter) == MEMBERS
+            stop.set()
+            assert await writes > 0
+        finally:
+            await client.close()
+            await other.close()
+
+    asyncio.run(run())
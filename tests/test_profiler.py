@@ -0,0 +1,80 @@
+import asyncio
+import pstats
+
+import pytest
+
+from app.client import Redis, ReplyError
+
+
+async def traffic(client: Redis, count: int = 200) -> None:
+    for i in range(count):
+        await client.execute("SET", f"key{i}", "x" * 100)
+        await client.execute("GET", f"key{i}")
+
+
+def test_cpu_profiles_report_and_dump(start_server, tmp_path):
+    port = start_server()
+    directory = tmp_path / str(port)
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            with pytest.raises(ReplyError, match="no profile to dump"):
+                await client.execute("DEBUG", "PROFILE", "DUMP")
+            with pytest.raises(ReplyError, match="not running"):
+                await client.execute("DEBUG", "PROFILE", "STOP")
+
+            assert await client.execute("DEBUG", "PROFILE", "START") == "OK"
+            with pytest.raises(ReplyError, match="already running"):
+                await client.execute("DEBUG", "PROFILE", "START")
+            await traffic(client)
+            with pytest.raises(ReplyError, match="stop the profiler"):
+                await client.execute("DEBUG", "PROFILE", "DUMP")
+            assert await client.execute("DEBUG", "PROFILE", "STOP") == "OK"
+            report = await client.execute("DEBUG", "PROFILE", "DUMP")
+            assert b"Ordered by: cumulative time" in report
+            assert await client.execute("DEBUG", "PROFILE", "DUMP", "cpu.prof") == "OK"
+            stats = pstats.Stats(str(directory / "cpu.prof"))
+            assert any(name == "_set_data" for _, _, name in stats.stats)
+            # Any client can send DEBUG, so files stay inside dir
+            with pytest.raises(ReplyError, match="inside the server's dir"):
+                await client.execute("DEBUG", "PROFILE", "DUMP", "../escape.prof")
+            assert not (tmp_path / "escape.prof").exists()
+
+            start = ["DEBUG", "PROFILE", "START", "SAMPLE", 1]
+            assert await client.execute(*start) == "OK"
+            await traffic(client, 1000)
+            assert await client.execute("DEBUG", "PROFILE", "STOP") == "OK"
+            stacks = (await client.execute("DEBUG", "PROFILE", "DUMP")).decode()
+            # Collapsed stacks of the loop thread: frames joined by ";", then a count
+            assert stacks
+            for line in stacks.splitlines():
+                stack, count = line.rsplit(" ", 1)
+                assert int(count) > 0 and "main.py:<module>;" in stack
+            with pytest.raises(ReplyError, match="CPROFILE or SAMPLE"):
+                await client.execute("DEBUG", "PROFILE", "START", "OTHER")
+
+    asyncio.run(run())
+
+
+def test_memory_profiles_report_growth(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            with pytest.raises(ReplyError, match="not running"):
+                await client.execute("DEBUG", "MEMPROFILE", "SNAPSHOT")
+            assert await client.execute("DEBUG", "MEMPROFILE", "START") == "OK"
+            with pytest.raises(ReplyError, match="no baseline"):
+                await client.execute("DEBUG", "MEMPROFILE", "DIFF")
+            snapshot = await client.execute("DEBUG", "MEMPROFILE", "SNAPSHOT")
+            assert snapshot.startswith(b"traced: ")
+            await traffic(client, 2000)
+            diff = (await client.execute("DEBUG", "MEMPROFILE", "DIFF")).decode()
+            assert "store.py" in diff and "tracemalloc" not in diff
+            assert await client.execute("DEBUG", "MEMPROFILE", "STOP") == "OK"
+            with pytest.raises(ReplyError, match="not running"):
+                await client.execute("DEBUG", "MEMPROFILE", "DIFF")
+            with pytest.raises(ReplyError, match="unknown subcommand"):
+                await client.execute("DEBUG", "OTHER")
+
+    asyncio.run(run())
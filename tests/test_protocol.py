@@ -0,0 +1,93 @@
+import asyncio
+import re
+
+import pytest
+
+from app.client import Redis, encode_command
+from app.utilities.parser_protocol import (
+    INLINE_MAX_SIZE,
+    PartialCommand,
+    ProtocolError,
+    parse_command,
+)
+
+
+def test_partial_commands_resume_where_they_stopped():
+    members = [b"member:%d" % n for n in range(1000)]
+    data = encode_command(["SADD", "key", *members]) + encode_command(["PING"])
+    buffer, partial, commands = bytearray(), PartialCommand(), []
+    for start in range(0, len(data), 100):
+        buffer += data[start : start + 100]
+        pos = 0
+        while parsed := parse_command(buffer, pos, partial):
+            command, pos = parsed
+            commands.append(command)
+        del buffer[:pos]
+        if partial.args is not None:
+            # Only the last, incomplete argument is left to parse
+            assert 0 <= len(buffer) - partial.consumed < 100 + 20
+    assert commands == [[b"SADD", b"key", *members], [b"PING"]]
+    assert not buffer and partial.args is None
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [
+        (b"*1\r\nGET\r\n", "expected '$', got 'G'"),
+        (b"*x\r\n", "invalid multibulk length"),
+        (b"*1\r\n$-5\r\n", "invalid bulk length"),
+        (b"*1\r\n$999999999999\r\n", "invalid bulk length"),
+        (b"PING" * INLINE_MAX_SIZE, "too big inline request"),
+    ],
+)
+def test_malformed_requests_raise(data, message):
+    with pytest.raises(ProtocolError, match=re.escape(f"Protocol error: {message}")):
+        parse_command(data, 0, PartialCommand())
+
+
+async def request(port: int, data: bytes) -> bytes:
+    """Everything the server sends back until it closes the connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    try:
+        return await asyncio.wait_for(reader.read(), 5)
+    finally:
+        writer.close()
+
+
+def test_protocol_errors_are_replied_to_before_closing(start_server):
+    port = start_server()
+
+    async def run():
+        data = encode_command(["SET", "key", "value"]) + b"*1\r\n:1\r\n"
+        reply = await request(port, data)
+        assert reply == b"+OK\r\n-ERR Protocol error: expected '$', got ':'\r\n"
+        async with Redis("127.0.0.1", port) as client:
+            assert await client.execute("GET", "key") == b"value"
+
+    asyncio.run(run())
+
+
+def test_query_buffer_limit_closes_the_client(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("CONFIG", "SET", "client-query-buffer-limit", "1mb")
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"*3\r\n$3\r\nSET\r\n$3\r\nbig\r\n$4000000\r\n")
+            try:
+                for _ in range(30):
+                    writer.write(bytes(100_000))
+                    await writer.drain()
+                    await asyncio.sleep(0.01)
+                assert await asyncio.wait_for(reader.read(), 5) == b""
+            except ConnectionResetError:
+                pass  # closed with data still unread, which resets the socket
+            writer.close()
+            # Under the limit, large values arriving in many reads still work
+            value = b"x" * 900_000
+            assert await client.execute("SET", "big", value) == "OK"
+            assert await client.execute("STRLEN", "big") == len(value)
+
+    asyncio.run(run())
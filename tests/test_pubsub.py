@@ -0,0 +1,97 @@
+import asyncio
+
+from conftest import Subscriber
+
+from app.client import PushMessage, Redis, encode_command
+from app.utilities.pubsub import FANOUT_BATCH
+
+
+def test_publish_fans_out_to_channels_and_patterns(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            resp2 = [
+                await Subscriber().connect(port, ["SUBSCRIBE", "news"])
+                for _ in range(3)
+            ]
+            resp3 = await Subscriber().connect(
+                port, ["HELLO", "3"], ["SUBSCRIBE", "news"]
+            )
+            pattern = await Subscriber().connect(port, ["PSUBSCRIBE", "n*"])
+            assert await client.execute("PUBLISH", "news", "hello") == 5
+            assert await client.execute("PUBLISH", "other", "hello") == 0
+
+            for sub in resp2:
+                message = await sub.next()
+                assert message == [b"message", b"news", b"hello"]
+                assert not isinstance(message, PushMessage)
+            message = await resp3.next()
+            assert isinstance(message, PushMessage)
+            assert message == [b"message", b"news", b"hello"]
+            assert await pattern.next() == [b"pmessage", b"n*", b"news", b"hello"]
+
+            assert await client.execute("PUBSUB", "NUMSUB", "news") == [b"news", 4]
+            resp2[0].writer.write(encode_command(["UNSUBSCRIBE", "news"]))
+            assert await resp2[0].next() == [b"unsubscribe", b"news", 0]
+            assert await client.execute("PUBLISH", "news", "again") == 4
+            for sub in [*resp2, resp3, pattern]:
+                sub.close()
+
+    asyncio.run(run())
+
+
+def test_subscribed_mode_only_allows_pubsub_commands(start_server):
+    port = start_server()
+
+    async def run():
+        sub = await Subscriber().connect(port, ["SUBSCRIBE", "news"])
+        sub.writer.write(encode_command(["PING", "hi"]))
+        assert await sub.next() == [b"pong", b"hi"]
+        sub.writer.write(encode_command(["GET", "key"]))
+        error = await sub.next()
+        assert "only (P)SUBSCRIBE / (P)UNSUBSCRIBE / PING / QUIT" in str(error)
+        sub.close()
+
+    asyncio.run(run())
+
+
+def test_large_fan_out_inside_exec_stays_atomic(start_server):
+    port = start_server()
+
+    async def writer(client: Redis, stop: asyncio.Event) -> None:
+        n = 0
+        while not stop.is_set():
+            await client.execute("SET", "counter", n)
+            n += 1
+
+    async def run():
+        client, other = Redis("127.0.0.1", port), Redis("127.0.0.1", port)
+        subs = await asyncio.gather(
+            *(
+                Subscriber().connect(port, ["SUBSCRIBE", "news"])
+                for _ in range(FANOUT_BATCH + 100)
+            )
+        )
+        try:
+            stop = asyncio.Event()
+            writes = asyncio.create_task(writer(other, stop))
+            await asyncio.sleep(0.05)
+            async with client.connection() as conn:
+                for _ in range(3):
+                    await conn.execute("MULTI")
+                    await conn.execute("GET", "counter")
+                    await conn.execute("PUBLISH", "news", "hello")
+                    await conn.execute("GET", "counter")
+                    before, receivers, after = await conn.execute("EXEC")
+                    assert receivers == len(subs)
+                    assert before == after
+            stop.set()
+            await writes
+        finally:
+            for sub in subs:
+                sub.close()
+            await client.close()
+            await other.close()
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import asyncio
+
+from conftest import eventually, online
+
+from app.client import Redis
+from app.utilities import listpack
+from app.utilities.consumer_group import ConsumerGroup
+from app.utilities.rdb_parser import parse_rdb
+from app.utilities.rdb_writer import iter_rdb
+from app.utilities.stream import Stream
+
+
+def test_listpack_elements_round_trip():
+    values = [0, 127, 128, -1, -4096, 4095, 4096, -(2**31), 2**63 - 1, -(2**63)]
+    values += [b"", b"a" * 63, b"a" * 64, b"b" * 4096, b"012", b"-0"]
+    assert listpack.decode(listpack.encode(values)) == values
+    # Canonical integers are stored as integers, like Redis does
+    assert listpack.decode(listpack.encode([b"12", b"-7"])) == [12, -7]
+    # The layout of Redis: total bytes, count, elements with back lengths, 0xFF
+    assert listpack.encode([b"a", 1]) == bytes.fromhex("0c00000002008161020101ff")
+
+
+def test_streams_and_groups_round_trip_through_rdb():
+    stream = Stream(node_max_entries=3)
+    for i in range(10):
+        fields = [b"n", b"%d" % i, b"text", b"x" * i * 10]
+        stream.add((1_700_000_000_000 + i // 4, i % 4), fields)
+    stream.add((1_700_000_000_003, 0), [b"other", b"012"])
+    stream.delete([(1_700_000_000_001, 1)])
+    group = stream.groups[b"g"] = ConsumerGroup(b"g", (1_700_000_000_002, 0))
+    alice, bob = group.consumer(b"alice"), group.consumer(b"bob")
+    group.deliver((1_700_000_000_000, 0), alice, 1_700_000_000_500)
+    group.deliver((1_700_000_000_000, 1), bob, 1_700_000_000_600)
+    group.deliver((1_700_000_000_000, 1), alice, 1_700_000_000_700)
+    stream.groups[b"idle"] = ConsumerGroup(b"idle", (0, 0))
+
+    dbs = [(0, [(b"s", stream, None)]), (2, [(b"e", Stream(), None)])]
+    rdb = b"".join(iter_rdb(dbs))
+    loaded = parse_rdb(rdb_data=rdb)[0][b"s"][0]
+    assert list(loaded) == list(stream)
+    assert len(loaded) == len(stream) == 10
+    assert loaded.last_id == stream.last_id
+    assert loaded.entries_added == stream.entries_added == 11
+    assert sorted(loaded.groups) == [b"g", b"idle"]
+    assert loaded.groups[b"g"].last_delivered == (1_700_000_000_002, 0)
+    assert loaded.groups[b"g"].summary() == group.summary()
+    pending = [
+        (entry.id, entry.consumer.name, entry.delivery_time, entry.delivery_count)
+        for entry in loaded.groups[b"g"].iter_pending((0, 0))
+    ]
+    assert pending == [
+        ((1_700_000_000_000, 0), b"alice", 1_700_000_000_500, 1),
+        ((1_700_000_000_000, 1), b"alice", 1_700_000_000_700, 2),
+    ]
+    assert not loaded.groups[b"g"].consumers[b"bob"].pending
+    assert len(parse_rdb(rdb_data=rdb)[2][b"e"][0]) == 0
+
+
+def test_full_sync_sends_streams_and_consumer_groups(start_server):
+    master_port = start_server()
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        try:
+            for i in range(250):
+                await master.execute("XADD", "events", "*", "n", i)
+            await master.execute("XGROUP", "CREATE", "events", "workers", 0)
+            read = ["XREADGROUP", "GROUP", "workers", "w1", "COUNT", 5]
+            await master.execute(*read, "STREAMS", "events", ">")
+            await master.execute("SET", "plain", "value")
+
+            # The replica only gets the data through the snapshot
+            replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+            replica = Redis("127.0.0.1", replica_port)
+            try:
+                await eventually(lambda: online(master))
+                await eventually(lambda: replica.execute("XLEN", "events"))
+                for command in (
+                    ["XLEN", "events"],
+                    ["XRANGE", "events", "-", "+"],
+                    ["XPENDING", "events", "workers"],
+                    ["GET", "plain"],
+                ):
+                    assert await replica.execute(*command) == await master.execute(
+                        *command
+                    )
+            finally:
+                await replica.close()
+        finally:
+            await master.close()
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+from conftest import eventually, online, replica_field, replication_info
+
+from app.client import Redis, ReplyError
+
+
+async def acked(master: Redis) -> dict[str, str] | None:
+    """INFO replication once the replica acknowledged the whole stream."""
+    info = await replication_info(master)
+    if replica_field(info, "offset") == info["master_repl_offset"]:
+        return info
+    return None
+
+
+def test_wait_counts_replicas_that_acked_the_offset(start_server):
+    master_port = start_server()
+    replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        replica = Redis("127.0.0.1", replica_port)
+        try:
+            await eventually(lambda: online(master))
+            await asyncio.gather(
+                *(master.execute("SET", f"key:{i}", i) for i in range(100))
+            )
+            assert await master.execute("WAIT", 1, 5000) == 1
+            # Everything written before WAIT returned was applied
+            for i in range(100):
+                assert await replica.execute("GET", f"key:{i}") == str(i).encode()
+
+            # The replica acknowledges the GETACK WAIT sent too, then both agree
+            info = await eventually(lambda: acked(master))
+            replica_info = await replication_info(replica)
+            assert replica_info["master_repl_offset"] == info["master_repl_offset"]
+
+            # Asking for more replicas than there are waits for the timeout
+            await master.execute("SET", "late", 1)
+            start = time.monotonic()
+            assert await master.execute("WAIT", 2, 300) == 1
+            assert time.monotonic() - start >= 0.25
+
+            with pytest.raises(ReplyError, match="replica instances"):
+                await replica.execute("WAIT", 1, 0)
+        finally:
+            await master.close()
+            await replica.close()
+
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.client import Redis, ReplyError
+from app.utilities.sets import RedisSet
+
+
+@pytest.mark.parametrize(
+    "member",
+    [b"012", b"+1", b"-0", b" 1", b"1.0", b"abc", b"9223372036854775808"],
+)
+def test_members_that_are_not_canonical_int64_promote(member):
+    members = RedisSet()
+    assert members.add([b"1", b"-9223372036854775808", b"9223372036854775807"]) == 3
+    assert members.encoding == "intset"
+    assert members.add([member]) == 1
+    assert members.encoding == "hashtable"
+    assert member in members and b"1" in members
+    assert set(members) == {
+        member,
+        b"1",
+        b"-9223372036854775808",
+        b"9223372036854775807",
+    }
+
+
+def test_intset_promotes_past_max_entries_and_stays_promoted():
+    members = RedisSet(max_intset_entries=4)
+    assert members.add([b"4", b"3", b"2", b"1", b"2"]) == 4
+    assert members.encoding == "intset"
+    assert members.add([b"5"]) == 1
+    assert members.encoding == "hashtable"
+    assert members.remove([b"5", b"4", b"3"]) == 3
+    assert members.encoding == "hashtable"
+    assert set(members) == {b"1", b"2"}
+
+
+def test_promotion_over_the_wire(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("CONFIG", "SET", "set-max-intset-entries", 64)
+            numbers = [str(n).encode() for n in range(-32, 32)]
+            assert await client.execute("SADD", "numbers", *reversed(numbers)) == 64
+            # An intset replies in numeric order and costs 8 bytes a member
+            assert await client.execute("SMEMBERS", "numbers") == numbers
+            compact = await client.execute("MEMORY", "USAGE", "numbers")
+            assert compact < 64 * 16
+
+            assert await client.execute("SADD", "numbers", "32") == 1
+            assert await client.execute("MEMORY", "USAGE", "numbers") > 2 * compact
+            numbers.append(b"32")
+            members = await client.execute("SMEMBERS", "numbers")
+            assert sorted(members) == sorted(numbers)
+            assert await client.execute("SCARD", "numbers") == 65
+
+            # The members keep their exact bytes once promoted
+            assert await client.execute("SADD", "mixed", 1, 2, "012") == 3
+            assert await client.execute("SISMEMBER", "mixed", "012") == 1
+            assert await client.execute("SISMEMBER", "mixed", "12") == 0
+            inter = await client.execute("SINTER", "mixed", "numbers")
+            assert sorted(inter) == [b"1", b"2"]
+            assert await client.execute("SREM", "mixed", "012", "1") == 2
+            assert await client.execute("SMEMBERS", "mixed") == [b"2"]
+
+    asyncio.run(run())
+
+
+def test_set_commands_on_other_types_reply_wrongtype(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("XADD", "events", "1-1", "field", "value")
+            await client.execute("SET", "text", "value")
+            await client.execute("SADD", "members", "a")
+            for key in ("events", "text"):
+                with pytest.raises(ReplyError, match="WRONGTYPE"):
+                    await client.execute("SADD", key, "a")
+                with pytest.raises(ReplyError, match="WRONGTYPE"):
+                    await client.execute("SINTER", "members", key)
+            # The stream is left as it was
+            assert await client.execute("XLEN", "events") == 1
+            assert await client.execute("TYPE", "events") == "stream"
+
+    asyncio.run(run())
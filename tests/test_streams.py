@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.client import Redis, ReplyError
+
+
+async def ids(client: Redis, key: str = "s") -> list[bytes]:
+    return [id for id, _ in await client.execute("XRANGE", key, "-", "+")]
+
+
+def test_rejected_ids_leave_no_stream_behind(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            for id in ("0-0", "abc", "1-x", "-1", "1-2-3", "-*"):
+                with pytest.raises(ReplyError):
+                    await client.execute("XADD", "s", id, "field", "value")
+            assert await client.execute("TYPE", "s") == "none"
+            reply = await client.execute("XADD", "s", "NOMKSTREAM", "1-1", "f", "v")
+            assert reply is None
+            assert await client.execute("TYPE", "s") == "none"
+
+            assert await client.execute("XADD", "s", "5-*", "f", "v") == b"5-0"
+            with pytest.raises(ReplyError, match="equal or smaller"):
+                await client.execute("XADD", "s", "5-0", "f", "v")
+            assert await client.execute("XLEN", "s") == 1
+
+    asyncio.run(run())
+
+
+def test_trimming_and_deleting(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("CONFIG", "SET", "stream-node-max-entries", 10)
+            for n in range(1, 101):
+                await client.execute("XADD", "s", f"{n}-1", "n", n)
+
+            # Approximate trimming only drops whole nodes of 10 entries
+            assert await client.execute("XTRIM", "s", "MAXLEN", "~", 55) == 40
+            assert (await ids(client))[0] == b"41-1"
+            assert await client.execute("XTRIM", "s", "MAXLEN", 50) == 10
+            assert await client.execute("XLEN", "s") == 50
+            # LIMIT caps the entries an approximate trim removes
+            reply = await client.execute("XTRIM", "s", "MINID", "~", 90, "LIMIT", 5)
+            assert reply == 0
+            assert await client.execute("XTRIM", "s", "MINID", 90) == 39
+            assert await ids(client) == [b"%d-1" % n for n in range(90, 101)]
+
+            reply = await client.execute("XADD", "s", "MAXLEN", 5, "101-1", "n", 101)
+            assert reply == b"101-1"
+            assert await client.execute("XLEN", "s") == 5
+            assert await client.execute("XDEL", "s", "98-1", "99-1", "1-1") == 2
+            assert await ids(client) == [b"97-1", b"100-1", b"101-1"]
+            # Deleting keeps the last ID, so new entries still go after it
+            assert await client.execute("XDEL", "s", "101-1") == 1
+            with pytest.raises(ReplyError, match="equal or smaller"):
+                await client.execute("XADD", "s", "101-1", "n", 101)
+
+            with pytest.raises(ReplyError, match="not an integer"):
+                await client.execute("XTRIM", "s", "MAXLEN", -1)
+            with pytest.raises(ReplyError, match="Invalid stream ID"):
+                await client.execute("XDEL", "s", "abc")
+            assert await client.execute("XTRIM", "s", "MAXLEN", 0) == 2
+            assert await client.execute("XLEN", "s") == 0
+
+    asyncio.run(run())
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from conftest import eventually, online
+
+from app.client import Redis, ReplyError
+
+
+def test_append_setrange_getrange_and_strlen(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            assert await client.execute("APPEND", "log", "Hello") == 5
+            assert await client.execute("APPEND", "log", " World") == 11
+            assert await client.execute("GET", "log") == b"Hello World"
+            assert await client.execute("STRLEN", "log") == 11
+            assert await client.execute("STRLEN", "missing") == 0
+
+            assert await client.execute("SETRANGE", "log", 6, "Redis") == 11
+            assert await client.execute("GET", "log") == b"Hello Redis"
+            # Writing past the end pads with zero bytes
+            assert await client.execute("SETRANGE", "padded", 3, "ab") == 5
+            assert await client.execute("GET", "padded") == b"\x00\x00\x00ab"
+            assert await client.execute("SETRANGE", "missing", 10, "") == 0
+            assert await client.execute("TYPE", "missing") == "none"
+            with pytest.raises(ReplyError, match="offset is out of range"):
+                await client.execute("SETRANGE", "log", -1, "x")
+            with pytest.raises(ReplyError, match="maximum allowed size"):
+                await client.execute("SETRANGE", "log", 512 * 1024 * 1024, "x")
+
+            for start, end, expected in (
+                (0, 4, b"Hello"),
+                (-5, -1, b"Redis"),
+                (0, -1, b"Hello Redis"),
+                (6, 100, b"Redis"),
+                (5, 2, b""),
+                (-100, 1, b"He"),
+            ):
+                assert await client.execute("GETRANGE", "log", start, end) == expected
+            assert await client.execute("GETRANGE", "missing", 0, -1) == b""
+
+            await client.execute("SADD", "set", "member")
+            for command in (["APPEND", "set", "x"], ["STRLEN", "set"]):
+                with pytest.raises(ReplyError, match="WRONGTYPE"):
+                    await client.execute(*command)
+
+    asyncio.run(run())
+
+
+def test_getdel_getex_and_set_get(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            await client.execute("SET", "key", "value")
+            assert await client.execute("GETDEL", "key") == b"value"
+            assert await client.execute("GET", "key") is None
+            assert await client.execute("GETDEL", "key") is None
+
+            await client.execute("SET", "short", "value")
+            assert await client.execute("GETEX", "short", "PX", 100) == b"value"
+            await client.execute("SET", "kept", "value", "PX", 100)
+            assert await client.execute("GETEX", "kept", "PERSIST") == b"value"
+            assert await client.execute("GETEX", "kept") == b"value"
+            await asyncio.sleep(0.3)
+            assert await client.execute("GET", "short") is None
+            assert await client.execute("GET", "kept") == b"value"
+            assert await client.execute("GETEX", "missing", "EX", 10) is None
+            with pytest.raises(ReplyError, match="invalid expire time"):
+                await client.execute("GETEX", "kept", "EX", 0)
+            with pytest.raises(ReplyError, match="syntax error"):
+                await client.execute("GETEX", "kept", "EX")
+
+            assert await client.execute("SET", "swap", "old", "GET") is None
+            assert await client.execute("SET", "swap", "new", "GET") == b"old"
+            # The old value comes back even when NX stops the write
+            assert await client.execute("SET", "swap", "other", "NX", "GET") == b"new"
+            assert await client.execute("GET", "swap") == b"new"
+            assert await client.execute("SET", "swap", "other", "NX") is None
+            assert await client.execute("SET", "absent", "value", "XX") is None
+            await client.execute("SADD", "set", "member")
+            with pytest.raises(ReplyError, match="WRONGTYPE"):
+                await client.execute("SET", "set", "value", "GET")
+            assert await client.execute("SCARD", "set") == 1
+
+    asyncio.run(run())
+
+
+def test_string_writes_reach_the_replica(start_server):
+    master_port = start_server()
+    replica_port = start_server("--replicaof", "127.0.0.1", master_port)
+
+    async def run():
+        master = Redis("127.0.0.1", master_port)
+        replica = Redis("127.0.0.1", replica_port)
+        try:
+            await eventually(lambda: online(master))
+            await master.execute("APPEND", "log", "Hello World")
+            await master.execute("SETRANGE", "log", 6, "Redis")
+            await master.execute("SET", "gone", "value")
+            await master.execute("GETDEL", "gone")
+            await master.execute("SET", "short", "value")
+            await master.execute("GETEX", "short", "PX", 100)
+            assert await master.execute("WAIT", 1, 5000) == 1
+            assert await replica.execute("GET", "log") == b"Hello Redis"
+            assert await replica.execute("GET", "gone") is None
+            await asyncio.sleep(0.3)
+            assert await replica.execute("GET", "short") is None
+        finally:
+            await master.close()
+            await replica.close()
+
+    asyncio.run(run())
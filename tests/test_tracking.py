@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from conftest import Subscriber
+
+from app.client import PushMessage, Redis, ReplyError
+
+
+def test_hello_switches_protocols(start_server):
+    port = start_server()
+
+    async def run():
+        conn = await Subscriber().connect(port)
+        hello = await conn.execute("HELLO", "3")
+        assert hello[b"proto"] == 3 and hello[b"mode"] == b"standalone"
+        # The same map is a flat list in RESP2
+        hello = await conn.execute("HELLO", "2")
+        assert isinstance(hello, list) and hello[4:6] == [b"proto", 2]
+        with pytest.raises(ReplyError, match="NOPROTO"):
+            raise await conn.execute("HELLO", "4")
+        conn.close()
+
+    asyncio.run(run())
+
+
+def test_reads_are_invalidated_once(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            conn = await Subscriber().connect(port, ["HELLO", "3"])
+            with pytest.raises(ReplyError, match="REDIRECT requires RESP3"):
+                raise await (await Subscriber().connect(port)).execute(
+                    "CLIENT", "TRACKING", "ON"
+                )
+            assert await conn.execute("CLIENT", "TRACKING", "ON") == "OK"
+            await client.execute("SET", "key", 1)
+            await client.execute("SADD", "members", 1)
+            await conn.execute("GET", "key")
+            await conn.execute("SCARD", "members")
+
+            await client.execute("SET", "key", 2)
+            await client.execute("SET", "key", 3)  # no longer tracked
+            await client.execute("SADD", "members", 2)
+            push = await conn.next()
+            assert isinstance(push, PushMessage)
+            assert push == [b"invalidate", [b"key"]]
+            assert await conn.next() == [b"invalidate", [b"members"]]
+            assert await conn.execute("PING") == "PONG"
+
+            # A flush tells clients to drop everything, with a null key list
+            await conn.execute("GET", "key")
+            await client.execute("FLUSHALL")
+            assert await conn.next() == [b"invalidate", None]
+
+            # Once tracking stops the keys read before are forgotten
+            await conn.execute("GET", "key")
+            await conn.execute("CLIENT", "TRACKING", "OFF")
+            await client.execute("SET", "key", 4)
+            assert await conn.execute("PING") == "PONG"
+            conn.close()
+
+    asyncio.run(run())
+
+
+def test_redirect_optin_and_broadcast(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            # RESP2 clients get invalidations on a subscribed connection
+            listener = await Subscriber().connect(port)
+            listener_id = await listener.execute("CLIENT", "ID")
+            await listener.execute("SUBSCRIBE", "__redis__:invalidate")
+            conn = await Subscriber().connect(port)
+            tracking = ["CLIENT", "TRACKING", "ON", "REDIRECT", listener_id, "OPTIN"]
+            assert await conn.execute(*tracking) == "OK"
+            await conn.execute("GET", "skipped")
+            await conn.execute("CLIENT", "CACHING", "YES")
+            await conn.execute("GET", "cached")
+            await client.execute("SET", "skipped", 1)
+            await client.execute("SET", "cached", 1)
+            message = await listener.next()
+            assert message == [b"message", b"__redis__:invalidate", [b"cached"]]
+
+            # Broadcast: every write under a prefix, read or not
+            bcast = await Subscriber().connect(port, ["HELLO", "3"])
+            tracking = ["CLIENT", "TRACKING", "ON", "BCAST", "PREFIX", "user:"]
+            assert await bcast.execute(*tracking) == "OK"
+            await client.execute("SET", "user:1", 1)
+            await client.execute("SET", "order:1", 1)
+            await client.execute("SET", "user:2", 1)
+            assert await bcast.next() == [b"invalidate", [b"user:1"]]
+            assert await bcast.next() == [b"invalidate", [b"user:2"]]
+            for sub in (listener, conn, bcast):
+                sub.close()
+
+    asyncio.run(run())
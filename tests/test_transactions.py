@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.client import Redis, ReplyError
+
+
+def test_queued_commands_run_on_exec(start_server):
+    port = start_server()
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            async with client.connection() as conn:
+                assert await conn.execute("MULTI") == "OK"
+                assert await conn.execute("SET", "a", 1) == "QUEUED"
+                assert await conn.execute("SADD", "a", "b") == "QUEUED"
+                # Nothing runs before EXEC
+                assert await client.execute("GET", "a") is None
+                ok, error = await conn.execute("EXEC")
+                assert ok == "OK" and str(error).startswith("WRONGTYPE")
+                assert await client.execute("GET", "a") == b"1"
+
+                # An unknown command aborts the whole transaction
+                await conn.execute("MULTI")
+                await conn.execute("SET", "a", 2)
+                with pytest.raises(ReplyError, match="unknown command"):
+                    await conn.execute("NOSUCH")
+                with pytest.raises(ReplyError, match="EXECABORT"):
+                    await conn.execute("EXEC")
+                assert await client.execute("GET", "a") == b"1"
+
+                await conn.execute("MULTI")
+                with pytest.raises(ReplyError, match="nested"):
+                    await conn.execute("MULTI")
+                with pytest.raises(ReplyError, match="WATCH inside MULTI"):
+                    await conn.execute("WATCH", "a")
+                await conn.execute("SET", "a", 3)
+                assert await conn.execute("DISCARD") == "OK"
+                assert await client.execute("GET", "a") == b"1"
+                with pytest.raises(ReplyError, match="EXEC without MULTI"):
+                    await conn.execute("EXEC")
+
+    asyncio.run(run())
+
+
+def test_watch_aborts_when_a_watched_key_changes(start_server):
+    port = start_server()
+
+    async def transfer(conn) -> list | None:
+        await conn.execute("MULTI")
+        await conn.execute("SET", "balance", 10)
+        return await conn.execute("EXEC")
+
+    async def run():
+        async with Redis("127.0.0.1", port) as client:
+            async with client.connection() as conn:
+                await conn.execute("WATCH", "balance")
+                await client.execute("SET", "balance", 20)
+                assert await transfer(conn) is None
+                assert await client.execute("GET", "balance") == b"20"
+
+                # EXEC unwatches, so the next transaction goes through
+                assert await transfer(conn) == ["OK"]
+                await conn.execute("WATCH", "balance")
+                await conn.execute("UNWATCH")
+                await client.execute("SET", "balance", 30)
+                assert await transfer(conn) == ["OK"]
+
+                # Untouched keys and the same key in another db do not abort
+                await conn.execute("WATCH", "balance", "other")
+                await client.execute("SET", "unrelated", 1)
+                await client.execute("SELECT", 1)
+                await client.execute("SET", "balance", 1)
+                await client.execute("SELECT", 0)
+                assert await transfer(conn) == ["OK"]
+
+                # Deleting a watched key or flushing its db counts as a change
+                await conn.execute("WATCH", "balance")
+                await client.execute("DEL", "balance")
+                assert await transfer(conn) is None
+                await conn.execute("WATCH", "balance")
+                await client.execute("FLUSHDB")
+                assert await transfer(conn) is None
+                assert await client.execute("GET", "balance") is None
+
+    asyncio.run(run())